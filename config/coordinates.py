@@ -6,7 +6,8 @@ import os
 
 class CoordinatesManager:
     def __init__(self):
-        self.coordinates_file = 'data/coordinates.json'
+        # У параллельных линий свой файл координат (core/lanes.py)
+        self.coordinates_file = os.environ.get('AUTOMATION_COORDINATES_FILE', 'data/coordinates.json')
         
         # Координаты по умолчанию
         self.default_coordinates = {
@@ -25,8 +26,26 @@ class CoordinatesManager:
             'TO_SAVE_OPTION': [0, 0],           # Относительное движение к "сохранить картинку как" в контекстном меню
         }
         
+        # Задержки между действиями по умолчанию (в секундах)
+        self.default_delays = {
+            'BETWEEN_CLICKS': 0.5,            # Между кликами
+            'AFTER_PASTE': 1.0,               # После вставки промпта
+            'GENERATION_WAIT': 20.0,          # Ожидание генерации изображения
+            'IMAGE_OPEN_WAIT': 1.0,           # Ожидание открытия полного изображения
+            'CONTEXT_MENU_WAIT': 0.5,         # Ожидание появления контекстного меню
+            'SAVE_DIALOG_WAIT': 1.0,          # Ожидание открытия диалога сохранения
+            'AFTER_SAVE': 2.0,                # После сохранения файла
+            'NEW_CHAT_WAIT': 2.0,             # Ожидание создания нового чата
+            'CHAT_RENAME_WAIT': 1.0,          # Ожидание переименования чата
+            'POPUP_OPEN_WAIT': 0.5,           # Ожидание открытия попапа
+            'BETWEEN_GENERATIONS': 1.0,       # Между генерациями одной карточки
+            'BETWEEN_CARDS': 2.0,             # Между обработкой карточек
+            'TAB_SWITCH_WAIT': 0.5,           # Переключение вкладки браузера (конвейерный режим)
+        }
+        
         self.coordinates = {}
         self.relative_movements = {}
+        self.delays = dict(self.default_delays)
         self.load_coordinates()
     
     def load_coordinates(self):
@@ -42,6 +61,7 @@ class CoordinatesManager:
                 # Загружаем координаты из файла
                 file_coordinates = data.get('coordinates', {})
                 file_movements = data.get('relative_movements', {})
+                file_delays = data.get('delays', {})
                 
                 # Объединяем с координатами по умолчанию (файл имеет приоритет)
                 self.coordinates = self.default_coordinates.copy()
@@ -50,6 +70,11 @@ class CoordinatesManager:
                 self.relative_movements = self.default_relative_movements.copy()
                 self.relative_movements.update(file_movements)
                 
+                # Откалиброванные задержки (GENERATION_WAIT хранится в settings.json)
+                for key, value in file_delays.items():
+                    if key in self.default_delays and key != 'GENERATION_WAIT':
+                        self.delays[key] = float(value)
+                
                 # Преобразуем списки в кортежи для совместимости
                 for key, value in self.coordinates.items():
                     if isinstance(value, list):
@@ -79,7 +104,10 @@ class CoordinatesManager:
             
             data = {
                 'coordinates': {k: list(v) for k, v in self.coordinates.items()},
-                'relative_movements': {k: list(v) for k, v in self.relative_movements.items()}
+                'relative_movements': {k: list(v) for k, v in self.relative_movements.items()},
+                # Только задержки, отличающиеся от значений по умолчанию (результат калибровки)
+                'delays': {k: v for k, v in self.delays.items()
+                           if k != 'GENERATION_WAIT' and v != self.default_delays[k]}
             }
             
             with open(self.coordinates_file, 'w', encoding='utf-8') as f:
@@ -106,6 +134,39 @@ class CoordinatesManager:
             print(f"❌ Неизвестная координата: {coord_name}")
             return False
     
+    def update_delays(self, new_delays):
+        """Обновление задержек (например, после калибровки) с сохранением в файл"""
+        for key, value in new_delays.items():
+            if key in self.delays:
+                self.delays[key] = value
+        self.save_coordinates()
+    
+    def reload_delays(self):
+        """
+        Перечитывание откалиброванных задержек из файла (в том же словаре DELAYS).
+        
+        Калибровка идёт в отдельном процессе и сохраняет задержки только в файл -
+        рабочий процесс перечитывает их при старте, иначе до перезапуска программы
+        действуют задержки, загруженные при импорте.
+        """
+        try:
+            if not os.path.exists(self.coordinates_file):
+                return
+            with open(self.coordinates_file, 'r', encoding='utf-8') as f:
+                file_delays = json.load(f).get('delays', {})
+            for key, value in self.default_delays.items():
+                if key != 'GENERATION_WAIT':
+                    self.delays[key] = float(file_delays.get(key, value))
+        except Exception as e:
+            print(f"[ОШИБКА] При перечитывании задержек: {e}")
+    
+    def reset_delays(self):
+        """Возврат задержек к значениям по умолчанию"""
+        generation_wait = self.delays['GENERATION_WAIT']
+        self.delays.update(self.default_delays)
+        self.delays['GENERATION_WAIT'] = generation_wait
+        self.save_coordinates()
+    
     def get_coordinate(self, coord_name):
         """Получение координаты"""
         if coord_name in self.coordinates:
@@ -133,6 +194,12 @@ class CoordinatesManager:
             status = "✓ задано" if movement != (0, 0) else "⚠️ не задано"
             coords_info.append(f"  {name}: {movement} - {status}")
         
+        calibrated_delays = [f"{name}={value}" for name, value in self.delays.items()
+                             if name != 'GENERATION_WAIT' and value != self.default_delays[name]]
+        if calibrated_delays:
+            coords_info.append("\n=== ОТКАЛИБРОВАННЫЕ ЗАДЕРЖКИ ===")
+            coords_info.append(f"  {', '.join(calibrated_delays)}")
+        
         return "\n".join(coords_info)
 
 # Создаем глобальный экземпляр менеджера координат
@@ -142,21 +209,8 @@ _coordinates_manager = CoordinatesManager()
 COORDINATES = _coordinates_manager.coordinates
 RELATIVE_MOVEMENTS = _coordinates_manager.relative_movements
 
-# Задержки между действиями (в секундах)
-DELAYS = {
-    'BETWEEN_CLICKS': 0.5,            # Между кликами
-    'AFTER_PASTE': 1.0,               # После вставки промпта
-    'GENERATION_WAIT': 20.0,          # Ожидание генерации изображения
-    'IMAGE_OPEN_WAIT': 1.0,           # Ожидание открытия полного изображения
-    'CONTEXT_MENU_WAIT': 0.5,         # Ожидание появления контекстного меню
-    'SAVE_DIALOG_WAIT': 1.0,          # Ожидание открытия диалога сохранения
-    'AFTER_SAVE': 2.0,                # После сохранения файла
-    'NEW_CHAT_WAIT': 2.0,             # Ожидание создания нового чата
-    'CHAT_RENAME_WAIT': 1.0,          # Ожидание переименования чата
-    'POPUP_OPEN_WAIT': 0.5,           # Ожидание открытия попапа
-    'BETWEEN_GENERATIONS': 1.0,       # Между генерациями одной карточки
-    'BETWEEN_CARDS': 2.0,             # Между обработкой карточек
-}
+# Задержки между действиями (в секундах): значения по умолчанию + результат калибровки
+DELAYS = _coordinates_manager.delays
 
 # Функции для управления координатами
 def get_coordinates_manager():
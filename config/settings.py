@@ -25,6 +25,56 @@ class SettingsManager:
             'GENERATION_MODE': 'standard',                # Режим генерации: 'standard', 'multi_format' или 'multi_format_with_refs'
             'GENERATION_WAIT': 20.0,                      # Время ожидания генерации изображения
             'IMAGE_WAIT_TIME': 25.0,                      # Время ожидания изображения при упрощённой проверке
+            'COMPLETION_DETECTION': True,                 # Ждать появления изображения на экране вместо фиксированной паузы
+            'GENERATION_TIMEOUT': 90.0,                   # Жёсткий таймаут ожидания изображения (сек)
+            'COMPLETION_POLL_INTERVAL': 0.5,              # Интервал опроса области изображения (сек)
+            'COMPLETION_STABLE_POLLS': 3,                 # Сколько опросов подряд изображение не должно меняться
+            'IMAGE_REGION_SIZE': 120,                     # Половина стороны области вокруг IMAGE_LOCATION (пиксели)
+            'PRESENCE_MAX_BACKGROUND_FRACTION': 0.6,      # Максимальная доля фоновых пикселей в области с изображением
+            'PRESENCE_MIN_VARIANCE': 20.0,                # Минимальная дисперсия яркости области с изображением
+            'PRESENCE_MIN_HISTOGRAM_DISTANCE': 0.3,       # Минимальное отличие гистограммы от фона (0-1)
+            'LATENCY_PERCENTILE': 95,                     # Перцентиль истории времени генерации для бюджета ожидания
+            'LATENCY_MARGIN': 1.2,                        # Запас к перцентилю (множитель)
+            'LATENCY_MIN_SAMPLES': 5,                     # Сколько замеров нужно, чтобы заменить GENERATION_WAIT/GENERATION_TIMEOUT
+            'LATENCY_MIN_WAIT': 5.0,                      # Нижняя граница бюджета ожидания (сек)
+            'LATENCY_MAX_WAIT': 180.0,                    # Верхняя граница бюджета ожидания (сек)
+            'LATENCY_HISTORY_SIZE': 200,                  # Сколько последних замеров хранить на комбинацию
+            'LATENCY_TIMEOUT_STEP': 0.25,                 # Рост бюджета ожидания за таймаут подряд (доля, не больше 2 раз)
+            'CALIBRATION_ROUNDS': 5,                      # Сколько прогонов шагов интерфейса при калибровке задержек
+            'CALIBRATION_PERCENTILE': 95,                 # Перцентиль замеров для новой задержки
+            'CALIBRATION_MARGIN': 1.5,                    # Запас к перцентилю замеров (множитель)
+            'CALIBRATION_MIN_DELAY': 0.1,                 # Нижняя граница откалиброванной задержки (сек)
+            'CALIBRATION_TIMEOUT_SCALE': 3.0,             # Во сколько раз дольше текущих DELAYS ждать подтверждения при калибровке
+            'CALIBRATION_FAILURE_STREAK': 3,              # Сколько неудачных генераций подряд запускают перекалибровку (0 - выключено)
+            'CALIBRATION_AUTO_RECALIBRATE': False,        # Перекалибровка посреди запуска после серии неудач (создаёт чаты "Калибровка N")
+            'CALIBRATION_FLOOR_RATIO': 0.5,               # Нижняя граница задержки - доля значения DELAYS по умолчанию
+            'PIPELINE_TABS': 1,                           # Сколько вкладок браузера использовать для конвейерной генерации (1 - последовательно)
+            'WORKER_DISPLAYS': [],                        # X-дисплеи параллельных линий, например [':1', ':2'] (2 и больше - параллельный режим)
+            'JOB_QUEUE_ENABLED': True,                    # Очередь задач в SQLite: продолжение с места остановки после перезапуска
+            'JOB_QUEUE_FILE': 'data/jobs.sqlite',         # Файл очереди задач (удалите, чтобы сгенерировать всё заново)
+            'SKIP_EXISTING_OUTPUTS': True,                # Не генерировать стороны, чьи файлы уже есть в SAVE_FOLDER
+            'OUTPUT_MIN_SIZE': 1024,                      # Минимальный размер готового файла (байт), меньше - считается недописанным
+            'RETRY_MAX_ATTEMPTS': 3,                      # Сколько всего попыток на сторону (1 - без повторов)
+            'RETRY_BASE_DELAY': 30.0,                     # Пауза перед первым повтором (сек), дальше удваивается
+            'RETRY_MAX_DELAY': 300.0,                     # Максимальная пауза перед повтором (сек)
+            'CHAT_REUSE_MODE': False,                     # Отправлять стороны одной карточки в один чат (без нового чата и переименования на каждую сторону)
+            'CHAT_REUSE_MAX_SIDES': 0,                    # Сколько сторон максимум в одном чате в CHAT_REUSE_MODE (0 - вся карточка)
+            'FORMAT_KEPT_IN_NEW_CHAT': False,             # AI Studio сохраняет выбранный формат при создании нового чата (не выбирать формат повторно)
+            'JOB_ORDER': 'pairs',                         # Порядок сторон: 'pairs' - лицо/оборот по парам, 'format' - сначала все лица, затем все обороты пачки
+            'JOB_ORDER_BATCH_CARDS': 10,                  # Карточек в пачке для JOB_ORDER='format' (0 - весь запуск)
+            'CLIPBOARD_IMAGE_BACKEND': 'auto',            # Копирование референсов в буфер: 'auto', 'powershell_helper', 'powershell', 'xclip', 'wl-copy'
+            'REFERENCE_CACHE_MB': 256,                    # Кэш референсов в памяти (МБ), 0 - без кэша
+            'REFERENCE_PREFETCH': True,                   # Кодировать референсы следующей карточки в фоне
+            'REFERENCE_PREFLIGHT': True,                  # Проверять референсы перед запуском (декодирование, пропорции, размер)
+            'REFERENCE_MAX_FILE_MB': 10,                  # Референс больше этого размера (МБ) попадает в замечания, 0 - без проверки
+            'REFERENCE_ASPECT_TOLERANCE': 0.05,           # Допустимое отклонение пропорций референса от формата стороны (доля)
+            'REFERENCE_PREFLIGHT_WORKERS': 8,             # Потоков проверки референсов
+            'REFERENCE_MAX_SIDE': 0,                      # Уменьшать референсы до этой длинной стороны (px) перед вставкой, 0 - как есть
+            'REFERENCE_NORMALIZED_FOLDER': 'data/ref_cache',# Кэш уменьшенных референсов (имя файла - хеш содержимого)
+            'PROMPT_CACHE_ENABLED': True,                 # Кэш разобранного файла промптов (SQLite), пока файл не изменился
+            'PROMPT_CACHE_FILE': 'data/prompts_cache.sqlite',# Файл кэша разбора промптов
+            'CARD_SELECTION': '',                         # Выбор карточек: '11-20, 25, 40-' (пусто - START_FROM_CARD и CARDS_TO_PROCESS)
+            'CARD_SOURCE_BATCH_CARDS': 100,               # Карточек на один запрос к кэшу промптов при обходе запуска
         }
     
     def load_settings(self):
@@ -76,6 +126,56 @@ class SettingsManager:
                 'GENERATION_MODE': self.settings['GENERATION_MODE'],
                 'GENERATION_WAIT': self.settings['GENERATION_WAIT'],
                 'IMAGE_WAIT_TIME': self.settings['IMAGE_WAIT_TIME'],
+                'COMPLETION_DETECTION': self.settings['COMPLETION_DETECTION'],
+                'GENERATION_TIMEOUT': self.settings['GENERATION_TIMEOUT'],
+                'COMPLETION_POLL_INTERVAL': self.settings['COMPLETION_POLL_INTERVAL'],
+                'COMPLETION_STABLE_POLLS': self.settings['COMPLETION_STABLE_POLLS'],
+                'IMAGE_REGION_SIZE': self.settings['IMAGE_REGION_SIZE'],
+                'PRESENCE_MAX_BACKGROUND_FRACTION': self.settings['PRESENCE_MAX_BACKGROUND_FRACTION'],
+                'PRESENCE_MIN_VARIANCE': self.settings['PRESENCE_MIN_VARIANCE'],
+                'PRESENCE_MIN_HISTOGRAM_DISTANCE': self.settings['PRESENCE_MIN_HISTOGRAM_DISTANCE'],
+                'LATENCY_PERCENTILE': self.settings['LATENCY_PERCENTILE'],
+                'LATENCY_MARGIN': self.settings['LATENCY_MARGIN'],
+                'LATENCY_MIN_SAMPLES': self.settings['LATENCY_MIN_SAMPLES'],
+                'LATENCY_MIN_WAIT': self.settings['LATENCY_MIN_WAIT'],
+                'LATENCY_MAX_WAIT': self.settings['LATENCY_MAX_WAIT'],
+                'LATENCY_HISTORY_SIZE': self.settings['LATENCY_HISTORY_SIZE'],
+                'LATENCY_TIMEOUT_STEP': self.settings['LATENCY_TIMEOUT_STEP'],
+                'CALIBRATION_ROUNDS': self.settings['CALIBRATION_ROUNDS'],
+                'CALIBRATION_PERCENTILE': self.settings['CALIBRATION_PERCENTILE'],
+                'CALIBRATION_MARGIN': self.settings['CALIBRATION_MARGIN'],
+                'CALIBRATION_MIN_DELAY': self.settings['CALIBRATION_MIN_DELAY'],
+                'CALIBRATION_TIMEOUT_SCALE': self.settings['CALIBRATION_TIMEOUT_SCALE'],
+                'CALIBRATION_FAILURE_STREAK': self.settings['CALIBRATION_FAILURE_STREAK'],
+                'CALIBRATION_AUTO_RECALIBRATE': self.settings['CALIBRATION_AUTO_RECALIBRATE'],
+                'CALIBRATION_FLOOR_RATIO': self.settings['CALIBRATION_FLOOR_RATIO'],
+                'PIPELINE_TABS': self.settings['PIPELINE_TABS'],
+                'WORKER_DISPLAYS': self.settings['WORKER_DISPLAYS'],
+                'JOB_QUEUE_ENABLED': self.settings['JOB_QUEUE_ENABLED'],
+                'JOB_QUEUE_FILE': self.settings['JOB_QUEUE_FILE'],
+                'SKIP_EXISTING_OUTPUTS': self.settings['SKIP_EXISTING_OUTPUTS'],
+                'OUTPUT_MIN_SIZE': self.settings['OUTPUT_MIN_SIZE'],
+                'RETRY_MAX_ATTEMPTS': self.settings['RETRY_MAX_ATTEMPTS'],
+                'RETRY_BASE_DELAY': self.settings['RETRY_BASE_DELAY'],
+                'RETRY_MAX_DELAY': self.settings['RETRY_MAX_DELAY'],
+                'CHAT_REUSE_MODE': self.settings['CHAT_REUSE_MODE'],
+                'CHAT_REUSE_MAX_SIDES': self.settings['CHAT_REUSE_MAX_SIDES'],
+                'FORMAT_KEPT_IN_NEW_CHAT': self.settings['FORMAT_KEPT_IN_NEW_CHAT'],
+                'JOB_ORDER': self.settings['JOB_ORDER'],
+                'JOB_ORDER_BATCH_CARDS': self.settings['JOB_ORDER_BATCH_CARDS'],
+                'CLIPBOARD_IMAGE_BACKEND': self.settings['CLIPBOARD_IMAGE_BACKEND'],
+                'REFERENCE_CACHE_MB': self.settings['REFERENCE_CACHE_MB'],
+                'REFERENCE_PREFETCH': self.settings['REFERENCE_PREFETCH'],
+                'REFERENCE_PREFLIGHT': self.settings['REFERENCE_PREFLIGHT'],
+                'REFERENCE_MAX_FILE_MB': self.settings['REFERENCE_MAX_FILE_MB'],
+                'REFERENCE_ASPECT_TOLERANCE': self.settings['REFERENCE_ASPECT_TOLERANCE'],
+                'REFERENCE_PREFLIGHT_WORKERS': self.settings['REFERENCE_PREFLIGHT_WORKERS'],
+                'REFERENCE_MAX_SIDE': self.settings['REFERENCE_MAX_SIDE'],
+                'REFERENCE_NORMALIZED_FOLDER': self.settings['REFERENCE_NORMALIZED_FOLDER'],
+                'PROMPT_CACHE_ENABLED': self.settings['PROMPT_CACHE_ENABLED'],
+                'PROMPT_CACHE_FILE': self.settings['PROMPT_CACHE_FILE'],
+                'CARD_SELECTION': self.settings['CARD_SELECTION'],
+                'CARD_SOURCE_BATCH_CARDS': self.settings['CARD_SOURCE_BATCH_CARDS'],
             }
             
             with open(self.settings_file, 'w', encoding='utf-8') as f:
@@ -0,0 +1,175 @@
+"""
+Калибровка задержек DELAYS по реальному времени отклика интерфейса
+"""
+import math
+import os
+from config.coordinates import DELAYS, get_coordinates_manager
+from utils.logger import Logger
+from utils.ui_wait import UIWaiter
+from .latency_model import percentile
+
+# Шаги интерфейса, которые можно откалибровать (паузы темпа и ожидание генерации не трогаем)
+CALIBRATED_STEPS = [
+    'BETWEEN_CLICKS',
+    'NEW_CHAT_WAIT',
+    'POPUP_OPEN_WAIT',
+    'CHAT_RENAME_WAIT',
+    'CONTEXT_MENU_WAIT',
+    'SAVE_DIALOG_WAIT',
+    'AFTER_SAVE',
+]
+
+# Имя файла для пробного сохранения (удаляется после замера)
+CALIBRATION_FILENAME = '_calibration.png'
+
+
+class DelayCalibrator:
+    """
+    Прогоняет шаги ChatManager, select_image_format и save_image_as несколько раз,
+    замеряет время до визуального подтверждения и записывает новые DELAYS
+    (перцентиль CALIBRATION_PERCENTILE x CALIBRATION_MARGIN) в data/coordinates.json.
+
+    generator - MultiFormatGenerator или ImageGenerator (у стандартного нет выбора формата).
+    """
+
+    def __init__(self, settings_manager, generator):
+        self.settings_manager = settings_manager
+        self.generator = generator
+        self.logger = Logger()
+        self.coordinates_manager = get_coordinates_manager()
+
+    def run_round(self, round_number, stop_event):
+        """Один прогон всех шагов интерфейса"""
+        chat_manager = self.generator.chat_manager
+
+        # Сохранение - только если на экране уже есть изображение (например, от прошлой генерации)
+        if self.is_image_on_screen():
+            if self.generator.save_image_as(CALIBRATION_FILENAME):
+                self.remove_calibration_file()
+
+        if stop_event is not None and stop_event.is_set():
+            return False
+
+        if not chat_manager.create_new_chat_only():
+            return False
+        if not chat_manager.rename_current_chat(f"Калибровка {round_number}"):
+            return False
+
+        if hasattr(self.generator, 'select_image_format'):
+            # Калибровочный чат новый - выбор формата выполняется и замеряется в каждом прогоне
+            if hasattr(self.generator, 'ui_state'):
+                self.generator.ui_state.reset()
+            format_ratio = '4:3' if round_number % 2 else '3:2'
+            if not self.generator.select_image_format(format_ratio):
+                return False
+
+        return True
+
+    def is_image_on_screen(self):
+        """Есть ли изображение в области IMAGE_LOCATION"""
+        try:
+            completion_detector = self.generator.completion_detector
+            return completion_detector.presence_detector.is_image_present(completion_detector.capture_region())
+        except Exception as e:
+            self.logger.log_action(f"⚠️ Не удалось проверить наличие изображения: {e}")
+            return False
+
+    def remove_calibration_file(self):
+        """Удаление пробного файла из папки сохранения"""
+        save_folder = self.settings_manager.get('SAVE_FOLDER')
+        if not save_folder:
+            return
+        calibration_path = os.path.join(save_folder, CALIBRATION_FILENAME)
+        try:
+            if os.path.exists(calibration_path):
+                os.remove(calibration_path)
+        except OSError as e:
+            self.logger.log_action(f"⚠️ Не удалось удалить пробный файл {calibration_path}: {e}")
+
+    def compute_delays(self, ui_waiter):
+        """
+        Новые задержки по замерам.
+
+        Таймауты - цензурированные замеры: их время (таймаут) - нижняя граница настоящего,
+        в сортировке они идут последними. Если перцентиль приходится на таймаут, настоящее
+        значение неизвестно - задержка не уменьшается. Нижняя граница задержки -
+        CALIBRATION_FLOOR_RATIO от значения по умолчанию (и не меньше CALIBRATION_MIN_DELAY).
+
+        Returns:
+            dict: step_name -> новая задержка (только изменившиеся)
+        """
+        percent = self.settings_manager.get('CALIBRATION_PERCENTILE') or 95
+        margin = self.settings_manager.get('CALIBRATION_MARGIN') or 1.5
+        min_delay = self.settings_manager.get('CALIBRATION_MIN_DELAY') or 0.1
+        floor_ratio = self.settings_manager.get('CALIBRATION_FLOOR_RATIO') or 0.0
+
+        new_delays = {}
+        for step_name in CALIBRATED_STEPS:
+            # Замеры шага, включая таймауты (UIWaiter записывает время до таймаута)
+            samples = ui_waiter.elapsed_by_step.get(step_name, [])
+            if not samples:
+                continue
+            floor = max(min_delay, self.coordinates_manager.default_delays[step_name] * floor_ratio)
+
+            timeouts = ui_waiter.timeouts_by_step.get(step_name, 0)
+            percentile_index = math.ceil((len(samples) - 1) * percent / 100.0)
+            if timeouts and percentile_index >= len(samples) - timeouts:
+                self.logger.log_action(f"⚠️ {step_name}: перцентиль приходится на таймауты ({timeouts} из {len(samples)}), "
+                                       f"задержка не уменьшается")
+                new_delay = round(max(DELAYS[step_name], floor), 2)
+            else:
+                new_delay = round(max(percentile(samples, percent) * margin, floor), 2)
+
+            if new_delay != DELAYS[step_name]:
+                new_delays[step_name] = new_delay
+        return new_delays
+
+    def calibrate(self, stop_event=None):
+        """
+        Калибровка задержек.
+
+        Returns:
+            dict: применённые задержки (пустой, если калибровка не удалась)
+        """
+        rounds = self.settings_manager.get('CALIBRATION_ROUNDS') or 5
+        timeout_scale = self.settings_manager.get('CALIBRATION_TIMEOUT_SCALE') or 3.0
+
+        self.logger.log_action(f"======= 🎯 КАЛИБРОВКА ЗАДЕРЖЕК ({rounds} прогонов) =======")
+
+        # Отдельный UIWaiter: замеры калибровки не смешиваются с отчётом основной работы
+        original_generator_waiter = self.generator.ui_waiter
+        original_chat_waiter = self.generator.chat_manager.ui_waiter
+        calibration_waiter = UIWaiter(screen_capture=original_generator_waiter.screen_capture)
+        calibration_waiter.timeout_scale = timeout_scale
+        self.generator.ui_waiter = calibration_waiter
+        self.generator.chat_manager.ui_waiter = calibration_waiter
+
+        try:
+            completed_rounds = 0
+            for round_number in range(1, rounds + 1):
+                if stop_event is not None and stop_event.is_set():
+                    break
+                if self.run_round(round_number, stop_event):
+                    completed_rounds += 1
+                else:
+                    self.logger.log_action(f"⚠️ Прогон калибровки {round_number} не завершён")
+        finally:
+            self.generator.ui_waiter = original_generator_waiter
+            self.generator.chat_manager.ui_waiter = original_chat_waiter
+
+        if not completed_rounds:
+            self.logger.log_action("❌ Калибровка не удалась: ни один прогон не завершён")
+            return {}
+
+        new_delays = self.compute_delays(calibration_waiter)
+        for step_name, new_delay in sorted(new_delays.items()):
+            self.logger.log_action(f"🎯 {step_name}: {DELAYS[step_name]} -> {new_delay} сек")
+
+        if new_delays:
+            self.coordinates_manager.update_delays(new_delays)
+        self.logger.log_action(f"✅ Калибровка завершена: {completed_rounds}/{rounds} прогонов, обновлено шагов: {len(new_delays)}")
+        return new_delays
+
+    def calibration_worker(self, stop_event):
+        """Рабочий процесс калибровки (запускается из ProcessManager)"""
+        self.calibrate(stop_event)
@@ -0,0 +1,54 @@
+"""
+Ленивый источник карточек запуска: карточки читаются из кэша разбора пачками, а не собираются в один список
+"""
+
+
+class CardSource:
+    """
+    Выбранные карточки из кэша промптов (PromptCache) без списка в памяти.
+
+    Каждый проход (for) заново читает карточки пачками по batch_size (PromptCache.iter_selection) -
+    источник можно обходить несколько раз: проверка референсов, задачи запуска, итоги.
+    Элементы - (номер, название, список пар), как в FileHandler.get_cards_to_process
+    для мультиформатного режима.
+
+    Число карточек и пар (count_totals) - отдельный запрос COUNT без чтения текстов промптов.
+    """
+
+    def __init__(self, prompt_cache, prompts_file, ranges, batch_size=100):
+        self.prompt_cache = prompt_cache
+        self.prompts_file = prompts_file
+        self.ranges = ranges  # [(первая, последняя или None), ...] - как в parse_card_selection
+        self.batch_size = max(1, batch_size)
+        self.totals = None
+
+    def __iter__(self):
+        return self.prompt_cache.iter_selection(self.prompts_file, self.ranges, self.batch_size)
+
+    def count_totals(self):
+        """
+        Returns:
+            tuple: (карточек, пар) - считается один раз
+        """
+        if self.totals is None:
+            self.totals = self.prompt_cache.count_selection(self.prompts_file, self.ranges)
+        return self.totals
+
+
+def count_cards(cards):
+    """Число карточек и пар для CardSource (запрос COUNT) или списка карточек get_cards_to_process"""
+    if isinstance(cards, CardSource):
+        return cards.count_totals()
+    return len(cards), sum(len(pairs_list) for _, _, pairs_list in cards)
+
+
+def iter_batches(items, batch_size):
+    """Элементы итерируемого набора списками по batch_size (последний может быть короче)"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -1,16 +1,20 @@
 """
 Управление чатами в AI Studio
 """
-import time
-import pyautogui
-from config.coordinates import COORDINATES, DELAYS
+from config.coordinates import COORDINATES
 from utils.clipboard import ClipboardManager
+from utils.input_driver import get_input_driver
 from utils.logger import Logger
+from utils.ui_wait import UIWaiter
 
 class ChatManager:
-    def __init__(self):
-        self.clipboard = ClipboardManager()
+    def __init__(self, ui_waiter=None, input_driver=None):
+        # Весь ввод - через драйвер с явными задержками (без скрытой паузы pyautogui)
+        self.input_driver = input_driver or get_input_driver()
+        self.clipboard = ClipboardManager(self.input_driver)
         self.logger = Logger()
+        # Ожидание шагов UI по визуальному подтверждению (DELAYS - верхняя граница)
+        self.ui_waiter = ui_waiter or UIWaiter()
     
     def click_coordinate(self, coord_name, description=""):
         """Безопасный клик по координатам с логированием"""
@@ -24,15 +28,17 @@ class ChatManager:
             return False
         
         self.logger.log_action(f"Клик {description}: {coord_name} ({x}, {y})")
-        pyautogui.click(x, y)
+        self.input_driver.click(x, y)
         return True
     
     def create_new_chat_only(self):
         """Создание нового чата без переименования"""
         try:
+            # Новый чат меняет заголовок чата
+            title_probe = self.ui_waiter.probe_coordinate('CHAT_NAME_INPUT')
             if not self.click_coordinate('NEW_CHAT_BUTTON', "создание нового чата"):
                 return False
-            time.sleep(DELAYS['NEW_CHAT_WAIT'])
+            self.ui_waiter.wait_step(title_probe, 'NEW_CHAT_WAIT', "создание нового чата")
             
             self.logger.log_action("✓ Создан новый чат")
             return True
@@ -44,32 +50,36 @@ class ChatManager:
     def rename_current_chat(self, chat_name):
         """Переименование текущего чата"""
         try:
+            # Область поля ввода названия: попап, если он задан, иначе поле в заголовке
+            popup_x, popup_y = COORDINATES['CHAT_NAME_POPUP']
+            name_field = 'CHAT_NAME_POPUP' if (popup_x != 0 or popup_y != 0) else 'CHAT_NAME_INPUT'
+            
+            # Без попапа поле редактируется на месте клика - виден только фокус, ждём паузу без проверки
+            popup_probe = self.ui_waiter.probe_coordinate('CHAT_NAME_POPUP') if name_field == 'CHAT_NAME_POPUP' else None
             if not self.click_coordinate('CHAT_NAME_INPUT', "поле названия чата"):
                 return False
-            time.sleep(DELAYS['POPUP_OPEN_WAIT'])
+            self.ui_waiter.wait_step(popup_probe, 'POPUP_OPEN_WAIT', "открытие попапа названия")
             
-            popup_x, popup_y = COORDINATES['CHAT_NAME_POPUP']
             if popup_x != 0 or popup_y != 0:
                 if not self.click_coordinate('CHAT_NAME_POPUP', "поле ввода в попапе"):
                     return False
-                time.sleep(DELAYS['BETWEEN_CLICKS'])
+                self.ui_waiter.wait_step(None, 'BETWEEN_CLICKS', "фокус в поле попапа")
             
             self.logger.log_action(f"Ввод названия чата: {chat_name}")
-            pyautogui.hotkey('ctrl', 'a')
-            time.sleep(0.2)
-            
-            if not self.clipboard.safe_paste_text(chat_name):
+            name_probe = self.ui_waiter.probe_coordinate(name_field)
+            if not self.clipboard.safe_paste_text(chat_name, select_all=True):
                 return False
-            time.sleep(DELAYS['CHAT_RENAME_WAIT'])
+            self.ui_waiter.wait_step(name_probe, 'CHAT_RENAME_WAIT', "ввод названия чата")
             
+            close_probe = self.ui_waiter.probe_coordinate(name_field)
             confirm_x, confirm_y = COORDINATES['CHAT_NAME_CONFIRM']
             if confirm_x != 0 or confirm_y != 0:
                 if not self.click_coordinate('CHAT_NAME_CONFIRM', "подтверждение названия"):
                     return False
             else:
-                pyautogui.press('enter')
+                self.input_driver.press('enter')
             
-            time.sleep(DELAYS['BETWEEN_CLICKS'])
+            self.ui_waiter.wait_step(close_probe, 'BETWEEN_CLICKS', "закрытие попапа названия")
             
             self.logger.log_action(f"✓ Чат переименован в: {chat_name}")
             return True
@@ -0,0 +1,160 @@
+"""
+Определение завершения генерации изображения по области экрана
+"""
+import time
+from config.coordinates import COORDINATES
+from utils.logger import Logger
+from utils.screen_capture import get_screen_capture
+from .image_presence import ImagePresenceDetector, frame_difference
+
+# Средняя разница кадров (0-255), ниже которой кадры считаются одинаковыми
+STABLE_DIFF_THRESHOLD = 2.0
+
+# Средняя разница с базовым кадром, выше которой считаем, что появилось новое изображение
+CHANGE_DIFF_THRESHOLD = 8.0
+
+
+class CompletionDetector:
+    """
+    Следит за областью вокруг IMAGE_LOCATION и сообщает, когда изображение
+    появилось и перестало меняться.
+
+    Результат wait_for_image():
+        'completed' - изображение появилось и стабильно
+        'timeout'   - истёк жёсткий таймаут
+        'stopped'   - получен сигнал остановки
+        'error'     - не удалось снять область экрана (нужен запасной вариант ожидания)
+    """
+
+    def __init__(self, settings_manager):
+        self.settings_manager = settings_manager
+        self.logger = Logger()
+        self.presence_detector = ImagePresenceDetector(settings_manager)
+        self.screen_capture = get_screen_capture()
+        self.last_elapsed = 0.0  # Сколько секунд заняло последнее ожидание
+        self.last_frame = None  # Кадр готового изображения последнего ожидания ('completed')
+
+    def get_image_region(self):
+        """Область (left, top, width, height) вокруг IMAGE_LOCATION"""
+        x, y = COORDINATES['IMAGE_LOCATION']
+        half_size = self.settings_manager.get('IMAGE_REGION_SIZE') or 120
+        left = max(0, x - half_size)
+        top = max(0, y - half_size)
+        return (left, top, half_size * 2, half_size * 2)
+
+    def capture_region(self):
+        """Снимок области изображения (массив HxWx3) - новый такт опроса общего захвата экрана"""
+        self.screen_capture.new_tick()
+        return self.screen_capture.get_region(self.get_image_region())
+
+    def capture_baseline(self):
+        """
+        Снимок области до запуска генерации (None если снять не удалось).
+
+        Если область пустая (новый чат) - по ней же изучается фон.
+        """
+        try:
+            baseline = self.capture_region()
+        except Exception as e:
+            self.logger.log_action(f"⚠️ Не удалось снять базовый кадр области изображения: {e}")
+            return None
+
+        if self.presence_detector.learn_background(baseline):
+            self.logger.log_action(f"🎨 Фон области изображения: RGB{tuple(int(c) for c in self.presence_detector.background_rgb)}")
+        return baseline
+
+    def frame_difference(self, frame_a, frame_b):
+        """Средняя разница двух кадров по всем каналам (0-255)"""
+        return frame_difference(frame_a, frame_b)
+
+    def is_background(self, frame):
+        """В области нет изображения (по оценке ImagePresenceDetector)"""
+        return not self.presence_detector.is_image_present(frame)
+
+    def is_new_image(self, frame, baseline=None, previous_result=None):
+        """
+        В кадре новое изображение: отличается от базового кадра и от предыдущего результата
+        (в продолженном чате он может снова оказаться в области) и не является фоном.
+        """
+        for reference in (baseline, previous_result):
+            if reference is not None and self.frame_difference(frame, reference) <= CHANGE_DIFF_THRESHOLD:
+                return False
+        return not self.is_background(frame)
+
+    def check_image_appeared(self, baseline=None, previous_result=None):
+        """
+        Одиночная проверка без ожидания: появилось ли изображение относительно базового кадра.
+
+        Returns:
+            bool или None: None если область снять не удалось
+        """
+        try:
+            frame = self.capture_region()
+        except Exception as e:
+            self.logger.log_action(f"⚠️ Не удалось снять область изображения: {e}")
+            return None
+
+        return self.is_new_image(frame, baseline, previous_result)
+
+    def wait_for_image(self, stop_event, timeout, baseline=None, previous_result=None):
+        """
+        Ожидание появления и стабилизации изображения.
+
+        Args:
+            stop_event: событие остановки
+            timeout: жёсткий таймаут в секундах
+            baseline: кадр области до запуска генерации (опционально)
+            previous_result: кадр предыдущего изображения того же чата (опционально)
+
+        Returns:
+            str: 'completed', 'timeout', 'stopped' или 'error'
+        """
+        poll_interval = self.settings_manager.get('COMPLETION_POLL_INTERVAL') or 0.5
+        stable_polls_required = self.settings_manager.get('COMPLETION_STABLE_POLLS') or 3
+
+        self.logger.log_action(f"🔍 Ожидание изображения (таймаут {timeout} сек, опрос каждые {poll_interval} сек)...")
+
+        start_time = time.time()
+        self.last_frame = None
+        previous_frame = None
+        image_appeared = False
+        stable_polls = 0
+        next_progress_log = 5
+
+        while True:
+            self.last_elapsed = time.time() - start_time
+
+            if stop_event.is_set():
+                return 'stopped'
+
+            if self.last_elapsed >= timeout:
+                self.logger.log_action(f"⚠️ Таймаут ожидания изображения: {timeout} сек")
+                return 'timeout'
+
+            try:
+                frame = self.capture_region()
+            except Exception as e:
+                self.logger.log_action(f"⚠️ Не удалось снять область изображения: {e}")
+                return 'error'
+
+            if not image_appeared:
+                if self.is_new_image(frame, baseline, previous_result):
+                    image_appeared = True
+                    self.logger.log_action(f"🖼️ Изображение появилось через {self.last_elapsed:.1f} сек, ждём стабилизации...")
+            else:
+                if self.frame_difference(frame, previous_frame) <= STABLE_DIFF_THRESHOLD:
+                    stable_polls += 1
+                else:
+                    stable_polls = 0
+
+                if stable_polls >= stable_polls_required:
+                    self.last_frame = frame
+                    self.logger.log_action(f"✅ Изображение готово через {self.last_elapsed:.1f} сек")
+                    return 'completed'
+
+            if self.last_elapsed >= next_progress_log:
+                self.logger.log_action(f"⏳ Прошло {int(self.last_elapsed)}/{timeout} сек...")
+                next_progress_log += 5
+
+            previous_frame = frame
+            time.sleep(poll_interval)
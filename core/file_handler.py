@@ -2,96 +2,45 @@
 Обработка файлов с промптами
 """
 import os
-import re
+from .card_source import CardSource
+from .prompt_cache import PromptCache, parse_card_selection, select_cards
+from .prompt_parser import parse_prompts_file
+from .records import Card, CardPrompts
 
 class FileHandler:
     def __init__(self, settings_manager):
         self.settings_manager = settings_manager
+        self.last_report_lines = []  # Замечания последнего разбора (ParseReport.format_lines)
     
     def load_prompts(self):
-        """Загружает промпты из файла в новом формате (лицо/оборот с названием карточки)"""
+        """
+        Загружает промпты из файла в новом формате (лицо/оборот с названием карточки)
+        
+        Разбор - core/prompt_parser.py (один проход по файлу); замечания - в self.last_report_lines
+        и сводкой в консоль. При PROMPT_CACHE_ENABLED результат берётся из кэша (core/prompt_cache.py),
+        пока файл не изменился - основной и рабочий процессы разбирают файл один раз.
+        """
         prompts_file = self.settings_manager.get('PROMPTS_FILE')
         print(f"[ПАРСЕР] Загружаем промпты из файла: {prompts_file}")
-        prompts_by_card = {}
-        card_names = {}  # Словарь для хранения названий карточек
         
         try:
             if not os.path.exists(prompts_file):
                 print(f"[ОШИБКА] Файл {prompts_file} не найден!")
-                return prompts_by_card
-                
-            for encoding in ['utf-8', 'utf-8-sig', 'cp1251', 'latin-1']:
-                try:
-                    with open(prompts_file, 'r', encoding=encoding) as file:
-                        print(f"[ЗАГРУЗКА] Используется кодировка: {encoding}")
-                        
-                        # Новый regex для формата "Карточка X лицо Название - Промпт Y: текст"
-                        # Поддержка как старого формата (без названия), так и нового (с названием)
-                        pattern = r'Карточка (\d+) (лицо|оборот) ([^-]+) - Промпт (\d+): (.+)'
-                        
-                        for line_num, line in enumerate(file, 1):
-                            line = line.strip()
-                            if line and 'Карточка' in line:
-                                match = re.search(pattern, line)
-                                if match:
-                                    card_num = int(match.group(1))
-                                    side_type = match.group(2)  # "лицо" или "оборот"
-                                    card_name = match.group(3).strip()  # Название карточки
-                                    prompt_num = int(match.group(4))
-                                    prompt_text = match.group(5)
-                                    
-                                    # Сохраняем название карточки (если еще не сохранено)
-                                    if card_num not in card_names:
-                                        card_names[card_num] = card_name
-                                    elif card_names[card_num] != card_name:
-                                        print(f"[ПРЕДУПРЕЖДЕНИЕ] Карточка {card_num} имеет разное название в разных строках!")
-                                    
-                                    # Инициализация структуры для карточки
-                                    if card_num not in prompts_by_card:
-                                        prompts_by_card[card_num] = {}
-                                    
-                                    # Инициализация структуры для пары промптов
-                                    if prompt_num not in prompts_by_card[card_num]:
-                                        prompts_by_card[card_num][prompt_num] = {}
-                                    
-                                    # Сохранение промпта по типу стороны
-                                    prompts_by_card[card_num][prompt_num][side_type] = prompt_text
-                                    
-                                else:
-                                    print(f"[ПРЕДУПРЕЖДЕНИЕ] Строка {line_num} не соответствует формату: {line[:50]}...")
-                        break
-                        
-                except UnicodeDecodeError:
-                    continue
-            
-            # Валидация полноты пар и преобразование в финальную структуру
-            valid_prompts = {}
-            total_pairs = 0
+                return {}
             
-            for card_num in sorted(prompts_by_card.keys()):
-                valid_pairs = []
-                card_name = card_names.get(card_num, f"Карточка {card_num}")  # Название карточки или по умолчанию
-                
-                for pair_num in sorted(prompts_by_card[card_num].keys()):
-                    pair_dict = prompts_by_card[card_num][pair_num]
-                    
-                    # Проверка полноты пары
-                    if 'лицо' not in pair_dict:
-                        print(f"[ПРЕДУПРЕЖДЕНИЕ] Карточка {card_num} ({card_name}), Пара {pair_num}: отсутствует 'лицо'")
-                    if 'оборот' not in pair_dict:
-                        print(f"[ПРЕДУПРЕЖДЕНИЕ] Карточка {card_num} ({card_name}), Пара {pair_num}: отсутствует 'оборот'")
-                    
-                    # Пара считается валидной только если есть оба промпта
-                    if 'лицо' in pair_dict and 'оборот' in pair_dict:
-                        valid_pairs.append(pair_dict)
-                        total_pairs += 1
-                    else:
-                        print(f"[ПРЕДУПРЕЖДЕНИЕ] Карточка {card_num} ({card_name}), Пара {pair_num}: неполная пара, пропускается")
-                
-                if valid_pairs:
-                    # Сохраняем структуру: номер карточки -> (название, список пар)
-                    valid_prompts[card_num] = (card_name, valid_pairs)
+            if self.settings_manager.get('PROMPT_CACHE_ENABLED'):
+                prompt_cache = PromptCache(self.settings_manager.get('PROMPT_CACHE_FILE') or 'data/prompts_cache.sqlite')
+                valid_prompts, encoding, self.last_report_lines, from_cache = prompt_cache.load_or_parse(prompts_file)
+                if from_cache:
+                    print("[ЗАГРУЗКА] Файл не изменился, промпты взяты из кэша разбора")
+            else:
+                valid_prompts, report = parse_prompts_file(prompts_file)
+                encoding, self.last_report_lines = report.encoding, report.format_lines()
+            print(f"[ЗАГРУЗКА] Используется кодировка: {encoding}")
+            for report_line in self.last_report_lines:
+                print(f"[ПРЕДУПРЕЖДЕНИЕ] {report_line}")
             
+            total_pairs = sum(len(pairs_list) for _, pairs_list in valid_prompts.values())
             print(f"[ЗАГРУЗКА] Загружено {len(valid_prompts)} карточек с промптами")
             print(f"[ЗАГРУЗКА] Найдено {total_pairs} полных пар промптов")
             print(f"[ЗАГРУЗКА] Будет создано {total_pairs * 2} изображений")
@@ -107,54 +56,178 @@ class FileHandler:
             print(f"[ОШИБКА] При загрузке промптов: {e}")
             return {}
     
+    def get_prompt_cache(self):
+        """Кэш разбора промптов или None, если он выключен (PROMPT_CACHE_ENABLED)"""
+        if not self.settings_manager.get('PROMPT_CACHE_ENABLED'):
+            return None
+        return PromptCache(self.settings_manager.get('PROMPT_CACHE_FILE') or 'data/prompts_cache.sqlite')
+    
+    def count_prompts(self):
+        """
+        Число карточек и полных пар в файле промптов (для проверки перед запуском).
+        
+        С кэшем разбора тексты промптов не загружаются - только счёт по индексу.
+        
+        Returns:
+            tuple: (карточек, пар)
+        """
+        prompts_file = self.settings_manager.get('PROMPTS_FILE')
+        prompt_cache = self.get_prompt_cache()
+        if prompt_cache is not None and os.path.exists(prompts_file):
+            try:
+                encoding, self.last_report_lines, from_cache, _ = prompt_cache.refresh(prompts_file)
+                if not from_cache:
+                    print(f"[ЗАГРУЗКА] Разобран файл промптов {prompts_file} (кодировка {encoding})")
+                    for report_line in self.last_report_lines:
+                        print(f"[ПРЕДУПРЕЖДЕНИЕ] {report_line}")
+                return prompt_cache.count_prompts(prompts_file)
+            except Exception as e:
+                print(f"[ОШИБКА] При подсчёте промптов: {e}")
+                return 0, 0
+        
+        all_prompts = self.load_prompts()
+        return len(all_prompts), sum(len(pairs_list) for _, pairs_list in all_prompts.values())
+    
+    def load_selected_prompts(self):
+        """
+        Промпты только выбранных карточек.
+        
+        CARD_SELECTION ('11-20, 25, 40-') - выбор по номерам; если пусто - первые CARDS_TO_PROCESS
+        карточек, начиная с START_FROM_CARD. С кэшем разбора читаются только строки выбранных
+        карточек (запрос по индексу), без кэша - файл разбирается целиком и фильтруется.
+        """
+        prompts_file = self.settings_manager.get('PROMPTS_FILE')
+        start_card = self.settings_manager.get('START_FROM_CARD')
+        cards_to_process = self.settings_manager.get('CARDS_TO_PROCESS')
+        card_selection = (self.settings_manager.get('CARD_SELECTION') or '').strip()
+        
+        try:
+            ranges = parse_card_selection(card_selection) if card_selection else None
+        except ValueError as e:
+            print(f"[ОШИБКА] Неверный выбор карточек CARD_SELECTION='{card_selection}': {e}")
+            return {}
+        
+        prompt_cache = self.get_prompt_cache()
+        if prompt_cache is None or not os.path.exists(prompts_file):
+            return select_cards(self.load_prompts(), ranges, start_card, cards_to_process)
+        
+        print(f"[ПАРСЕР] Выбираем карточки из файла: {prompts_file}")
+        try:
+            encoding, self.last_report_lines, from_cache, valid_prompts = prompt_cache.refresh(prompts_file)
+            if from_cache:
+                print("[ЗАГРУЗКА] Файл не изменился, промпты взяты из кэша разбора")
+            else:
+                print(f"[ЗАГРУЗКА] Используется кодировка: {encoding}")
+                for report_line in self.last_report_lines:
+                    print(f"[ПРЕДУПРЕЖДЕНИЕ] {report_line}")
+            
+            if valid_prompts is not None:
+                # Файл только что разобран - промпты уже в памяти
+                return select_cards(valid_prompts, ranges, start_card, cards_to_process)
+            if ranges:
+                return prompt_cache.load_selection(prompts_file, ranges)
+            return prompt_cache.load_range(prompts_file, start_card, cards_to_process)
+            
+        except Exception as e:
+            print(f"[ОШИБКА] При выборе карточек: {e}")
+            return {}
+    
+    def get_card_source(self):
+        """
+        Карточки мультиформатного режима для рабочего процесса без загрузки всех промптов.
+        
+        С кэшем разбора - CardSource (core/card_source.py): карточки читаются пачками по
+        CARD_SOURCE_BATCH_CARDS при каждом проходе, число карточек и пар - отдельным запросом COUNT.
+        Без кэша (или если кэш недоступен) - обычный список get_cards_to_process.
+        """
+        prompts_file = self.settings_manager.get('PROMPTS_FILE')
+        prompt_cache = self.get_prompt_cache()
+        if prompt_cache is None or not os.path.exists(prompts_file):
+            return self.get_cards_to_process()
+        
+        start_card = self.settings_manager.get('START_FROM_CARD')
+        cards_to_process = self.settings_manager.get('CARDS_TO_PROCESS')
+        card_selection = (self.settings_manager.get('CARD_SELECTION') or '').strip()
+        
+        try:
+            ranges = parse_card_selection(card_selection) if card_selection else None
+        except ValueError as e:
+            print(f"[ОШИБКА] Неверный выбор карточек CARD_SELECTION='{card_selection}': {e}")
+            return []
+        
+        print(f"[ПАРСЕР] Выбираем карточки из файла: {prompts_file}")
+        try:
+            encoding, self.last_report_lines, from_cache, _ = prompt_cache.refresh(prompts_file)
+            if from_cache:
+                print("[ЗАГРУЗКА] Файл не изменился, промпты взяты из кэша разбора")
+            else:
+                print(f"[ЗАГРУЗКА] Используется кодировка: {encoding}")
+                for report_line in self.last_report_lines:
+                    print(f"[ПРЕДУПРЕЖДЕНИЕ] {report_line}")
+        
+            if not ranges:
+                # Первые CARDS_TO_PROCESS карточек - один диапазон до последней из них
+                end_card = prompt_cache.get_range_end(prompts_file, start_card, cards_to_process)
+                if end_card is None:
+                    return []
+                ranges = [(start_card, end_card)]
+        
+            card_source = CardSource(prompt_cache, prompts_file, ranges,
+                                     self.settings_manager.get('CARD_SOURCE_BATCH_CARDS') or 100)
+            card_count, pair_count = card_source.count_totals()
+        except Exception as e:
+            print(f"[ОШИБКА] При выборе карточек: {e}")
+            return []
+        
+        if not card_count:
+            return []
+        print(f"[ПАРСЕР] Выбрано карточек: {card_count}, пар: {pair_count}")
+        if card_selection:
+            print(f"[ПАРСЕР] Выбор карточек: {card_selection}")
+        else:
+            print(f"[ПАРСЕР] Диапазон: карточки {start_card}-{ranges[0][1]}")
+        print(f"[ПАРСЕР] Карточки читаются из кэша пачками по {card_source.batch_size}")
+        return card_source
+    
     def get_cards_to_process(self):
         """Получает список карточек для обработки в формате, совместимом с режимом генерации"""
-        all_prompts = self.load_prompts()
-        if not all_prompts:
+        selected_prompts = self.load_selected_prompts()
+        if not selected_prompts:
             return []
         
-        available_cards = sorted(all_prompts.keys())
+        available_cards = sorted(selected_prompts.keys())
         start_card = self.settings_manager.get('START_FROM_CARD')
         cards_to_process = self.settings_manager.get('CARDS_TO_PROCESS')
+        card_selection = (self.settings_manager.get('CARD_SELECTION') or '').strip()
         generation_mode = self.settings_manager.get('GENERATION_MODE')
         
         # Вычисляем конечную карточку для логирования
         end_card = start_card + cards_to_process - 1
         
-        print(f"[ПАРСЕР] Доступные карточки: {available_cards}")
-        print(f"[ПАРСЕР] Диапазон: карточки {start_card}-{end_card}")
-        print(f"[ПАРСЕР] Будет обработано карточек: {cards_to_process}")
+        print(f"[ПАРСЕР] Выбрано карточек: {len(available_cards)} ({available_cards[0]}-{available_cards[-1]})")
+        if card_selection:
+            print(f"[ПАРСЕР] Выбор карточек: {card_selection}")
+        else:
+            print(f"[ПАРСЕР] Диапазон: карточки {start_card}-{end_card}")
+            print(f"[ПАРСЕР] Будет обработано карточек: {cards_to_process}")
         print(f"[ПАРСЕР] Режим генерации: {generation_mode}")
         
-        cards_to_process_list = [] 
-        cards_processed_count = 0
+        cards_to_process_list = []
         
+        # Выбор и лимит уже применены в load_selected_prompts
         for card_num in available_cards:
-            if card_num >= start_card:
-                # Новая структура: (название, список пар)
-                card_name, pairs_list = all_prompts[card_num]
-                print(f"[ПАРСЕР] Карточка {card_num} ({card_name}): {len(pairs_list)} пар")
-                
-                if generation_mode in ['multi_format', 'multi_format_with_refs']:
-                    # Для мультиформатного режима возвращаем кортеж (номер, название, список пар)
-                    cards_to_process_list.append((card_num, card_name, pairs_list))
-                else:
-                    # Для стандартного режима преобразуем пары в список промптов
-                    prompts_list = []
-                    for pair in pairs_list:
-                        if 'лицо' in pair:
-                            prompts_list.append(pair['лицо'])
-                        if 'оборот' in pair:
-                            prompts_list.append(pair['оборот'])
-                    print(f"[ПАРСЕР] Карточка {card_num}: преобразовано в {len(prompts_list)} промптов")
-                    cards_to_process_list.append((card_num, card_name, prompts_list))
-                
-                cards_processed_count += 1
-                
-                # Останавливаемся после обработки нужного количества карточек
-                if cards_processed_count >= cards_to_process:
-                    print(f"[ПАРСЕР] Достигнут лимит карточек: {cards_processed_count}/{cards_to_process}")
-                    break
+            # Новая структура: (название, список пар)
+            card_name, pairs_list = selected_prompts[card_num]
+            print(f"[ПАРСЕР] Карточка {card_num} ({card_name}): {len(pairs_list)} пар")
+            
+            if generation_mode in ['multi_format', 'multi_format_with_refs']:
+                # Для мультиформатного режима возвращаем Card (номер, название, список пар)
+                cards_to_process_list.append(Card(card_num, card_name, pairs_list))
+            else:
+                # Для стандартного режима - промпты пар по порядку (лицо, оборот, ...) без копирования текстов
+                prompts_list = CardPrompts(pairs_list)
+                print(f"[ПАРСЕР] Карточка {card_num}: преобразовано в {len(prompts_list)} промптов")
+                cards_to_process_list.append((card_num, card_name, prompts_list))
         
         print(f"[ПАРСЕР] Итого карточек для обработки: {len(cards_to_process_list)}")
         return cards_to_process_list
@@ -2,48 +2,75 @@
 Основная логика генерации изображений
 """
 import time
-import pyautogui
 import multiprocessing
-from config.coordinates import COORDINATES, DELAYS, RELATIVE_MOVEMENTS
+from config.coordinates import COORDINATES, DELAYS, RELATIVE_MOVEMENTS, get_coordinates_manager
 from utils.clipboard import ClipboardManager
+from utils.input_driver import get_input_driver
 from utils.logger import Logger
+from utils.ui_wait import UIWaiter
+from .calibration import DelayCalibrator
 from .chat_manager import ChatManager
+from .completion_detector import CompletionDetector
+from .latency_model import LatencyModel
+from .naming import generation_chat_name, generation_filename
+from .output_index import load_output_index
 
 class ImageGenerator:
     def __init__(self, settings_manager):
         self.settings_manager = settings_manager
-        self.clipboard = ClipboardManager()
+        self.input_driver = get_input_driver()
+        self.clipboard = ClipboardManager(self.input_driver)
         self.logger = Logger()
-        self.chat_manager = ChatManager()
+        self.ui_waiter = UIWaiter()
+        self.chat_manager = ChatManager(self.ui_waiter, self.input_driver)
+        self.completion_detector = CompletionDetector(settings_manager)
+        self.latency_model = LatencyModel(settings_manager)
+        self.delay_calibrator = DelayCalibrator(settings_manager, self)
+        self.failure_streak = 0  # Неудачных генераций подряд
+        self.output_index = None  # Индекс готовых файлов SAVE_FOLDER (создаётся в automation_worker)
+    
+    def track_generation_result(self, success, stop_event):
+        """
+        Учёт серии неудачных генераций.
+        
+        Если подряд провалилось CALIBRATION_FAILURE_STREAK генераций - задержки
+        перекалибровываются (интерфейс мог стать медленнее). Только при явном
+        CALIBRATION_AUTO_RECALIBRATE: калибровка создаёт свои чаты "Калибровка N".
+        """
+        if success:
+            self.failure_streak = 0
+            return
+        
+        self.failure_streak += 1
+        failure_streak_limit = self.settings_manager.get('CALIBRATION_FAILURE_STREAK') or 0
+        if not self.settings_manager.get('CALIBRATION_AUTO_RECALIBRATE'):
+            failure_streak_limit = 0
+        if failure_streak_limit and self.failure_streak >= failure_streak_limit and not stop_event.is_set():
+            self.logger.log_action(f"⚠️ {self.failure_streak} неудачных генераций подряд - перекалибровка задержек")
+            self.delay_calibrator.calibrate(stop_event)
+            self.failure_streak = 0
     
     def check_image_generated(self):
-        """Проверяет, сгенерировалось ли изображение по цвету пикселя"""
+        """Проверяет, сгенерировалось ли изображение по области вокруг IMAGE_LOCATION"""
         try:
-            x, y = COORDINATES['IMAGE_LOCATION']
-            pixel_color = pyautogui.pixel(x, y)
-            
-            background_rgb = (25, 25, 25)
-            tolerance = self.settings_manager.get('BACKGROUND_COLOR_TOLERANCE')
+            frame = self.completion_detector.capture_region()
+            presence_detector = self.completion_detector.presence_detector
+            score = presence_detector.score_frame(frame)
             
-            r, g, b = pixel_color
-            bg_r, bg_g, bg_b = background_rgb
+            self.logger.log_action(
+                f"Оценка области изображения: фон {score['background_fraction']:.0%}, "
+                f"дисперсия {score['variance']:.1f}, отличие от фона {score['histogram_distance']:.2f}"
+            )
             
-            is_background = (abs(r - bg_r) <= tolerance and 
-                            abs(g - bg_g) <= tolerance and 
-                            abs(b - bg_b) <= tolerance)
-            
-            self.logger.log_action(f"Цвет пикселя в точке изображения: RGB{pixel_color}")
-            self.logger.log_action(f"Фоновый цвет (с допуском {tolerance}): RGB{background_rgb}")
-            
-            if is_background:
-                self.logger.log_action("⚠️ Возможно, изображение не сгенерировалось (фоновый цвет)")
+            if not presence_detector.is_image_present(frame, score):
+                self.logger.log_action("⚠️ Возможно, изображение не сгенерировалось (в области только фон)")
                 return False
             else:
-                self.logger.log_action("✓ Обнаружено изображение (не фоновый цвет)")
+                self.logger.log_action("✓ Обнаружено изображение")
                 return True
                 
         except Exception as e:
-            self.logger.log_action(f"✗ ОШИБКА при проверке цвета пикселя: {e}")
+            self.logger.log_action(f"✗ ОШИБКА при проверке области изображения: {e}")
             return True
     
     def save_image_as(self, filename):
@@ -56,34 +83,47 @@ class ImageGenerator:
             
             # Наводим на изображение и делаем ПКМ
             x, y = COORDINATES['IMAGE_LOCATION']
-            self.logger.log_action(f"Клик ПКМ на изображении: ({x}, {y})")
-            pyautogui.rightClick(x, y)
-            time.sleep(DELAYS['CONTEXT_MENU_WAIT'])
-            
-            # Переходим к пункту "Сохранить изображение"
             rel_x, rel_y = RELATIVE_MOVEMENTS['TO_SAVE_OPTION']
             if rel_x == 0 and rel_y == 0:
                 self.logger.log_action("ВНИМАНИЕ: Относительное движение TO_SAVE_OPTION не задано!")
                 self.clipboard.restore_clipboard(original_clipboard)
                 return False
             
+            # Контекстное меню появляется в районе пункта "Сохранить изображение"
+            # (не у курсора - там подсветка изображения при наведении)
+            menu_probe = self.ui_waiter.probe_coordinate('IMAGE_LOCATION', (rel_x, rel_y))
+            self.logger.log_action(f"Клик ПКМ на изображении: ({x}, {y})")
+            self.input_driver.right_click(x, y)
+            if (not self.ui_waiter.wait_until(menu_probe, 'CONTEXT_MENU_WAIT', "появление контекстного меню")
+                    and menu_probe is not None):
+                # Меню не появилось - повторяем ПКМ один раз
+                self.logger.log_action("🔁 Контекстное меню не обнаружено, повторный клик ПКМ")
+                menu_probe = self.ui_waiter.probe_coordinate('IMAGE_LOCATION', (rel_x, rel_y))
+                self.input_driver.right_click(x, y)
+                self.ui_waiter.wait_step(menu_probe, 'CONTEXT_MENU_WAIT', "появление контекстного меню")
+            
+            # Переходим к пункту "Сохранить изображение"
+            hover_probe = self.ui_waiter.probe_coordinate('IMAGE_LOCATION', (rel_x, rel_y))
             self.logger.log_action(f"Движение к пункту меню: относительно ({rel_x}, {rel_y})")
-            pyautogui.move(rel_x, rel_y)
-            time.sleep(DELAYS['BETWEEN_CLICKS'])
+            self.input_driver.move(rel_x, rel_y)
+            self.ui_waiter.wait_step(hover_probe, 'BETWEEN_CLICKS', "подсветка пункта меню")
             
             # Кликаем на "Сохранить изображение"
-            pyautogui.click()
-            time.sleep(DELAYS['SAVE_DIALOG_WAIT'])
+            dialog_probe = self.ui_waiter.probe_screen_center()
+            self.input_driver.click()
+            self.ui_waiter.wait_step(dialog_probe, 'SAVE_DIALOG_WAIT', "открытие диалога сохранения")
             
             # Вводим имя файла
+            filename_probe = self.ui_waiter.probe_screen_center()
             self.logger.log_action("Вставка имени файла из буфера")
-            pyautogui.hotkey('ctrl', 'v')
-            time.sleep(DELAYS['BETWEEN_CLICKS'])
+            self.input_driver.hotkey('ctrl', 'v')
+            self.ui_waiter.wait_step(filename_probe, 'BETWEEN_CLICKS', "ввод имени файла")
             
             # Подтверждаем сохранение
+            close_probe = self.ui_waiter.probe_screen_center()
             self.logger.log_action("Подтверждение сохранения (Enter)")
-            pyautogui.press('enter')
-            time.sleep(DELAYS['AFTER_SAVE'])
+            self.input_driver.press('enter')
+            self.ui_waiter.wait_step(close_probe, 'AFTER_SAVE', "закрытие диалога сохранения")
             
             # Восстанавливаем буфер обмена
             self.clipboard.restore_clipboard(original_clipboard)
@@ -111,15 +151,16 @@ class ImageGenerator:
             if stop_event.is_set():
                 return False
             
-            # 2. Вводим промпт
+            # 2. Вводим промпт (фокус на экране не отличить от подсветки при наведении - пауза без проверки)
             if not self.chat_manager.click_coordinate('PROMPT_INPUT', "поле ввода промпта"):
                 return False
-            time.sleep(DELAYS['BETWEEN_CLICKS'])
+            self.ui_waiter.wait_step(None, 'BETWEEN_CLICKS', "фокус в поле промпта", stop_event)
             
+            paste_probe = self.ui_waiter.probe_coordinate('PROMPT_INPUT')
             self.logger.log_action("Ввод промпта через буфер обмена")
             if not self.clipboard.safe_paste_text(prompt):
                 return False
-            time.sleep(DELAYS['AFTER_PASTE'])
+            self.ui_waiter.wait_step(paste_probe, 'AFTER_PASTE', "вставка промпта", stop_event)
             
             # 3. Переименовываем чат
             if not self.chat_manager.rename_current_chat(chat_name):
@@ -128,19 +169,43 @@ class ImageGenerator:
             # 4. Возвращаемся к полю ввода промпта
             if not self.chat_manager.click_coordinate('PROMPT_INPUT', "возврат к полю ввода промпта"):
                 return False
-            time.sleep(DELAYS['BETWEEN_CLICKS'])
-            
-            # 5. Запускаем генерацию
-            self.logger.log_action("Запуск генерации (Ctrl+Enter)")
-            pyautogui.hotkey('ctrl', 'enter')
-            time.sleep(DELAYS['BETWEEN_CLICKS'])
+            self.ui_waiter.wait_step(None, 'BETWEEN_CLICKS', "фокус в поле промпта", stop_event)
             
-            self.logger.log_action(f"Ожидание генерации {generation_wait} сек...")
+            # Базовый кадр области изображения до запуска генерации
+            completion_detection = self.settings_manager.get('COMPLETION_DETECTION')
+            baseline_frame = None
+            if completion_detection:
+                baseline_frame = self.completion_detector.capture_baseline()
             
-            for i in range(int(generation_wait)):
-                if stop_event.is_set():
+            # 5. Запускаем генерацию (поле промпта очищается после отправки)
+            submit_probe = self.ui_waiter.probe_coordinate('PROMPT_INPUT')
+            self.logger.log_action("Запуск генерации (Ctrl+Enter)")
+            self.input_driver.hotkey('ctrl', 'enter')
+            self.ui_waiter.wait_step(submit_probe, 'BETWEEN_CLICKS', "отправка промпта", stop_event)
+            
+            # Ждём появления изображения на экране, при недоступности детектора - фиксированное время
+            wait_status = 'error'
+            if completion_detection:
+                # Таймаут по истории генераций стандартного режима (пока истории мало - GENERATION_TIMEOUT)
+                generation_timeout = self.latency_model.get_wait_budget(
+                    'standard', None, False, self.settings_manager.get('GENERATION_TIMEOUT') or 90.0
+                )
+                wait_status = self.completion_detector.wait_for_image(stop_event, generation_timeout, baseline_frame)
+                if wait_status == 'stopped':
                     return False
-                time.sleep(1)
+                if wait_status == 'completed':
+                    self.latency_model.record('standard', None, False, self.completion_detector.last_elapsed)
+                if wait_status == 'timeout':
+                    self.latency_model.record_timeout('standard', None, False)
+            
+            if wait_status == 'error':
+                generation_wait = self.latency_model.get_wait_budget('standard', None, False, generation_wait)
+                self.logger.log_action(f"Ожидание генерации {generation_wait} сек...")
+                
+                for i in range(int(generation_wait)):
+                    if stop_event.is_set():
+                        return False
+                    time.sleep(1)
             
             if check_image_enabled:
                 try:
@@ -158,6 +223,8 @@ class ImageGenerator:
             
             if not self.save_image_as(filename):
                 return False
+            if self.output_index is not None:
+                self.output_index.add(filename)
             
             self.logger.log_action(f"✓ Генерация {chat_name} завершена успешно")
             return True
@@ -184,23 +251,25 @@ class ImageGenerator:
                     self.logger.log_action(f"⚠️ Промпт {prompt_index + 1} для карточки {card_number} ({card_name}) пустой, пропускаем генерацию {gen_num}")
                     continue
                 
-                # Формат названия: Карточка № - НАЗВАНИЕ - генерация №
-                chat_name = f"Карточка {card_number} - {card_name} - генерация {gen_num}"
-                # Очищаем название от спецсимволов для имени файла
-                safe_card_name = card_name.replace(' ', '_').replace('/', '_').replace('\\', '_')
-                # Формат файла: Карточка_№_НАЗВАНИЕ_генерация_№.png
-                filename = f"Карточка_{card_number}_{safe_card_name}_генерация_{gen_num}.png"
+                chat_name = generation_chat_name(card_number, card_name, gen_num)
+                filename = generation_filename(card_number, card_name, gen_num)
+                
+                if self.output_index is not None and self.output_index.contains(filename):
+                    self.logger.log_action(f"⏭️ {filename} уже сохранён, пропускаем генерацию {gen_num}")
+                    success_count += 1
+                    continue
                 
                 self.logger.log_action(f"Используем промпт {prompt_index + 1}: {prompt[:100]}...")
                 
                 success = self.generate_single_image(prompt, chat_name, filename, check_image_enabled, generation_wait, stop_event)
                 if success:
                     success_count += 1
+                self.track_generation_result(success, stop_event)
                 
                 # Создаем новый чат для следующей генерации (кроме последней)
                 if gen_num < generations_per_card and not stop_event.is_set():
                     self.logger.log_action("Подготовка к следующей генерации...")
-                    time.sleep(DELAYS['BETWEEN_GENERATIONS'])
+                    self.ui_waiter.pause(DELAYS['BETWEEN_GENERATIONS'], stop_event)
             
             self.logger.log_action(f"✓ Карточка #{card_number} завершена: {success_count}/{generations_per_card} генераций")
             return success_count
@@ -214,6 +283,8 @@ class ImageGenerator:
         # Ленивый импорт для избежания циклических зависимостей
         from core.file_handler import FileHandler
         
+        # Задержки могла обновить калибровка (отдельный процесс) после импорта в основном процессе
+        get_coordinates_manager().reload_delays()
         self.logger.log_action(f"Процесс запущен (PID: {multiprocessing.current_process().pid})")
         self.logger.log_action(f"Настройки: старт={start_card}, генераций={generations_per_card}, лимит={cards_to_process}, проверка={check_image_enabled}")
         
@@ -228,6 +299,9 @@ class ImageGenerator:
         self.logger.log_action(f"Начинаем с карточки #{start_card}")
         self.logger.log_action(f"Будет обработано {len(cards_to_process_list)} карточек ({total_generations} генераций)")
         
+        # Готовые файлы в SAVE_FOLDER не генерируем повторно
+        self.output_index = load_output_index(self.settings_manager)
+        
         processed_cards = 0
         total_generations_done = 0
         
@@ -242,9 +316,13 @@ class ImageGenerator:
                 total_generations_done += generations_done
             
             if (card_number, card_name, prompts_for_card) != cards_to_process_list[-1] and not stop_event.is_set():
-                time.sleep(DELAYS['BETWEEN_CARDS'])
+                self.ui_waiter.pause(DELAYS['BETWEEN_CARDS'], stop_event)
         
         self.logger.log_action(f"========== ОТЧЁТ ==========")
         self.logger.log_action(f"Обработано карточек: {processed_cards}/{len(cards_to_process_list)}")
         self.logger.log_action(f"Выполнено генераций: {total_generations_done}/{total_generations}")
+        self.logger.log_action(f"Захват экрана: {self.completion_detector.screen_capture.format_metrics()}")
+        self.logger.log_action(f"Ввод: {self.input_driver.format_metrics()}")
+        for report_line in self.ui_waiter.format_report():
+            self.logger.log_action(f"Ожидание UI: {report_line}")
         self.logger.log_action(f"===========================")
\ No newline at end of file
@@ -0,0 +1,108 @@
+"""
+Проверка наличия изображения в области экрана (NumPy, один проход по кадру)
+"""
+import numpy as np
+
+# Фоновый цвет пустой области чата (пока фон не изучен по реальному кадру)
+DEFAULT_BACKGROUND_RGB = (25, 25, 25)
+
+# Количество корзин гистограммы яркости
+HISTOGRAM_BINS = 32
+
+# Разброс яркости, ниже которого кадр считается однотонным (годится для изучения фона)
+FLAT_VARIANCE_THRESHOLD = 36.0
+
+
+def frame_to_array(frame):
+    """Кадр (PIL.Image или массив) -> массив HxWx3 без копирования, если это возможно"""
+    frame_array = np.asarray(frame)
+    if frame_array.ndim == 2:
+        frame_array = np.stack([frame_array] * 3, axis=-1)
+    return frame_array[..., :3]
+
+
+def frame_difference(frame_a, frame_b):
+    """Средняя абсолютная разница двух кадров (0-255)"""
+    array_a = frame_to_array(frame_a)
+    array_b = frame_to_array(frame_b)
+    if array_a.shape != array_b.shape:
+        return 255.0
+    return float(np.abs(array_a.astype(np.int16) - array_b.astype(np.int16)).mean())
+
+
+class ImagePresenceDetector:
+    """
+    Оценка области экрана: доля фоновых пикселей, дисперсия яркости и
+    расстояние гистограммы до изученного фона.
+    """
+
+    def __init__(self, settings_manager):
+        self.settings_manager = settings_manager
+        self.background_rgb = np.array(DEFAULT_BACKGROUND_RGB, dtype=np.int16)
+        self.background_histogram = self._color_histogram(self.background_rgb)
+
+    def _color_histogram(self, rgb):
+        """Гистограмма яркости однотонного кадра заданного цвета"""
+        histogram = np.zeros(HISTOGRAM_BINS, dtype=np.float64)
+        brightness = float(np.mean(rgb))
+        histogram[min(int(brightness * HISTOGRAM_BINS / 256), HISTOGRAM_BINS - 1)] = 1.0
+        return histogram
+
+    def _brightness_histogram(self, brightness):
+        """Нормированная гистограмма яркости"""
+        histogram, _ = np.histogram(brightness, bins=HISTOGRAM_BINS, range=(0, 256))
+        return histogram / max(brightness.size, 1)
+
+    def learn_background(self, frame):
+        """
+        Изучение фона по кадру пустой области.
+
+        Returns:
+            bool: True если кадр однотонный и фон обновлён
+        """
+        pixels = frame_to_array(frame).reshape(-1, 3).astype(np.int16)
+        brightness = pixels.mean(axis=1)
+        if brightness.var() > FLAT_VARIANCE_THRESHOLD:
+            return False
+
+        self.background_rgb = np.median(pixels, axis=0).astype(np.int16)
+        self.background_histogram = self._brightness_histogram(brightness)
+        return True
+
+    def score_frame(self, frame):
+        """
+        Оценка кадра за один проход.
+
+        Returns:
+            dict: background_fraction (0-1), variance, histogram_distance (0-1)
+        """
+        tolerance = self.settings_manager.get('BACKGROUND_COLOR_TOLERANCE') or 30
+        pixels = frame_to_array(frame).reshape(-1, 3).astype(np.int16)
+
+        near_background = (np.abs(pixels - self.background_rgb) <= tolerance).all(axis=1)
+        brightness = pixels.mean(axis=1)
+        histogram = self._brightness_histogram(brightness)
+
+        return {
+            'background_fraction': float(near_background.mean()),
+            'variance': float(brightness.var()),
+            'histogram_distance': float(0.5 * np.abs(histogram - self.background_histogram).sum()),
+        }
+
+    def is_image_present(self, frame, score=None):
+        """
+        Есть ли изображение в области.
+
+        Изображение: фон занимает не больше PRESENCE_MAX_BACKGROUND_FRACTION
+        и кадр неоднотонный либо заметно отличается от фона по гистограмме.
+        """
+        if score is None:
+            score = self.score_frame(frame)
+
+        max_background_fraction = self.settings_manager.get('PRESENCE_MAX_BACKGROUND_FRACTION') or 0.6
+        min_variance = self.settings_manager.get('PRESENCE_MIN_VARIANCE') or 20.0
+        min_histogram_distance = self.settings_manager.get('PRESENCE_MIN_HISTOGRAM_DISTANCE') or 0.3
+
+        if score['background_fraction'] > max_background_fraction:
+            return False
+        return score['variance'] >= min_variance or score['histogram_distance'] >= min_histogram_distance
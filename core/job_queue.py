@@ -0,0 +1,319 @@
+"""
+Очередь задач генерации в SQLite: состояние каждой стороны переживает остановку и падение процесса
+"""
+import os
+import sqlite3
+import time
+from utils.logger import Logger
+
+# Состояния задачи
+STATE_PENDING = 'pending'
+STATE_RUNNING = 'running'
+STATE_DONE = 'done'
+STATE_FAILED = 'failed'
+
+
+def make_job_key(card_number, pair_number, side, format_ratio):
+    """Уникальный ключ задачи: карточка|пара|сторона|формат"""
+    return f"{card_number}|{pair_number}|{side}|{format_ratio}"
+
+
+class JobQueue:
+    """
+    Задачи (карточка, пара, сторона, формат) в data/jobs.sqlite.
+
+    Жизненный цикл: pending -> running -> done / failed.
+    Задача в running после остановки или падения возвращается в pending (recover_running),
+    поэтому новый запуск продолжает ровно с того места, где остановился предыдущий.
+
+    Соединение открывается на каждую операцию: объект можно передавать в другой процесс,
+    а параллельные линии работают с одним файлом (WAL + BEGIN IMMEDIATE при захвате задачи).
+
+    sync_jobs помечает задачи запуском этого объекта (run_id) и порядковым номером (position):
+    захват и счёт идут запросами по индексу (run_id, state, position), без чтения всей очереди.
+    У каждой линии свой объект JobQueue - и свой запуск.
+    """
+
+    def __init__(self, db_path='data/jobs.sqlite'):
+        self.db_path = db_path
+        self.logger = Logger()
+        self.run_id = f"{os.getpid()}-{time.time_ns()}"
+        self.next_position = 0
+        self.create_tables()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def create_tables(self):
+        """Создание таблицы задач (если её нет)"""
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        connection = self._connect()
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    job_key TEXT UNIQUE NOT NULL,
+                    card_number INTEGER NOT NULL,
+                    card_name TEXT NOT NULL,
+                    pair_number INTEGER NOT NULL,
+                    side TEXT NOT NULL,
+                    format_ratio TEXT NOT NULL,
+                    prompt TEXT NOT NULL,
+                    state TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    run_attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    duration REAL,
+                    last_error TEXT
+                )
+            """)
+            # Файлы очереди прежних версий - без run_id, position и run_attempts
+            columns = [row['name'] for row in connection.execute("PRAGMA table_info(jobs)")]
+            if 'run_id' not in columns:
+                connection.execute("ALTER TABLE jobs ADD COLUMN run_id TEXT")
+            if 'position' not in columns:
+                connection.execute("ALTER TABLE jobs ADD COLUMN position INTEGER")
+            if 'run_attempts' not in columns:
+                connection.execute("ALTER TABLE jobs ADD COLUMN run_attempts INTEGER NOT NULL DEFAULT 0")
+            connection.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, id)")
+            connection.execute("CREATE INDEX IF NOT EXISTS jobs_run_claim ON jobs (run_id, state, position)")
+            # История попыток: причина каждой неудачи остаётся, даже если следующая попытка успешна
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS job_attempts (
+                    job_id INTEGER NOT NULL,
+                    attempt INTEGER NOT NULL,
+                    state TEXT NOT NULL,
+                    finished_at REAL NOT NULL,
+                    duration REAL,
+                    reason TEXT
+                )
+            """)
+            connection.execute("CREATE INDEX IF NOT EXISTS job_attempts_job ON job_attempts (job_id, attempt)")
+        finally:
+            connection.close()
+
+    def sync_jobs(self, side_jobs):
+        """
+        Добавление задач запуска в очередь.
+
+        Новые задачи добавляются в pending; у незавершённых обновляются название и промпт
+        (файл промптов могли поправить), задачи с ошибкой возвращаются в pending для новой попытки.
+        Выполненные задачи не меняются, но, как и остальные, относятся к запуску этого объекта.
+        Счётчик попыток запуска (run_attempts) у задачи из прежнего запуска начинается заново,
+        общий счётчик attempts (история job_attempts) продолжается.
+        Можно вызывать несколько раз (пачками) - порядок задач продолжается.
+
+        Returns:
+            list: ключи задач запуска в исходном порядке
+        """
+        now = time.time()
+        job_keys = []
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            for job in side_jobs:
+                job_key = make_job_key(job['card_number'], job['pair_number'], job['side'], job['format_ratio'])
+                job_keys.append(job_key)
+                connection.execute(
+                    "INSERT OR IGNORE INTO jobs (job_key, card_number, card_name, pair_number, side, "
+                    "format_ratio, prompt, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (job_key, job['card_number'], job['card_name'], job['pair_number'], job['side'],
+                     job['format_ratio'], job['prompt'], now)
+                )
+                connection.execute(
+                    "UPDATE jobs SET run_attempts = CASE WHEN run_id = ? THEN run_attempts ELSE 0 END, "
+                    "run_id = ?, position = ?, "
+                    "card_name = CASE WHEN state = ? THEN card_name ELSE ? END, "
+                    "prompt = CASE WHEN state = ? THEN prompt ELSE ? END, "
+                    "state = CASE WHEN state = ? THEN ? ELSE state END WHERE job_key = ?",
+                    (self.run_id, self.run_id, self.next_position, STATE_DONE, job['card_name'], STATE_DONE, job['prompt'],
+                     STATE_FAILED, STATE_PENDING, job_key)
+                )
+                self.next_position += 1
+            connection.execute("COMMIT")
+        finally:
+            connection.close()
+        return job_keys
+
+    def recover_running(self):
+        """
+        Возврат задач, оставшихся в running после остановки/падения, в pending.
+
+        Returns:
+            int: количество возвращённых задач
+        """
+        connection = self._connect()
+        try:
+            cursor = connection.execute("UPDATE jobs SET state = ?, started_at = NULL WHERE state = ?",
+                                        (STATE_PENDING, STATE_RUNNING))
+            recovered_count = cursor.rowcount
+        finally:
+            connection.close()
+
+        if recovered_count:
+            self.logger.log_action(f"♻️ Возвращено в очередь незавершённых задач: {recovered_count}")
+        return recovered_count
+
+    def claim_next(self):
+        """
+        Захват следующей задачи этого запуска из pending (в порядке sync_jobs).
+
+        Returns:
+            dict: задача (поля таблицы) или None, если задач не осталось
+        """
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            row = connection.execute(
+                "SELECT * FROM jobs WHERE run_id = ? AND state = ? ORDER BY position LIMIT 1",
+                (self.run_id, STATE_PENDING)
+            ).fetchone()
+
+            if row is None:
+                connection.execute("COMMIT")
+                return None
+
+            connection.execute("UPDATE jobs SET state = ?, attempts = attempts + 1, run_attempts = run_attempts + 1, "
+                               "started_at = ? WHERE id = ?",
+                               (STATE_RUNNING, time.time(), row['id']))
+            connection.execute("COMMIT")
+        finally:
+            connection.close()
+
+        job = dict(row)
+        job['state'] = STATE_RUNNING
+        job['attempts'] += 1
+        job['run_attempts'] += 1
+        return job
+
+    def claim_job(self, job_id):
+        """
+        Захват конкретной задачи (повтор после неудачи).
+
+        Returns:
+            dict: задача или None, если она уже выполнена или занята
+        """
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            cursor = connection.execute(
+                "UPDATE jobs SET state = ?, attempts = attempts + 1, run_attempts = run_attempts + 1, started_at = ? "
+                "WHERE id = ? AND state IN (?, ?)",
+                (STATE_RUNNING, time.time(), job_id, STATE_PENDING, STATE_FAILED)
+            )
+            row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone() if cursor.rowcount else None
+            connection.execute("COMMIT")
+        finally:
+            connection.close()
+        return dict(row) if row is not None else None
+
+    def iter_claims(self, stop_event=None):
+        """Задачи этого запуска по одной: следующая захватывается только когда запрошена"""
+        while stop_event is None or not stop_event.is_set():
+            job = self.claim_next()
+            if job is None:
+                return
+            yield job
+
+    def mark_done(self, job_id):
+        """Задача выполнена"""
+        self._finish(job_id, STATE_DONE, None)
+
+    def mark_failed(self, job_id, reason=''):
+        """Задача не выполнена (reason - причина для отчёта)"""
+        self._finish(job_id, STATE_FAILED, reason)
+
+    def _finish(self, job_id, state, reason):
+        now = time.time()
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            connection.execute(
+                "UPDATE jobs SET state = ?, finished_at = ?, duration = ? - started_at, last_error = ? WHERE id = ?",
+                (state, now, now, reason, job_id)
+            )
+            connection.execute(
+                "INSERT INTO job_attempts (job_id, attempt, state, finished_at, duration, reason) "
+                "SELECT id, attempts, state, finished_at, duration, last_error FROM jobs WHERE id = ?",
+                (job_id,)
+            )
+            connection.execute("COMMIT")
+        finally:
+            connection.close()
+
+    def get_attempts(self, job_id):
+        """
+        История попыток задачи.
+
+        Returns:
+            list: словари attempt, state, finished_at, duration, reason
+        """
+        connection = self._connect()
+        try:
+            rows = connection.execute(
+                "SELECT attempt, state, finished_at, duration, reason FROM job_attempts WHERE job_id = ? ORDER BY attempt",
+                (job_id,)
+            ).fetchall()
+        finally:
+            connection.close()
+        return [dict(row) for row in rows]
+
+    def mark_keys_done(self, job_keys):
+        """Задачи, чьи файлы уже сохранены (индекс готовых файлов), считаются выполненными"""
+        self._set_state_by_keys(job_keys, STATE_DONE, "state != ?", STATE_DONE)
+
+    def reopen_keys(self, job_keys):
+        """Выполненные задачи, чьих файлов больше нет, возвращаются в pending"""
+        self._set_state_by_keys(job_keys, STATE_PENDING, "state = ?", STATE_DONE)
+
+    def _set_state_by_keys(self, job_keys, state, condition, condition_state):
+        now = time.time()
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            for job_key in job_keys:
+                connection.execute(
+                    f"UPDATE jobs SET state = ?, finished_at = ?, duration = NULL, last_error = NULL "
+                    f"WHERE job_key = ? AND {condition}",
+                    (state, now if state == STATE_DONE else None, job_key, condition_state)
+                )
+            connection.execute("COMMIT")
+        finally:
+            connection.close()
+
+    def get_counts(self, current_run=False):
+        """Количество задач по состояниям (для запуска этого объекта или для всей очереди)"""
+        connection = self._connect()
+        try:
+            if current_run:
+                rows = connection.execute("SELECT state, COUNT(*) FROM jobs WHERE run_id = ? GROUP BY state",
+                                          (self.run_id,)).fetchall()
+            else:
+                rows = connection.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        finally:
+            connection.close()
+
+        counts = {STATE_PENDING: 0, STATE_RUNNING: 0, STATE_DONE: 0, STATE_FAILED: 0}
+        for state, count in rows:
+            counts[state] = count
+        return counts
+
+    def get_average_duration(self):
+        """Среднее время выполненной задачи (сек) или None"""
+        connection = self._connect()
+        try:
+            row = connection.execute("SELECT AVG(duration) FROM jobs WHERE state = ?", (STATE_DONE,)).fetchone()
+        finally:
+            connection.close()
+        return row[0]
+
+    def format_counts(self, current_run=False):
+        """Состояние очереди одной строкой для лога"""
+        counts = self.get_counts(current_run)
+        return (f"выполнено {counts[STATE_DONE]}, ожидают {counts[STATE_PENDING]}, "
+                f"с ошибкой {counts[STATE_FAILED]}, в работе {counts[STATE_RUNNING]}")
@@ -0,0 +1,94 @@
+"""
+Параллельные линии генерации: по одному процессу на виртуальный X-дисплей (Xvfb)
+"""
+import os
+
+
+def lane_coordinates_file(lane_index):
+    """Файл координат линии (у каждой линии своё окно браузера)"""
+    return os.path.join('data', f'coordinates_{lane_index + 1}.json')
+
+
+def split_cards_across_lanes(cards_to_process_list, lane_count):
+    """
+    Распределение карточек по линиям с выравниванием по числу пар.
+
+    Карточки берутся от самой большой к самой маленькой и отдаются наименее загруженной линии,
+    внутри линии исходный порядок карточек сохраняется.
+
+    Returns:
+        list: по списку карточек на линию (в формате get_cards_to_process)
+    """
+    lane_loads = [0] * lane_count
+    lane_positions = [[] for _ in range(lane_count)]
+
+    cards_by_size = sorted(enumerate(cards_to_process_list), key=lambda item: -len(item[1][2]))
+    for position, card in cards_by_size:
+        lane_index = lane_loads.index(min(lane_loads))
+        lane_loads[lane_index] += len(card[2])
+        lane_positions[lane_index].append(position)
+
+    return [[cards_to_process_list[position] for position in sorted(positions)]
+            for positions in lane_positions]
+
+
+def lane_worker(lane_name, settings_manager, cards_to_process_list, stop_event, progress_queue):
+    """
+    Точка входа процесса линии.
+
+    DISPLAY, AUTOMATION_DISPLAY и AUTOMATION_COORDINATES_FILE уже заданы в окружении процесса,
+    поэтому pyautogui, захват экрана и координаты подключаются к дисплею линии при импорте.
+    """
+    from core.multi_format_generator import MultiFormatGenerator
+
+    generator = MultiFormatGenerator(settings_manager)
+    generator.progress_queue = progress_queue
+    generator.lane_name = lane_name
+    try:
+        generator.automation_worker(
+            stop_event,
+            settings_manager.get('START_FROM_CARD'),
+            settings_manager.get('CHECK_IMAGE_GENERATED'),
+            settings_manager.get('GENERATION_WAIT'),
+            len(cards_to_process_list),
+            cards_to_process_list=cards_to_process_list,
+        )
+    finally:
+        progress_queue.put({'lane': lane_name, 'finished': True})
+
+
+class LaneProgress:
+    """Сводный прогресс всех линий (события из progress_queue)"""
+
+    def __init__(self, lane_names, total_images):
+        self.total_images = total_images
+        self.images_by_lane = {lane_name: 0 for lane_name in lane_names}
+        self.failures_by_lane = {lane_name: 0 for lane_name in lane_names}
+        self.finished_lanes = set()
+
+    def apply(self, event):
+        """
+        Учёт события линии (результат одной задачи или завершение линии).
+
+        Returns:
+            str: строка прогресса для вывода
+        """
+        lane_name = event['lane']
+        if event.get('finished'):
+            self.finished_lanes.add(lane_name)
+            return f"Линия {lane_name} завершена ({len(self.finished_lanes)}/{len(self.images_by_lane)})"
+
+        if event['success']:
+            self.images_by_lane[lane_name] += 1
+            status = "✓"
+        else:
+            self.failures_by_lane[lane_name] += 1
+            status = "✗"
+        return (f"Линия {lane_name}: {status} карточка #{event['card_number']} пара {event['pair_number']} "
+                f"{event['side']} (всего {self.get_images_created()}/{self.total_images})")
+
+    def get_images_created(self):
+        return sum(self.images_by_lane.values())
+
+    def is_finished(self):
+        return len(self.finished_lanes) == len(self.images_by_lane)
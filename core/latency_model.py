@@ -0,0 +1,182 @@
+"""
+История времени генерации и расчёт бюджета ожидания по режиму и формату
+"""
+import json
+import os
+import time
+from utils.logger import Logger
+
+# Сколько таймаутов подряд могут увеличить бюджет (по LATENCY_TIMEOUT_STEP каждый)
+MAX_TIMEOUT_STEPS = 2
+
+# Блокировка файла истории на время слияния (параллельные линии пишут в один файл)
+LOCK_TIMEOUT = 2.0  # Сколько ждать блокировку, сек - потом замеры сохранятся при следующей записи
+LOCK_STALE_AGE = 30.0  # Блокировка старше - осталась от упавшего процесса, сек
+
+
+def percentile(values, percent):
+    """Перцентиль с линейной интерполяцией"""
+    sorted_values = sorted(values)
+    position = (len(sorted_values) - 1) * percent / 100.0
+    lower_index = int(position)
+    upper_index = min(lower_index + 1, len(sorted_values) - 1)
+    fraction = position - lower_index
+    return sorted_values[lower_index] + (sorted_values[upper_index] - sorted_values[lower_index]) * fraction
+
+
+class LatencyModel:
+    """
+    Хранит наблюдаемое время генерации в data/latency_history.json
+    отдельно для каждой комбинации (режим, формат, есть ли референс).
+
+    Бюджет ожидания = перцентиль LATENCY_PERCENTILE истории * LATENCY_MARGIN.
+    Пока записей меньше LATENCY_MIN_SAMPLES - используется значение по умолчанию.
+
+    Таймаут в историю не попадает: его время равно бюджету, и каждый таймаут поднимал бы
+    следующий бюджет вплоть до LATENCY_MAX_WAIT. Таймауты считаются отдельно (в памяти процесса):
+    каждый таймаут подряд добавляет к бюджету LATENCY_TIMEOUT_STEP, не больше MAX_TIMEOUT_STEPS раз;
+    первое обнаруженное изображение сбрасывает счёт.
+
+    Файл общий для параллельных линий: при записи он перечитывается под блокировкой
+    ({history_file}.lock), к нему добавляются только новые замеры этого процесса,
+    и результат записывается через временный файл и os.replace - замеры других линий
+    не теряются, а читатель не видит недописанный файл.
+    """
+
+    def __init__(self, settings_manager, history_file='data/latency_history.json'):
+        self.settings_manager = settings_manager
+        self.history_file = history_file
+        self.logger = Logger()
+        self.history = {}
+        self.pending_samples = {}  # Ключ истории -> замеры, ещё не записанные в файл
+        self.timeout_counts = {}  # Ключ истории -> таймаутов подряд
+        self.load_history()
+
+    def make_key(self, generation_mode, format_ratio, has_reference):
+        """Ключ истории: 'режим|формат|ref' или 'режим|формат|noref'"""
+        reference_part = 'ref' if has_reference else 'noref'
+        return f"{generation_mode}|{format_ratio or 'default'}|{reference_part}"
+
+    def load_history(self):
+        """Загрузка истории из файла"""
+        try:
+            self.history = self._read_history_file()
+        except Exception as e:
+            self.logger.log_action(f"⚠️ Не удалось загрузить историю времени генерации: {e}")
+            self.history = {}
+
+    def _read_history_file(self):
+        if not os.path.exists(self.history_file):
+            return {}
+        with open(self.history_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _acquire_lock(self, lock_path):
+        """Блокировка через создание файла (O_EXCL работает и в Windows). Returns: bool"""
+        deadline = time.time() + LOCK_TIMEOUT
+        while True:
+            try:
+                os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return True
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(lock_path) > LOCK_STALE_AGE:
+                        os.remove(lock_path)
+                        continue
+                except OSError:
+                    continue
+                if time.time() >= deadline:
+                    return False
+                time.sleep(0.01)
+
+    def save_history(self):
+        """Слияние новых замеров с файлом истории (под блокировкой) и атомарная запись"""
+        if not self.pending_samples:
+            return
+        lock_path = f"{self.history_file}.lock"
+        try:
+            os.makedirs(os.path.dirname(self.history_file) or '.', exist_ok=True)
+            if not self._acquire_lock(lock_path):
+                # Замеры остаются в pending_samples и запишутся со следующим замером
+                self.logger.log_action("⚠️ Файл истории времени генерации занят, запись отложена")
+                return
+            try:
+                try:
+                    history = self._read_history_file()
+                except ValueError:
+                    history = {}  # Повреждённый файл (например, от прежней версии без атомарной записи)
+                history_size = self.settings_manager.get('LATENCY_HISTORY_SIZE') or 200
+                for key, new_samples in self.pending_samples.items():
+                    samples = history.setdefault(key, [])
+                    samples.extend(new_samples)
+                    del samples[:-history_size]
+
+                temp_path = f"{self.history_file}.{os.getpid()}.tmp"
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    json.dump(history, f, indent=2, ensure_ascii=False)
+                os.replace(temp_path, self.history_file)
+            finally:
+                os.remove(lock_path)
+            # В памяти - общая история, включая замеры других линий
+            self.history = history
+            self.pending_samples = {}
+        except Exception as e:
+            self.logger.log_action(f"⚠️ Не удалось сохранить историю времени генерации: {e}")
+
+    def record(self, generation_mode, format_ratio, has_reference, seconds):
+        """Запись наблюдаемого времени генерации"""
+        key = self.make_key(generation_mode, format_ratio, has_reference)
+        history_size = self.settings_manager.get('LATENCY_HISTORY_SIZE') or 200
+
+        sample = round(float(seconds), 2)
+        samples = self.history.setdefault(key, [])
+        samples.append(sample)
+        del samples[:-history_size]
+        self.pending_samples.setdefault(key, []).append(sample)
+        self.timeout_counts.pop(key, None)
+
+        self.save_history()
+
+    def record_timeout(self, generation_mode, format_ratio, has_reference):
+        """Таймаут ожидания: реальное время неизвестно (больше бюджета) - только счёт таймаутов подряд"""
+        key = self.make_key(generation_mode, format_ratio, has_reference)
+        self.timeout_counts[key] = self.timeout_counts.get(key, 0) + 1
+
+    def percentile(self, values, percent):
+        """Перцентиль с линейной интерполяцией"""
+        return percentile(values, percent)
+
+    def get_wait_budget(self, generation_mode, format_ratio, has_reference, default_wait):
+        """
+        Бюджет ожидания генерации в секундах.
+
+        Args:
+            generation_mode: режим генерации
+            format_ratio: "4:3", "3:2" или None (стандартный режим)
+            has_reference: вставлен ли референс
+            default_wait: значение, если истории пока недостаточно
+
+        Returns:
+            float: бюджет ожидания
+        """
+        key = self.make_key(generation_mode, format_ratio, has_reference)
+        samples = self.history.get(key, [])
+        min_samples = self.settings_manager.get('LATENCY_MIN_SAMPLES') or 5
+        timeout_steps = min(self.timeout_counts.get(key, 0), MAX_TIMEOUT_STEPS)
+        timeout_factor = 1 + timeout_steps * (self.settings_manager.get('LATENCY_TIMEOUT_STEP') or 0.0)
+
+        if len(samples) < min_samples:
+            return round(default_wait * timeout_factor, 1)
+
+        percent = self.settings_manager.get('LATENCY_PERCENTILE') or 95
+        margin = self.settings_manager.get('LATENCY_MARGIN') or 1.2
+        min_wait = self.settings_manager.get('LATENCY_MIN_WAIT') or 5.0
+        max_wait = self.settings_manager.get('LATENCY_MAX_WAIT') or 180.0
+
+        budget = self.percentile(samples, percent) * margin * timeout_factor
+        budget = round(min(max(budget, min_wait), max_wait), 1)
+
+        timeout_note = f", таймаутов подряд: {timeout_steps}" if timeout_steps else ""
+        self.logger.log_action(f"📈 Бюджет ожидания для {key}: {budget} сек "
+                               f"(p{percent} по {len(samples)} замерам x{margin}{timeout_note})")
+        return budget
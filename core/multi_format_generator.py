@@ -3,21 +3,83 @@
 Поддерживает генерацию пар изображений (лицо 4:3 + оборот 3:2)
 """
 import time
-import pyautogui
 import multiprocessing
 import os
-from config.coordinates import COORDINATES, DELAYS, RELATIVE_MOVEMENTS
+from collections import Counter
+from config.coordinates import COORDINATES, DELAYS, RELATIVE_MOVEMENTS, get_coordinates_manager
 from utils.clipboard import ClipboardManager
+from utils.input_driver import get_input_driver
 from utils.logger import Logger
+from utils.ui_wait import DROPDOWN_OFFSET, UIWaiter
+from .calibration import DelayCalibrator
+from .card_source import count_cards, iter_batches
 from .chat_manager import ChatManager
+from .completion_detector import CompletionDetector
+from .job_queue import STATE_FAILED, STATE_PENDING
+from .latency_model import LatencyModel
+from .naming import reused_chat_name, safe_card_name, side_chat_name, side_filename
+from .records import SIDE_FORMATS
+from .reference_cache import ReferenceCache, ReferencePrefetcher
+from .reference_index import REFERENCE_SIDES, ReferenceIndex
+from .reference_normalizer import ReferenceNormalizer
+from .reference_preflight import run_reference_preflight
+from .retry_queue import RetryQueue, format_job, get_job_key, get_run_attempts
+from .ui_state import UIState
+
+# Задач на одну транзакцию записи в очередь (JobQueue.sync_jobs)
+JOB_SYNC_BATCH_SIZE = 500
 
 class MultiFormatGenerator:
     def __init__(self, settings_manager):
         self.settings_manager = settings_manager
-        self.clipboard = ClipboardManager()
+        self.input_driver = get_input_driver()
+        self.clipboard = ClipboardManager(self.input_driver, settings_manager.get('CLIPBOARD_IMAGE_BACKEND') or 'auto')
         self.logger = Logger()
-        self.chat_manager = ChatManager()
+        self.ui_waiter = UIWaiter()
+        self.chat_manager = ChatManager(self.ui_waiter, self.input_driver)
+        self.completion_detector = CompletionDetector(settings_manager)
+        self.latency_model = LatencyModel(settings_manager)
+        self.delay_calibrator = DelayCalibrator(settings_manager, self)
+        self.failure_streak = 0  # Неудачных генераций подряд
+        self.job_queue = None  # Очередь задач SQLite (создаётся в automation_worker)
+        self.output_index = None  # Индекс готовых файлов SAVE_FOLDER (создаётся в automation_worker)
+        self.retry_queue = None  # Отложенные повторы неудачных сторон (создаётся в automation_worker)
+        self.last_failure_reason = ''  # Причина последней неудачи submit_side/harvest_side
+        self.ui_state = UIState(settings_manager.get('FORMAT_KEPT_IN_NEW_CHAT'))  # Состояние интерфейса (чат, формат, фокус)
+        self.skipped_ui_actions = {}  # Действие -> сколько раз пропущено, потому что его результат уже на экране
+        self.progress_queue = None  # Очередь прогресса для параллельных линий (core/lanes.py)
+        self.reference_index = None  # Индекс папок data/images/<сторона> (строится один раз)
+        self.reference_cache = None  # Кэш референсов в PNG (режим с референсами, создаётся в automation_worker)
+        self.reference_prefetcher = None  # Фоновая подготовка референсов следующей карточки
+        self.reference_normalizer = None  # Уменьшение больших референсов (REFERENCE_MAX_SIDE)
+        self.reference_paste_times = []  # Вставка референса: от Ctrl+V до расширения поля ввода (сек)
+        self.lane_name = None
+    
+    def track_generation_result(self, success, stop_event):
+        """
+        Учёт серии неудачных генераций.
+        
+        Если подряд провалилось CALIBRATION_FAILURE_STREAK генераций - задержки
+        перекалибровываются (интерфейс мог стать медленнее). Только при явном
+        CALIBRATION_AUTO_RECALIBRATE: калибровка создаёт свои чаты "Калибровка N".
+        """
+        if success:
+            self.failure_streak = 0
+            return
+        
+        self.failure_streak += 1
+        failure_streak_limit = self.settings_manager.get('CALIBRATION_FAILURE_STREAK') or 0
+        if not self.settings_manager.get('CALIBRATION_AUTO_RECALIBRATE'):
+            failure_streak_limit = 0
+        if failure_streak_limit and self.failure_streak >= failure_streak_limit and not stop_event.is_set():
+            self.logger.log_action(f"⚠️ {self.failure_streak} неудачных генераций подряд - перекалибровка задержек")
+            self.delay_calibrator.calibrate(stop_event)
+            self.failure_streak = 0
+            self.ui_state.reset()  # Калибровка создаёт свои чаты
     
+    def count_skipped_action(self, action: str):
+        self.skipped_ui_actions[action] = self.skipped_ui_actions.get(action, 0) + 1
+
     def select_image_format(self, format_ratio: str) -> bool:
         """
         Выбор формата изображения через UI.
@@ -31,30 +93,42 @@ class MultiFormatGenerator:
         Алгоритм:
         1. Клик на FORMAT_SELECTOR координату
         2. Пауза BETWEEN_CLICKS
-        3. Ввод format_ratio через pyautogui.write()
+        3. Ввод format_ratio через self.input_driver.write()
         4. Пауза BETWEEN_CLICKS
         5. Enter для подтверждения
         6. Пауза BETWEEN_CLICKS
         """
+        if self.ui_state.format_ratio == format_ratio:
+            self.logger.log_action(f"♻️ Формат {format_ratio} уже выбран")
+            self.count_skipped_action('выбор формата')
+            return True
+
+        # До подтверждения выбора формат и фокус неизвестны
+        self.ui_state.format_ratio = None
+        self.ui_state.focus_lost()
         try:
             self.logger.log_action(f"Выбор формата изображения: {format_ratio}")
             
-            # 1. Клик на выпадающий список формата
+            # 1. Клик на выпадающий список формата (список открывается под полем)
+            open_probe = self.ui_waiter.probe_coordinate('FORMAT_SELECTOR', (0, DROPDOWN_OFFSET))
             if not self.chat_manager.click_coordinate('FORMAT_SELECTOR', "выпадающий список формата"):
                 return False
-            time.sleep(DELAYS['BETWEEN_CLICKS'])
+            self.ui_waiter.wait_step(open_probe, 'BETWEEN_CLICKS', "открытие списка форматов")
             
-            # 2. Ввод формата
+            # 2. Ввод формата (снимок после клика - подсветка поля уже в нём)
+            input_probe = self.ui_waiter.probe_coordinate('FORMAT_SELECTOR')
             self.logger.log_action(f"Ввод формата: {format_ratio}")
-            pyautogui.write(format_ratio)
-            time.sleep(DELAYS['BETWEEN_CLICKS'])
+            self.input_driver.write(format_ratio)
+            self.ui_waiter.wait_step(input_probe, 'BETWEEN_CLICKS', "ввод формата")
             
-            # 3. Подтверждение выбора
+            # 3. Подтверждение выбора (список под полем закрывается)
+            confirm_probe = self.ui_waiter.probe_coordinate('FORMAT_SELECTOR', (0, DROPDOWN_OFFSET))
             self.logger.log_action("Подтверждение выбора формата (Enter)")
-            pyautogui.press('enter')
-            time.sleep(DELAYS['BETWEEN_CLICKS'])
+            self.input_driver.press('enter')
+            self.ui_waiter.wait_step(confirm_probe, 'BETWEEN_CLICKS', "закрытие списка форматов")
             
             self.logger.log_action(f"✓ Формат {format_ratio} выбран успешно")
+            self.ui_state.format_ratio = format_ratio
             return True
             
         except Exception as e:
@@ -113,38 +187,51 @@ class MultiFormatGenerator:
             
             # Наводим на изображение и делаем ПКМ
             x, y = COORDINATES['IMAGE_LOCATION']
-            self.logger.log_action(f"🖱️ Клик ПКМ на изображении: ({x}, {y})")
-            pyautogui.rightClick(x, y)
-            time.sleep(DELAYS['CONTEXT_MENU_WAIT'])
-            self.logger.log_action("⏳ Ожидание появления контекстного меню...")
-            
-            # Переходим к пункту "Сохранить изображение"
             rel_x, rel_y = RELATIVE_MOVEMENTS['TO_SAVE_OPTION']
             if rel_x == 0 and rel_y == 0:
                 self.logger.log_action("❌ ВНИМАНИЕ: Относительное движение TO_SAVE_OPTION не задано!")
                 self.clipboard.restore_clipboard(original_clipboard)
                 return False
             
+            # Контекстное меню появляется в районе пункта "Сохранить изображение"
+            # (не у курсора - там подсветка изображения при наведении)
+            menu_probe = self.ui_waiter.probe_coordinate('IMAGE_LOCATION', (rel_x, rel_y))
+            self.logger.log_action(f"🖱️ Клик ПКМ на изображении: ({x}, {y})")
+            self.input_driver.right_click(x, y)
+            self.logger.log_action("⏳ Ожидание появления контекстного меню...")
+            if (not self.ui_waiter.wait_until(menu_probe, 'CONTEXT_MENU_WAIT', "появление контекстного меню")
+                    and menu_probe is not None):
+                # Меню не появилось - повторяем ПКМ один раз
+                self.logger.log_action("🔁 Контекстное меню не обнаружено, повторный клик ПКМ")
+                menu_probe = self.ui_waiter.probe_coordinate('IMAGE_LOCATION', (rel_x, rel_y))
+                self.input_driver.right_click(x, y)
+                self.ui_waiter.wait_step(menu_probe, 'CONTEXT_MENU_WAIT', "появление контекстного меню")
+            
+            # Переходим к пункту "Сохранить изображение"
+            hover_probe = self.ui_waiter.probe_coordinate('IMAGE_LOCATION', (rel_x, rel_y))
             self.logger.log_action(f"🖱️ Движение к пункту меню: относительно ({rel_x}, {rel_y})")
-            pyautogui.move(rel_x, rel_y)
-            time.sleep(DELAYS['BETWEEN_CLICKS'])
+            self.input_driver.move(rel_x, rel_y)
+            self.ui_waiter.wait_step(hover_probe, 'BETWEEN_CLICKS', "подсветка пункта меню")
             
             # Кликаем на "Сохранить изображение"
+            dialog_probe = self.ui_waiter.probe_screen_center()
             self.logger.log_action("🖱️ Клик на пункт 'Сохранить изображение'")
-            pyautogui.click()
-            time.sleep(DELAYS['SAVE_DIALOG_WAIT'])
+            self.input_driver.click()
             self.logger.log_action("⏳ Ожидание открытия диалога сохранения...")
+            self.ui_waiter.wait_step(dialog_probe, 'SAVE_DIALOG_WAIT', "открытие диалога сохранения")
             
             # Вводим имя файла
+            filename_probe = self.ui_waiter.probe_screen_center()
             self.logger.log_action("⌨️ Вставка имени файла из буфера обмена")
-            pyautogui.hotkey('ctrl', 'v')
-            time.sleep(DELAYS['BETWEEN_CLICKS'])
+            self.input_driver.hotkey('ctrl', 'v')
+            self.ui_waiter.wait_step(filename_probe, 'BETWEEN_CLICKS', "ввод имени файла")
             
             # Подтверждаем сохранение
+            close_probe = self.ui_waiter.probe_screen_center()
             self.logger.log_action("⌨️ Подтверждение сохранения (Enter)")
-            pyautogui.press('enter')
-            time.sleep(DELAYS['AFTER_SAVE'])
+            self.input_driver.press('enter')
             self.logger.log_action("⏳ Ожидание завершения сохранения...")
+            self.ui_waiter.wait_step(close_probe, 'AFTER_SAVE', "закрытие диалога сохранения")
             
             # Восстанавливаем буфер обмена
             self.clipboard.restore_clipboard(original_clipboard)
@@ -177,38 +264,60 @@ class MultiFormatGenerator:
         Формат имени файла: {side}_{card_number}_{card_name}.{ext}
         Пример: оборот_20_балтийское_море.png
         Название карточки в файле идёт после второго подчеркивания до точки.
+        Поиск идёт по индексу папок (core/reference_index.py): регистр, ё/е и пробелы
+        в названии не важны, расширения - .png, .jpg, .jpeg, .bmp.
         """
         try:
-            # Очищаем название от спецсимволов для поиска файла
-            # В файле название может быть с пробелами, но в имени файла - с подчеркиваниями
-            safe_card_name = card_name.replace(' ', '_').replace('/', '_').replace('\\', '_')
-            
-            # Путь к папке с референсами
-            ref_dir = os.path.join('data', 'images', side)
+            ref_path = self.get_reference_index().find(card_number, card_name, side)
+            if ref_path:
+                self.logger.log_action(f"✓ Найден референс: {ref_path}")
+                if self.reference_normalizer is not None:
+                    ref_path = self.reference_normalizer.normalize(ref_path)
+                return ref_path
             
-            if not os.path.exists(ref_dir):
-                self.logger.log_action(f"⚠️ Папка с референсами не найдена: {ref_dir}")
-                return None
-            
-            # Ищем файлы с форматом {side}_{card_number}_{card_name}.{ext}
-            # Проверяем оба расширения: .png и .jpg
-            for ext in ['png', 'jpg']:
-                ref_filename = f"{side}_{card_number}_{safe_card_name}.{ext}"
-                ref_path = os.path.join(ref_dir, ref_filename)
-                
-                if os.path.exists(ref_path):
-                    self.logger.log_action(f"✓ Найден референс: {ref_path}")
-                    return ref_path
-            
-            # Если не нашли, выводим информацию для отладки
             self.logger.log_action(f"⚠️ Референс не найден для карточки {card_number} ({card_name}), сторона {side}")
-            self.logger.log_action(f"   Искали файлы: {side}_{card_number}_{safe_card_name}.png и .jpg")
-            self.logger.log_action(f"   В папке: {ref_dir}")
+            self.logger.log_action(f"   Искали файл: {side}_{card_number}_{safe_card_name(card_name)}.png (или .jpg)")
+            self.logger.log_action(f"   В папке: {os.path.join(self.reference_index.root, side)}")
             return None
             
         except Exception as e:
             self.logger.log_action(f"✗ ОШИБКА при поиске референса: {e}")
             return None
+    
+    def check_reference_files(self, found_refs: list) -> list:
+        """
+        Проверка найденных референсов до первого клика: декодирование, пропорции, размер файла.
+        
+        Проверка идёт в пуле потоков (REFERENCE_PREFLIGHT_WORKERS), проблемные файлы выводятся списком.
+        
+        Returns:
+            list: результаты с проблемами (см. core/reference_preflight.py)
+        """
+        start_time = time.time()
+        results = run_reference_preflight(
+            found_refs,
+            int((self.settings_manager.get('REFERENCE_MAX_FILE_MB') or 0) * 1024 * 1024),
+            self.settings_manager.get('REFERENCE_ASPECT_TOLERANCE') or 0.05,
+            self.settings_manager.get('REFERENCE_PREFLIGHT_WORKERS') or 8,
+        )
+        problem_results = [result for result in results if result['problems']]
+        corrupt_count = len([result for result in problem_results if result['corrupt']])
+        self.logger.log_action(f"🔬 Проверено референсов: {len(results)} за {time.time() - start_time:.1f} сек, "
+                               f"с замечаниями: {len(problem_results)}, не декодируются: {corrupt_count}")
+        
+        if problem_results:
+            self.logger.log_action("⚠️ ЗАМЕЧАНИЯ ПО РЕФЕРЕНСАМ:")
+            for result in problem_results:
+                self.logger.log_action(f"   - Карточка {result['card_number']} ({result['card_name']}) - {result['side']}: "
+                                       f"{'; '.join(result['problems'])} [{result['path']}]")
+            print(f"[ГЕНЕРАТОР] ⚠️ Референсов с замечаниями: {len(problem_results)} шт. (не декодируются: {corrupt_count})")
+        return problem_results
+    
+    def get_reference_index(self) -> ReferenceIndex:
+        """Индекс папок с референсами (строится один раз на запуск)"""
+        if self.reference_index is None:
+            self.reference_index = ReferenceIndex().build()
+        return self.reference_index
 
     def generate_single_side(self, card_number: int, card_name: str, pair_number: int,
                             side: str, prompt: str,
@@ -234,37 +343,80 @@ class MultiFormatGenerator:
         4. Выбрать формат (select_image_format)
         5. Вернуться к полю ввода
         6. Генерация (Ctrl+Enter)
-        7. Ожидание
-        8. Опциональная проверка изображения
+        7. Ожидание: детектор завершения (COMPLETION_DETECTION) или фиксированная пауза
+        8. Опциональная проверка изображения (только при ожидании по времени)
         9. Сохранение: f"Карточка_{card_number}_{card_name}_{side}_промпт_{pair_number}_{format_ratio.replace(':', 'x')}.png"
         """
+        submission = self.submit_side(card_number, card_name, pair_number, side, prompt, format_ratio, stop_event)
+        if submission is None:
+            return False
+        return self.harvest_side(submission, stop_event)
+
+    def can_reuse_chat(self, card_number: int) -> bool:
+        """
+        Можно ли отправить сторону в уже открытый чат (CHAT_REUSE_MODE).
+
+        Чат продолжается, пока идут стороны той же карточки и их не больше CHAT_REUSE_MAX_SIDES (0 - без лимита).
+        """
+        chat = self.ui_state.chat
+        if not self.settings_manager.get('CHAT_REUSE_MODE') or chat is None:
+            return False
+        if chat['card_number'] != card_number:
+            return False
+        max_sides = self.settings_manager.get('CHAT_REUSE_MAX_SIDES') or 0
+        return not max_sides or chat['sides'] < max_sides
+
+    def submit_side(self, card_number: int, card_name: str, pair_number: int,
+                    side: str, prompt: str, format_ratio: str, stop_event):
+        """
+        Отправка одной стороны на генерацию (шаги 1-6 generate_single_side) без ожидания результата.
+
+        Returns:
+            dict: данные отправки для harvest_side() или None при ошибке
+        """
+        chat_name = side_chat_name(card_number, card_name, side, pair_number)
+        self.last_failure_reason = ''
+        reuse_chat = self.can_reuse_chat(card_number)
+        submitted = False
         try:
-            # Формат названия: Карточка № - НАЗВАНИЕ - сторона - Промпт №
-            chat_name = f"Карточка {card_number} - {card_name} - {side} - Промпт {pair_number}"
-            # Очищаем название от спецсимволов для имени файла
-            safe_card_name = card_name.replace(' ', '_').replace('/', '_').replace('\\', '_')
-            # Формат файла: Карточка_№_НАЗВАНИЕ_сторона_промпт_№_формат.png
-            filename = f"Карточка_{card_number}_{safe_card_name}_{side}_промпт_{pair_number}_{format_ratio.replace(':', 'x')}.png"
-            
+            filename = side_filename(card_number, card_name, side, pair_number, format_ratio)
+
             self.logger.log_action(f"--- Генерация: {chat_name} ---")
             
-            # 1. Создаем новый чат
-            if not self.chat_manager.create_new_chat_only():
-                return False
+            # 1. Создаем новый чат (или продолжаем чат карточки в CHAT_REUSE_MODE)
+            if reuse_chat:
+                self.logger.log_action(f"♻️ Продолжаем чат карточки #{card_number} (сторон в чате: {self.ui_state.chat['sides']})")
+                self.count_skipped_action('новый чат')
+            else:
+                if not self.chat_manager.create_new_chat_only():
+                    self.last_failure_reason = "не создан новый чат"
+                    return None
+                self.ui_state.new_chat(card_number)
             
             if stop_event.is_set():
-                return False
+                self.last_failure_reason = "остановка"
+                return None
             
             # 2. Вводим промпт (и референс, если режим с референсами)
-            if not self.chat_manager.click_coordinate('PROMPT_INPUT', "поле ввода промпта"):
-                return False
-            time.sleep(DELAYS['BETWEEN_CLICKS'])
+            if self.ui_state.prompt_focused:
+                self.count_skipped_action('клик в поле промпта')
+            else:
+                if not self.chat_manager.click_coordinate('PROMPT_INPUT', "поле ввода промпта"):
+                    self.last_failure_reason = "клик в поле промпта"
+                    return None
+                # Фокус на экране не отличить от подсветки при наведении - пауза без проверки
+                self.ui_waiter.wait_step(None, 'BETWEEN_CLICKS', "фокус в поле промпта", stop_event)
+                self.ui_state.prompt_focused = True
             
             # Проверяем режим генерации - если режим с референсами, вставляем изображение
             generation_mode = self.settings_manager.get('GENERATION_MODE')
+            reference_attached = False
             if generation_mode == 'multi_format_with_refs':
                 # Ищем и вставляем референс
                 ref_path = self.get_reference_path(card_number, card_name, side)
+                if self.reference_prefetcher is not None:
+                    # Пока идёт эта карточка, референсы следующей кодируются в фоне
+                    self.reference_prefetcher.prefetch_after(card_number)
                 if ref_path:
                     self.logger.log_action(f"Вставка референса: {ref_path}")
                     # Сохраняем текущий буфер обмена
@@ -272,10 +424,16 @@ class MultiFormatGenerator:
                     
                     # Копируем изображение в буфер обмена
                     if self.clipboard.copy_image_to_clipboard(ref_path):
-                        # Вставляем изображение
+                        # Вставляем изображение (поле ввода расширяется вверх - ждём изменения там, где оно окажется)
+                        attach_probe = (self.ui_waiter.probe_coordinate('PROMPT_INPUT_AFTER_IMAGE')
+                                        or self.ui_waiter.probe_coordinate('PROMPT_INPUT'))
+                        paste_start = time.perf_counter()
                         if self.clipboard.paste_image_from_clipboard():
                             self.logger.log_action("✓ Референс вставлен успешно")
-                            time.sleep(DELAYS['BETWEEN_CLICKS'])  # Пауза после вставки изображения
+                            reference_attached = True
+                            self.ui_state.reference_attached = True
+                            self.ui_waiter.wait_step(attach_probe, 'BETWEEN_CLICKS', "вставка референса", stop_event)
+                            self.reference_paste_times.append(time.perf_counter() - paste_start)
                         else:
                             self.logger.log_action("⚠️ Не удалось вставить референс, продолжаем без него")
                     else:
@@ -287,122 +445,262 @@ class MultiFormatGenerator:
                     self.logger.log_action(f"⚠️ Референс не найден для карточки {card_number}, сторона {side}, продолжаем без референса")
             
             # Вводим промпт
+            paste_probe = self.ui_waiter.probe_coordinate('PROMPT_INPUT_AFTER_IMAGE' if reference_attached else 'PROMPT_INPUT')
             self.logger.log_action("Ввод промпта через буфер обмена")
             if not self.clipboard.safe_paste_text(prompt):
-                return False
-            time.sleep(DELAYS['AFTER_PASTE'])
+                self.last_failure_reason = "вставка промпта"
+                return None
+            self.ui_waiter.wait_step(paste_probe, 'AFTER_PASTE', "вставка промпта", stop_event)
             
-            # 3. Переименовываем чат
-            if not self.chat_manager.rename_current_chat(chat_name):
-                return False
+            # 3. Переименовываем чат (общий чат - один раз, при создании)
+            if not reuse_chat:
+                if self.settings_manager.get('CHAT_REUSE_MODE'):
+                    new_chat_name = reused_chat_name(card_number, card_name, pair_number)
+                else:
+                    new_chat_name = chat_name
+                self.ui_state.focus_lost()
+                if not self.chat_manager.rename_current_chat(new_chat_name):
+                    self.last_failure_reason = "переименование чата"
+                    return None
+            else:
+                self.count_skipped_action('переименование чата')
             
-            # 4. Выбираем формат изображения
+            # 4. Выбираем формат изображения (если он уже выбран - без действий)
             if not self.select_image_format(format_ratio):
-                return False
+                self.last_failure_reason = f"выбор формата {format_ratio}"
+                return None
             
-            # 5. Возвращаемся к полю ввода промпта
-            # В режиме с референсами используем специальную координату (выше обычной),
-            # так как чат расширяется после вставки изображения
-            if generation_mode == 'multi_format_with_refs':
-                # Используем координату для режима с референсами
+            # 5. Возвращаемся к полю ввода промпта (если фокус ушёл при переименовании/выборе формата)
+            # Со вставленным референсом используем специальную координату (выше обычной),
+            # так как поле ввода расширяется после вставки изображения
+            if self.ui_state.reference_attached:
                 coord_name = 'PROMPT_INPUT_AFTER_IMAGE'
                 description = "возврат к полю ввода промпта после вставки изображения"
             else:
-                # Обычная координата для режима без референсов
                 coord_name = 'PROMPT_INPUT'
                 description = "возврат к полю ввода промпта"
             
-            if not self.chat_manager.click_coordinate(coord_name, description):
+            if self.ui_state.prompt_focused:
+                self.count_skipped_action('возврат к полю промпта')
+            else:
+                if not self.chat_manager.click_coordinate(coord_name, description):
+                    self.last_failure_reason = "возврат к полю промпта"
+                    return None
+                self.ui_waiter.wait_step(None, 'BETWEEN_CLICKS', "фокус в поле промпта", stop_event)
+                self.ui_state.prompt_focused = True
+            
+            # Базовый кадр области изображения до запуска генерации.
+            # В продолженном чате в области ещё предыдущее изображение - кадр снимаем после отправки
+            # (чат уже прокручен к новому ответу) и сравниваем ещё и с кадром предыдущего результата
+            completion_detection = self.settings_manager.get('COMPLETION_DETECTION')
+            baseline_frame = None
+            previous_result_frame = None
+            if completion_detection:
+                if reuse_chat:
+                    previous_result_frame = self.ui_state.chat.get('result_frame')
+                else:
+                    baseline_frame = self.completion_detector.capture_baseline()
+
+            # 6. Запускаем генерацию (поле промпта очищается после отправки)
+            submit_probe = self.ui_waiter.probe_coordinate(coord_name)
+            self.logger.log_action("Запуск генерации (Ctrl+Enter)")
+            self.input_driver.hotkey('ctrl', 'enter')
+            self.ui_waiter.wait_step(submit_probe, 'BETWEEN_CLICKS', "отправка промпта", stop_event)
+            if completion_detection and reuse_chat:
+                baseline_frame = self.completion_detector.capture_baseline()
+
+            self.ui_state.prompt_submitted()
+            submitted = True
+
+            return {
+                'chat_name': chat_name,
+                'filename': filename,
+                'generation_mode': generation_mode,
+                'format_ratio': format_ratio,
+                'reference_attached': reference_attached,
+                'baseline_frame': baseline_frame,
+                'previous_result_frame': previous_result_frame,
+                'submitted_at': time.time(),
+            }
+
+        except Exception as e:
+            self.logger.log_action(f"✗ ОШИБКА при отправке {chat_name}: {e}")
+            self.last_failure_reason = f"ошибка отправки: {e}"
+            return None
+        finally:
+            # После ошибки состояние интерфейса неизвестно
+            if not submitted:
+                self.ui_state.reset()
+
+    def harvest_side(self, submission: dict, stop_event, wait_timeout: float = None) -> bool:
+        """
+        Ожидание и сохранение изображения (шаги 7-9 generate_single_side).
+
+        Args:
+            submission: результат submit_side()
+            stop_event: событие остановки
+            wait_timeout: таймаут ожидания (по умолчанию - бюджет LatencyModel)
+
+        Returns:
+            bool: True если изображение сохранено
+        """
+        chat_name = submission['chat_name']
+        filename = submission['filename']
+        generation_mode = submission['generation_mode']
+        format_ratio = submission['format_ratio']
+        reference_attached = submission['reference_attached']
+        baseline_frame = submission['baseline_frame']
+        completion_detection = self.settings_manager.get('COMPLETION_DETECTION')
+        self.last_failure_reason = ''
+        wait_status = None
+        # Сохранение идёт через контекстное меню и диалог - фокус уходит из поля ввода
+        self.ui_state.focus_lost()
+        saved = False
+        try:
+            # 7. Ожидание генерации
+            # Сначала пробуем дождаться изображения на экране (без фиксированной паузы)
+            if completion_detection:
+                # Таймаут по истории генераций этого режима/формата (пока истории мало - GENERATION_TIMEOUT)
+                generation_timeout = wait_timeout or self.latency_model.get_wait_budget(
+                    generation_mode, format_ratio, reference_attached,
+                    self.settings_manager.get('GENERATION_TIMEOUT') or 90.0
+                )
+                wait_status = self.completion_detector.wait_for_image(stop_event, generation_timeout, baseline_frame,
+                                                                      submission.get('previous_result_frame'))
+                # Время считаем от отправки: при конвейере по вкладкам ожидание начинается позже
+                generation_elapsed = time.time() - submission['submitted_at']
+                # При конвейере по нескольким вкладкам вкладку проверяют только после обслуживания остальных -
+                # такой замер завышен и в историю не идёт (иначе бюджеты растут с числом вкладок)
+                record_latency = submission.get('record_latency', True)
+
+                if wait_status == 'stopped':
+                    self.last_failure_reason = "остановка"
+                    return False
+                if wait_status == 'completed' and record_latency:
+                    self.latency_model.record(generation_mode, format_ratio, reference_attached, generation_elapsed)
+                if wait_status == 'timeout':
+                    # Таймаут не замер: бюджет растёт ограниченным шагом (LatencyModel.record_timeout)
+                    self.latency_model.record_timeout(generation_mode, format_ratio, reference_attached)
+                    self.logger.log_action("⚠️ Изображение не обнаружено за отведённое время, но продолжаем сохранение")
+                if wait_status == 'error':
+                    self.logger.log_action("⚠️ Детектор недоступен, переходим на ожидание по времени")
+                    if not self._wait_generation_fixed(stop_event, generation_mode, format_ratio, reference_attached):
+                        self.last_failure_reason = "остановка"
+                        return False
+            else:
+                if not self._wait_generation_fixed(stop_event, generation_mode, format_ratio, reference_attached):
+                    self.last_failure_reason = "остановка"
+                    return False
+
+            # 9. Сохранение изображения
+            if not self.save_image_as(filename):
+                if wait_status == 'timeout':
+                    self.last_failure_reason = "изображение не появилось за отведённое время, сохранение не удалось"
+                else:
+                    self.last_failure_reason = "сохранение не удалось"
                 return False
-            time.sleep(DELAYS['BETWEEN_CLICKS'])
+            if self.output_index is not None:
+                self.output_index.add(filename)
+            saved = True
+            self.ui_state.result_saved(self.completion_detector.last_frame if wait_status == 'completed' else None)
+
+            self.logger.log_action(f"✓ Генерация {chat_name} завершена успешно")
+            return True
+
+        except Exception as e:
+            self.logger.log_action(f"✗ ОШИБКА в генерации {chat_name}: {e}")
+            self.last_failure_reason = f"ошибка генерации: {e}"
+            return False
+        finally:
+            # Чат продолжаем только после успешного сохранения (как и в submit_side)
+            if not saved:
+                self.ui_state.reset()
+
+    def _wait_generation_fixed(self, stop_event, generation_mode: str, format_ratio: str,
+                               reference_attached: bool) -> bool:
+        """
+        Ожидание генерации по времени с опциональной проверкой изображения.
+
+        Время берётся из истории генераций (LatencyModel), пока истории мало - GENERATION_WAIT.
+
+        Returns:
+            bool: False если получен сигнал остановки
+        """
+        generation_wait = self.settings_manager.get('GENERATION_WAIT')
+        check_image_enabled = self.settings_manager.get('CHECK_IMAGE_GENERATED')
+
+        # Защита от None значений
+        if generation_wait is None:
+            generation_wait = 20.0  # Значение по умолчанию
+            self.logger.log_action("⚠️ GENERATION_WAIT был None, используется значение по умолчанию: 20.0 сек")
+
+        generation_wait = self.latency_model.get_wait_budget(generation_mode, format_ratio,
+                                                             reference_attached, generation_wait)
+
+        if check_image_enabled is None:
+            check_image_enabled = True  # Значение по умолчанию
+            self.logger.log_action("⚠️ CHECK_IMAGE_GENERATED был None, используется значение по умолчанию: True")
+
+        self.logger.log_action(f"Запуск генерации... Ожидание {generation_wait} сек...")
+
+        if check_image_enabled:
+            # Умное ожидание с проверкой изображения
+            self.logger.log_action("🔍 Режим умного ожидания с проверкой изображения")
             
-            # 6. Запускаем генерацию
-            self.logger.log_action("Запуск генерации (Ctrl+Enter)")
-            pyautogui.hotkey('ctrl', 'enter')
-            time.sleep(DELAYS['BETWEEN_CLICKS'])
+            # Сначала ждём минимальное время для начала генерации
+            initial_wait = min(5, generation_wait // 2)
+            self.logger.log_action(f"⏳ Начальное ожидание {initial_wait} сек для запуска генерации...")
             
-            # 7. Ожидание генерации с умной проверкой
-            generation_wait = self.settings_manager.get('GENERATION_WAIT')
-            check_image_enabled = self.settings_manager.get('CHECK_IMAGE_GENERATED')
+            for i in range(int(initial_wait)):
+                if stop_event.is_set():
+                    return False
+                time.sleep(1)
             
-            # Защита от None значений
-            if generation_wait is None:
-                generation_wait = 20.0  # Значение по умолчанию
-                self.logger.log_action("⚠️ GENERATION_WAIT был None, используется значение по умолчанию: 20.0 сек")
+            # Затем проверяем изображение с интервалами
+            max_attempts = self.settings_manager.get('IMAGE_CHECK_ATTEMPTS')
+            check_delay = self.settings_manager.get('IMAGE_CHECK_DELAY')
             
-            if check_image_enabled is None:
-                check_image_enabled = True  # Значение по умолчанию
-                self.logger.log_action("⚠️ CHECK_IMAGE_GENERATED был None, используется значение по умолчанию: True")
+            # Защита от None значений
+            if max_attempts is None:
+                max_attempts = 3
+                self.logger.log_action("⚠️ IMAGE_CHECK_ATTEMPTS был None, используется значение по умолчанию: 3")
             
-            self.logger.log_action(f"Запуск генерации... Ожидание {generation_wait} сек...")
+            if check_delay is None:
+                check_delay = 5
+                self.logger.log_action("⚠️ IMAGE_CHECK_DELAY был None, используется значение по умолчанию: 5 сек")
             
-            if check_image_enabled:
-                # Умное ожидание с проверкой изображения
-                self.logger.log_action("🔍 Режим умного ожидания с проверкой изображения")
-                
-                # Сначала ждём минимальное время для начала генерации
-                initial_wait = min(5, generation_wait // 2)
-                self.logger.log_action(f"⏳ Начальное ожидание {initial_wait} сек для запуска генерации...")
-                
-                for i in range(int(initial_wait)):
-                    if stop_event.is_set():
-                        return False
-                    time.sleep(1)
-                
-                # Затем проверяем изображение с интервалами
-                max_attempts = self.settings_manager.get('IMAGE_CHECK_ATTEMPTS')
-                check_delay = self.settings_manager.get('IMAGE_CHECK_DELAY')
-                
-                # Защита от None значений
-                if max_attempts is None:
-                    max_attempts = 3
-                    self.logger.log_action("⚠️ IMAGE_CHECK_ATTEMPTS был None, используется значение по умолчанию: 3")
-                
-                if check_delay is None:
-                    check_delay = 5
-                    self.logger.log_action("⚠️ IMAGE_CHECK_DELAY был None, используется значение по умолчанию: 5 сек")
+            for attempt in range(max_attempts):
+                if stop_event.is_set():
+                    return False
                 
-                for attempt in range(max_attempts):
-                    if stop_event.is_set():
-                        return False
-                    
-                    self.logger.log_action(f"🔍 Проверка изображения (попытка {attempt + 1}/{max_attempts})...")
-                    
-                    if self.check_image_generated():
-                        self.logger.log_action("✅ Изображение сгенерировано! Переходим к сохранению.")
-                        break
-                    
-                    if attempt < max_attempts - 1:
-                        self.logger.log_action(f"⏳ Изображение ещё генерируется... Ждём {check_delay} сек...")
-                        for i in range(int(check_delay)):
-                            if stop_event.is_set():
-                                return False
-                            time.sleep(1)
-                    else:
-                        self.logger.log_action("⚠️ Изображение не обнаружено после всех попыток, но продолжаем сохранение")
-            else:
-                # Простое ожидание без проверки
-                self.logger.log_action(f"⏳ Простое ожидание {generation_wait} сек (проверка отключена)...")
+                self.logger.log_action(f"🔍 Проверка изображения (попытка {attempt + 1}/{max_attempts})...")
                 
-                for i in range(int(generation_wait)):
-                    if stop_event.is_set():
-                        return False
-                    time.sleep(1)
-                    if i % 5 == 0 and i > 0:  # Каждые 5 секунд показываем прогресс
-                        self.logger.log_action(f"⏳ Прошло {i}/{generation_wait} сек...")
+                if self.check_image_generated():
+                    self.logger.log_action("✅ Изображение сгенерировано! Переходим к сохранению.")
+                    break
                 
-                self.logger.log_action("⏳ Ожидание завершено, переходим к сохранению")
-            
-            # 9. Сохранение изображения
-            if not self.save_image_as(filename):
-                return False
+                if attempt < max_attempts - 1:
+                    self.logger.log_action(f"⏳ Изображение ещё генерируется... Ждём {check_delay} сек...")
+                    for i in range(int(check_delay)):
+                        if stop_event.is_set():
+                            return False
+                        time.sleep(1)
+                else:
+                    self.logger.log_action("⚠️ Изображение не обнаружено после всех попыток, но продолжаем сохранение")
+        else:
+            # Простое ожидание без проверки
+            self.logger.log_action(f"⏳ Простое ожидание {generation_wait} сек (проверка отключена)...")
             
-            self.logger.log_action(f"✓ Генерация {chat_name} завершена успешно")
-            return True
+            for i in range(int(generation_wait)):
+                if stop_event.is_set():
+                    return False
+                time.sleep(1)
+                if i % 5 == 0 and i > 0:  # Каждые 5 секунд показываем прогресс
+                    self.logger.log_action(f"⏳ Прошло {i}/{generation_wait} сек...")
             
-        except Exception as e:
-            self.logger.log_action(f"✗ ОШИБКА в генерации {chat_name}: {e}")
-            return False
+            self.logger.log_action("⏳ Ожидание завершено, переходим к сохранению")
+
+        return True
 
     def generate_pair(self, card_number: int, card_name: str, pair_number: int,
                      prompts_dict: dict, stop_event) -> int:
@@ -431,9 +729,11 @@ class MultiFormatGenerator:
             
             # Генерация лицевой стороны (4:3)
             self.logger.log_action(f"Генерация лицевой стороны пары {pair_number}")
-            if self.generate_single_side(card_number, card_name, pair_number, 'лицо', 
-                                       prompts_dict['лицо'], '4:3', stop_event):
+            front_success = self.generate_single_side(card_number, card_name, pair_number, 'лицо',
+                                                      prompts_dict['лицо'], '4:3', stop_event)
+            if front_success:
                 success_count += 1
+            self.track_generation_result(front_success, stop_event)
             
             if stop_event.is_set():
                 return success_count
@@ -441,13 +741,15 @@ class MultiFormatGenerator:
             # Пауза между генерациями
             if success_count > 0:  # Только если первая генерация прошла успешно
                 self.logger.log_action("Пауза между генерациями пары")
-                time.sleep(DELAYS['BETWEEN_GENERATIONS'])
+                self.ui_waiter.pause(DELAYS['BETWEEN_GENERATIONS'], stop_event)
             
             # Генерация оборотной стороны (3:2)
             self.logger.log_action(f"Генерация оборотной стороны пары {pair_number}")
-            if self.generate_single_side(card_number, card_name, pair_number, 'оборот', 
-                                       prompts_dict['оборот'], '3:2', stop_event):
+            back_success = self.generate_single_side(card_number, card_name, pair_number, 'оборот',
+                                                     prompts_dict['оборот'], '3:2', stop_event)
+            if back_success:
                 success_count += 1
+            self.track_generation_result(back_success, stop_event)
             
             self.logger.log_action(f"✓ Пара {pair_number} завершена: {success_count}/2 изображений")
             return success_count
@@ -495,7 +797,7 @@ class MultiFormatGenerator:
                 # Пауза между парами (кроме последней)
                 if pair_index < len(pairs_list) and not stop_event.is_set():
                     self.logger.log_action("Пауза между парами")
-                    time.sleep(DELAYS['BETWEEN_GENERATIONS'])
+                    self.ui_waiter.pause(DELAYS['BETWEEN_GENERATIONS'], stop_event)
             
             self.logger.log_action(f"✓ Карточка #{card_number} завершена: {processed_pairs}/{len(pairs_list)} пар, {total_images} изображений")
             return processed_pairs, total_images
@@ -504,19 +806,189 @@ class MultiFormatGenerator:
             self.logger.log_action(f"✗ ОШИБКА при обработке карточки #{card_number}: {e}")
             return 0, 0
 
+    def start_reference_cache(self, side_jobs):
+        """
+        Кэш референсов и фоновая подготовка (REFERENCE_CACHE_MB, REFERENCE_PREFETCH).
+        
+        Порядок карточек для подготовки - порядок задач (JOB_ORDER), первая карточка готовится сразу.
+        """
+        self.reference_cache = self.reference_prefetcher = None
+        self.clipboard.image_cache = None
+        cache_mb = self.settings_manager.get('REFERENCE_CACHE_MB') or 0
+        if cache_mb <= 0:
+            return
+        
+        # В кэше - данные в том виде, в каком их отправляет бэкенд буфера обмена (без перекодирования при вставке)
+        try:
+            image_backend = self.clipboard.get_image_backend()
+        except ValueError as e:
+            self.logger.log_action(f"⚠️ Бэкенд буфера обмена: {e}")
+            image_backend = None
+        if image_backend is not None:
+            self.reference_cache = ReferenceCache(int(cache_mb * 1024 * 1024), image_backend.encode_payload)
+        else:
+            self.reference_cache = ReferenceCache(int(cache_mb * 1024 * 1024))
+        self.clipboard.image_cache = self.reference_cache
+        
+        if self.settings_manager.get('REFERENCE_PREFETCH'):
+            card_order = []
+            seen_cards = set()
+            for job in side_jobs:
+                card = (job['card_number'], job['card_name'])
+                if card not in seen_cards:
+                    seen_cards.add(card)
+                    card_order.append(card)
+            if card_order:
+                self.reference_prefetcher = ReferencePrefetcher(self.reference_cache, card_order, self.get_reference_path)
+                self.reference_prefetcher.prefetch_card(*card_order[0])
+        self.logger.log_action(f"🗂️ Кэш референсов: до {cache_mb} МБ, "
+                               f"фоновая подготовка {'включена' if self.reference_prefetcher else 'выключена'}")
+    
+    def run_pipeline(self, side_jobs, tab_count: int, stop_event) -> list:
+        """
+        Конвейерная генерация по нескольким вкладкам (PIPELINE_TABS > 1).
+
+        Returns:
+            list: (job, success) в порядке завершения
+        """
+        from core.pipeline import TabPipeline
+
+        pipeline = TabPipeline(self, tab_count)
+        return pipeline.run(side_jobs, stop_event)
+
+    def run_side_jobs(self, side_jobs, stop_event) -> list:
+        """
+        Последовательная генерация задач сторон (из очереди задач или build_side_jobs).
+
+        Returns:
+            list: (job, success) в порядке выполнения
+        """
+        results = []
+        previous_job = None
+        for job in side_jobs:
+            if stop_event.is_set():
+                break
+
+            if previous_job is not None:
+                if previous_job['card_number'] != job['card_number']:
+                    self.ui_waiter.pause(DELAYS['BETWEEN_CARDS'], stop_event)
+                else:
+                    self.logger.log_action("Пауза между генерациями")
+                    self.ui_waiter.pause(DELAYS['BETWEEN_GENERATIONS'], stop_event)
+                if stop_event.is_set():
+                    # Захваченная задача не выполнялась - возвращаем её в очередь при следующем запуске
+                    break
+
+            success = self.generate_single_side(job['card_number'], job['card_name'], job['pair_number'],
+                                                job['side'], job['prompt'], job['format_ratio'], stop_event)
+            self.complete_job(job, success, stop_event)
+            results.append((job, success))
+            previous_job = job
+        return results
+
+    def complete_job(self, job: dict, success: bool, stop_event):
+        """Учёт результата задачи: серия неудач, очередь задач, отложенный повтор, прогресс линии"""
+        self.track_generation_result(success, stop_event)
+        reason = '' if success else (self.last_failure_reason or "неизвестная ошибка")
+
+        if self.job_queue is not None and 'id' in job:
+            if success:
+                self.job_queue.mark_done(job['id'])
+            elif not stop_event.is_set():
+                self.job_queue.mark_failed(job['id'], reason)
+
+        # Неудача не задерживает основной проход - повтор после него
+        if not success and not stop_event.is_set() and self.retry_queue is not None:
+            self.retry_queue.push(job, reason)
+
+        self.report_job_progress(job, success)
+
+    def iter_retries(self, stop_event):
+        """Неудачные задачи из RetryQueue по одной, с паузой до их времени повтора"""
+        while not stop_event.is_set():
+            next_retry = self.retry_queue.pop()
+            if next_retry is None:
+                return
+
+            ready_at, job = next_retry
+            wait_time = ready_at - time.time()
+            if wait_time > 0:
+                self.logger.log_action(f"⏳ Пауза перед повтором ({format_job(job)}): {wait_time:.0f} сек")
+                if not self.ui_waiter.pause(wait_time, stop_event):
+                    return
+
+            if self.job_queue is not None and 'id' in job:
+                job = self.job_queue.claim_job(job['id'])
+                if job is None:
+                    continue
+            else:
+                job = dict(job, attempts=(job.get('attempts') or 1) + 1)
+            self.logger.log_action(f"🔁 Повтор: {format_job(job)}, попытка {get_run_attempts(job)}")
+            yield job
+
+    def summarize_results(self, cards_to_process_list, results: list) -> tuple:
+        """
+        Итоги по карточкам и парам (пара обработана, если сохранена хотя бы одна сторона).
+
+        Returns:
+            tuple: (обработано карточек, обработано пар, создано изображений)
+        """
+        images_by_card = {}
+        pairs_done = set()
+        for job, success in results:
+            if success:
+                images_by_card[job['card_number']] = images_by_card.get(job['card_number'], 0) + 1
+                pairs_done.add((job['card_number'], job['pair_number']))
+        pairs_by_card = Counter(card_number for card_number, _ in pairs_done)
+
+        for card_number, card_name, pairs_list in cards_to_process_list:
+            if card_number not in images_by_card:
+                continue
+            card_pairs = pairs_by_card[card_number]
+            self.logger.log_action(f"✓ Карточка #{card_number}: {card_pairs}/{len(pairs_list)} пар, "
+                                   f"{images_by_card[card_number]} изображений")
+
+        return len(images_by_card), len(pairs_done), sum(images_by_card.values())
+
+    def log_remaining_time(self):
+        """Оценка оставшегося времени: незавершённые задачи × среднее время выполненной задачи из очереди"""
+        average_duration = self.job_queue.get_average_duration()
+        if not average_duration:
+            return
+        counts = self.job_queue.get_counts(current_run=True)
+        remaining_jobs = counts[STATE_PENDING] + counts[STATE_FAILED]
+        if remaining_jobs:
+            self.logger.log_action(f"⏳ Осталось примерно {remaining_jobs * average_duration / 60:.0f} мин "
+                                   f"({remaining_jobs} задач по {average_duration:.0f} сек)")
+
+    def report_job_progress(self, job: dict, success: bool):
+        """Передача результата задачи планировщику линий (если работаем линией)"""
+        if self.progress_queue is not None:
+            self.progress_queue.put({
+                'lane': self.lane_name,
+                'card_number': job['card_number'],
+                'pair_number': job['pair_number'],
+                'side': job['side'],
+                'success': success,
+            })
+
     def automation_worker(self, stop_event, start_card: int,
                          check_image_enabled: bool,
                          generation_wait: float,
-                         cards_to_process: int):
+                         cards_to_process: int,
+                         cards_to_process_list: list = None):
         """
         Главный рабочий процесс (точка входа для Process).
 
-        Использует обновлённый FileHandler для получения структуры
-        с парами промптов.
+        Карточки берутся из FileHandler.get_card_source: с кэшем разбора - CardSource,
+        который читает карточки пачками при каждом проходе, без кэша - список.
+        Линия параллельного режима передаёт свою часть карточек в cards_to_process_list.
         """
         # Ленивый импорт для избежания циклических зависимостей
         from core.file_handler import FileHandler
         
+        # Задержки могла обновить калибровка (отдельный процесс) после импорта в основном процессе
+        get_coordinates_manager().reload_delays()
         generation_mode = self.settings_manager.get('GENERATION_MODE')
         
         # Определяем название режима
@@ -529,14 +1001,15 @@ class MultiFormatGenerator:
         self.logger.log_action(f"⚙️ Настройки: старт={start_card}, лимит={cards_to_process}, проверка={check_image_enabled}")
         self.logger.log_action(f"🎯 Режим: {mode_name}")
         
-        file_handler = FileHandler(self.settings_manager)
-        cards_to_process_list = file_handler.get_cards_to_process()
+        if cards_to_process_list is None:
+            file_handler = FileHandler(self.settings_manager)
+            cards_to_process_list = file_handler.get_card_source()
         
-        print(f"[ГЕНЕРАТОР] Получен список карточек: {len(cards_to_process_list)}")
-        for i, (card_num, card_name, pairs_list) in enumerate(cards_to_process_list):
-            print(f"[ГЕНЕРАТОР] Карточка {i+1}: номер={card_num} ({card_name}), пар={len(pairs_list)}")
+        # Отдельный подсчёт: с CardSource - запрос COUNT, тексты промптов не читаются
+        total_cards, total_pairs = count_cards(cards_to_process_list)
+        print(f"[ГЕНЕРАТОР] Получено карточек: {total_cards}, пар: {total_pairs}")
         
-        if not cards_to_process_list:
+        if not total_cards:
             self.logger.log_action(f"КРИТИЧЕСКАЯ ОШИБКА: Нет карточек для обработки начиная с №{start_card}!")
             return
         
@@ -545,26 +1018,24 @@ class MultiFormatGenerator:
             self.logger.log_action("🔍 Проверка наличия референсов...")
             missing_refs = []  # Список проблемных референсов
             
-            # Проверяем наличие папок
-            face_dir = os.path.join('data', 'images', 'лицо')
-            back_dir = os.path.join('data', 'images', 'оборот')
+            # Одно сканирование папок на весь запуск
+            self.reference_index = ReferenceIndex().build()
+            for missing_dir in self.reference_index.missing_dirs:
+                self.logger.log_action(f"⚠️ Папка с референсами не найдена: {missing_dir}")
+            self.logger.log_action(f"🗂️ Индекс референсов: {len(self.reference_index)} файлов")
             
-            if not os.path.exists(face_dir):
-                self.logger.log_action(f"⚠️ Папка с референсами для лицевой стороны не найдена: {face_dir}")
-            if not os.path.exists(back_dir):
-                self.logger.log_action(f"⚠️ Папка с референсами для оборотной стороны не найдена: {back_dir}")
-            
-            # Проверяем наличие файлов референсов для всех карточек
+            found_refs = []  # (card_number, card_name, side, format_ratio, ref_path) для проверки файлов
             for card_number, card_name, pairs_list in cards_to_process_list:
-                # Проверяем лицевую сторону
-                face_ref = self.get_reference_path(card_number, card_name, 'лицо')
-                if not face_ref:
-                    missing_refs.append(f"Карточка {card_number} ({card_name}) - лицо")
-                
-                # Проверяем оборотную сторону
-                back_ref = self.get_reference_path(card_number, card_name, 'оборот')
-                if not back_ref:
-                    missing_refs.append(f"Карточка {card_number} ({card_name}) - оборот")
+                for side in REFERENCE_SIDES:
+                    ref_path = self.reference_index.find(card_number, card_name, side)
+                    if ref_path:
+                        found_refs.append((card_number, card_name, side, dict(SIDE_FORMATS)[side], ref_path))
+                        continue
+                    missing = f"Карточка {card_number} ({card_name}) - {side}"
+                    near_misses = self.reference_index.find_near_misses(card_number, card_name, side)
+                    if near_misses:
+                        missing += f" (похожие файлы: {', '.join(near_misses)})"
+                    missing_refs.append(missing)
             
             # Выводим список проблемных референсов
             if missing_refs:
@@ -575,38 +1046,130 @@ class MultiFormatGenerator:
                 print(f"[ГЕНЕРАТОР] ⚠️ Не найдено референсов: {len(missing_refs)} шт.")
             else:
                 self.logger.log_action("✓ Все референсы найдены")
-                print(f"[ГЕНЕРАТОР] ✓ Все референсы найдены ({len(cards_to_process_list) * 2} файлов)")
+                print(f"[ГЕНЕРАТОР] ✓ Все референсы найдены ({total_cards * 2} файлов)")
+            
+            if self.settings_manager.get('REFERENCE_PREFLIGHT'):
+                self.check_reference_files(found_refs)
+            
+            # Большие референсы вставляются уменьшенными (кэш на диске переживает перезапуск)
+            max_side = self.settings_manager.get('REFERENCE_MAX_SIDE') or 0
+            if max_side > 0:
+                self.reference_normalizer = ReferenceNormalizer(
+                    self.settings_manager.get('REFERENCE_NORMALIZED_FOLDER') or 'data/ref_cache', max_side)
+                self.logger.log_action(f"🗜️ Референсы больше {max_side} px вставляются уменьшенными")
         
-        # Подсчет общего количества пар и изображений
-        total_pairs = sum(len(pairs_list) for _, _, pairs_list in cards_to_process_list)
+        # Подсчет общего количества изображений
         total_images = total_pairs * 2  # Каждая пара = 2 изображения
         
         self.logger.log_action(f"📍 Начинаем с карточки #{start_card}")
-        self.logger.log_action(f"📊 Будет обработано {len(cards_to_process_list)} карточек")
+        self.logger.log_action(f"📊 Будет обработано {total_cards} карточек")
         self.logger.log_action(f"🔗 Найдено {total_pairs} пар промптов")
         self.logger.log_action(f"🖼️ Будет создано {total_images} изображений")
         
-        processed_cards = 0
-        processed_pairs = 0
-        total_images_created = 0
+        from core.job_queue import JobQueue
+        from core.output_index import load_output_index
+        from core.pipeline import JOB_ORDER_FORMAT, iter_side_jobs
         
-        for card_number, card_name, pairs_list in cards_to_process_list:
-            if stop_event.is_set():
-                self.logger.log_action("Получен сигнал остановки")
-                break
-            
-            pairs_done, images_created = self.process_card(card_number, card_name, pairs_list, stop_event)
-            if pairs_done > 0:
-                processed_cards += 1
-                processed_pairs += pairs_done
-                total_images_created += images_created
-            
-            # Пауза между карточками (кроме последней)
-            if (card_number, pairs_list) != cards_to_process_list[-1] and not stop_event.is_set():
-                time.sleep(DELAYS['BETWEEN_CARDS'])
+        job_order = self.settings_manager.get('JOB_ORDER')
+        batch_cards = self.settings_manager.get('JOB_ORDER_BATCH_CARDS') or 0
+        
+        def iter_jobs():
+            # Каждый вызов - новый проход по карточкам, задачи не собираются в список
+            return iter_side_jobs(cards_to_process_list, job_order, batch_cards)
+        
+        if job_order == JOB_ORDER_FORMAT:
+            batch_description = f"пачки по {batch_cards} карточек" if batch_cards else "весь запуск одной пачкой"
+            self.logger.log_action(f"🔀 Порядок задач: по форматам ({batch_description})")
+        
+        # Готовые файлы в SAVE_FOLDER: одно сканирование папки, дальше - проверка по множеству имён
+        self.output_index = load_output_index(self.settings_manager)
+        if self.output_index is not None:
+            existing_count = sum(1 for job in iter_jobs() if self.output_index.contains(job['filename']))
+            self.logger.log_action(f"⏭️ Уже сохранено: {existing_count}/{total_images}, "
+                                   f"к генерации: {total_images - existing_count}")
+        
+        if generation_mode == 'multi_format_with_refs':
+            # Готовые стороны не генерируются - их референсы заранее не кодируем
+            self.start_reference_cache(job for job in iter_jobs()
+                                       if self.output_index is None or not self.output_index.contains(job['filename']))
+        
+        if self.settings_manager.get('JOB_QUEUE_ENABLED'):
+            # Состояние задач в SQLite: перезапуск продолжает с места остановки
+            self.job_queue = JobQueue(self.settings_manager.get('JOB_QUEUE_FILE') or 'data/jobs.sqlite')
+            if self.lane_name is None:
+                # Линии делят один файл - незавершённые задачи возвращает ProcessManager до их запуска
+                self.job_queue.recover_running()
+            # Задачи пишутся в очередь пачками - промпты остаются только в SQLite
+            for jobs_batch in iter_batches(iter_jobs(), JOB_SYNC_BATCH_SIZE):
+                batch_keys = self.job_queue.sync_jobs(jobs_batch)
+                if self.output_index is not None:
+                    # Файлы - источник истины: готовые закрываем, удалённые или битые генерируем заново
+                    self.job_queue.mark_keys_done([job_key for job_key, job in zip(batch_keys, jobs_batch)
+                                                   if self.output_index.contains(job['filename'])])
+                    self.job_queue.reopen_keys([job_key for job_key, job in zip(batch_keys, jobs_batch)
+                                                if not self.output_index.contains(job['filename'])])
+            self.logger.log_action(f"🗃️ Очередь задач: {self.job_queue.format_counts(current_run=True)}")
+            self.log_remaining_time()
+            side_jobs = self.job_queue.iter_claims(stop_event)
+        elif self.output_index is not None:
+            side_jobs = (job for job in iter_jobs() if not self.output_index.contains(job['filename']))
+        else:
+            side_jobs = iter_jobs()
+        
+        pipeline_tabs = self.settings_manager.get('PIPELINE_TABS') or 1
+        if pipeline_tabs > 1 and not self.settings_manager.get('COMPLETION_DETECTION'):
+            self.logger.log_action("⚠️ Конвейер по вкладкам требует COMPLETION_DETECTION, работаем последовательно")
+            pipeline_tabs = 1
+        
+        self.retry_queue = RetryQueue(
+            self.settings_manager.get('RETRY_MAX_ATTEMPTS') or 1,
+            self.settings_manager.get('RETRY_BASE_DELAY') or 30.0,
+            self.settings_manager.get('RETRY_MAX_DELAY') or 300.0,
+        )
+        
+        if pipeline_tabs > 1:
+            results = self.run_pipeline(side_jobs, pipeline_tabs, stop_event)
+        else:
+            results = self.run_side_jobs(side_jobs, stop_event)
+        
+        # Повторы неудачных сторон - после основного прохода, последовательно
+        if len(self.retry_queue) and not stop_event.is_set():
+            self.logger.log_action(f"🔁 Повтор неудачных сторон: {len(self.retry_queue)}")
+            results += self.run_side_jobs(self.iter_retries(stop_event), stop_event)
+        
+        if stop_event.is_set():
+            self.logger.log_action("Получен сигнал остановки")
+        
+        processed_cards, processed_pairs, total_images_created = self.summarize_results(cards_to_process_list, results)
         
         self.logger.log_action(f"========== 📋 ОТЧЁТ ==========")
-        self.logger.log_action(f"📦 Обработано карточек: {processed_cards}/{len(cards_to_process_list)}")
+        self.logger.log_action(f"📦 Обработано карточек: {processed_cards}/{total_cards}")
         self.logger.log_action(f"🔗 Обработано пар: {processed_pairs}/{total_pairs}")
         self.logger.log_action(f"🖼️ Создано изображений: {total_images_created}/{total_images}")
+        if self.job_queue is not None:
+            self.logger.log_action(f"🗃️ Очередь задач: {self.job_queue.format_counts(current_run=True)}")
+        for job in self.retry_queue.abandoned_jobs:
+            reasons = "; ".join(self.retry_queue.failure_reasons.get(get_job_key(job), []))
+            self.logger.log_action(f"❌ Не сгенерировано ({format_job(job)}): {reasons}")
+        self.logger.log_action(f"📸 Захват экрана: {self.completion_detector.screen_capture.format_metrics()}")
+        self.logger.log_action(f"⌨️ Ввод: {self.input_driver.format_metrics()}")
+        image_metrics = self.clipboard.format_image_metrics()
+        if image_metrics:
+            self.logger.log_action(f"📋 Референсы в буфер: {image_metrics}")
+        if self.reference_cache is not None:
+            self.logger.log_action(f"🗂️ Кэш референсов: {self.reference_cache.format_metrics()}")
+        if self.reference_normalizer is not None:
+            self.logger.log_action(f"🗜️ Уменьшение референсов: {self.reference_normalizer.format_metrics()}")
+        if self.reference_paste_times:
+            average_paste = sum(self.reference_paste_times) / len(self.reference_paste_times)
+            self.logger.log_action(f"📎 Вставка референса: в среднем {average_paste:.2f} сек, "
+                                   f"максимум {max(self.reference_paste_times):.2f} сек ({len(self.reference_paste_times)} раз)")
+        if self.reference_prefetcher is not None:
+            self.reference_prefetcher.close()
+        self.clipboard.close()
+        if self.skipped_ui_actions:
+            skipped_actions = ", ".join(f"{action} {count}" for action, count in sorted(self.skipped_ui_actions.items()))
+            self.logger.log_action(f"🧭 Пропущено действий UI (результат уже на экране): {skipped_actions}")
+        for report_line in self.ui_waiter.format_report():
+            self.logger.log_action(f"⚡ Ожидание UI: {report_line}")
         self.logger.log_action(f"===========================")
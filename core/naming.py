@@ -0,0 +1,34 @@
+"""
+Имена чатов и файлов генераций (единое место: генераторы, индекс готовых файлов, очередь задач)
+"""
+
+
+def safe_card_name(card_name):
+    """Название карточки без пробелов и разделителей пути - для имени файла"""
+    return card_name.replace(' ', '_').replace('/', '_').replace('\\', '_')
+
+
+def side_chat_name(card_number, card_name, side, pair_number):
+    """Формат названия: Карточка № - НАЗВАНИЕ - сторона - Промпт №"""
+    return f"Карточка {card_number} - {card_name} - {side} - Промпт {pair_number}"
+
+
+def reused_chat_name(card_number, card_name, pair_number):
+    """Формат названия общего чата (CHAT_REUSE_MODE): Карточка № - НАЗВАНИЕ - с промпта №"""
+    return f"Карточка {card_number} - {card_name} - с промпта {pair_number}"
+
+
+def side_filename(card_number, card_name, side, pair_number, format_ratio):
+    """Формат файла: Карточка_№_НАЗВАНИЕ_сторона_промпт_№_формат.png"""
+    return (f"Карточка_{card_number}_{safe_card_name(card_name)}_{side}_промпт_{pair_number}_"
+            f"{format_ratio.replace(':', 'x')}.png")
+
+
+def generation_chat_name(card_number, card_name, generation_number):
+    """Формат названия (стандартный режим): Карточка № - НАЗВАНИЕ - генерация №"""
+    return f"Карточка {card_number} - {card_name} - генерация {generation_number}"
+
+
+def generation_filename(card_number, card_name, generation_number):
+    """Формат файла (стандартный режим): Карточка_№_НАЗВАНИЕ_генерация_№.png"""
+    return f"Карточка_{card_number}_{safe_card_name(card_name)}_генерация_{generation_number}.png"
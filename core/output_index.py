@@ -0,0 +1,84 @@
+"""
+Индекс уже сохранённых изображений: повторный запуск не тратит генерации на готовые файлы
+"""
+import os
+from PIL import Image
+from utils.logger import Logger
+
+# Расширения файлов, которые сохраняет браузер
+OUTPUT_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+
+
+class OutputIndex:
+    """
+    Готовые файлы SAVE_FOLDER в памяти (множество имён).
+
+    Папка читается один раз (os.scandir) при build(). Файл считается готовым,
+    если он не меньше min_size байт и Pillow его декодирует - недописанный
+    или битый файл будет сгенерирован заново.
+    """
+
+    def __init__(self, save_folder, min_size=1024):
+        self.save_folder = save_folder
+        self.min_size = min_size
+        self.logger = Logger()
+        self.filenames = set()
+        self.invalid_filenames = []
+
+    def build(self):
+        """
+        Сканирование папки сохранения.
+
+        Returns:
+            OutputIndex: self (для цепочки OutputIndex(...).build())
+        """
+        self.filenames = set()
+        self.invalid_filenames = []
+        if not self.save_folder or not os.path.isdir(self.save_folder):
+            self.logger.log_action(f"⚠️ Папка сохранения не найдена, индекс готовых файлов пуст: {self.save_folder}")
+            return self
+
+        with os.scandir(self.save_folder) as entries:
+            for entry in entries:
+                if not entry.is_file() or not entry.name.lower().endswith(OUTPUT_EXTENSIONS):
+                    continue
+                if entry.stat().st_size >= self.min_size and self.is_decodable(entry.path):
+                    self.filenames.add(entry.name)
+                else:
+                    self.invalid_filenames.append(entry.name)
+
+        self.logger.log_action(f"🗂️ Индекс готовых файлов: {len(self.filenames)} в {self.save_folder}"
+                               + (f", повреждённых: {len(self.invalid_filenames)}" if self.invalid_filenames else ""))
+        return self
+
+    def is_decodable(self, path):
+        """Проверка, что Pillow читает файл целиком (заголовок и структура)"""
+        try:
+            with Image.open(path) as image:
+                image.verify()
+            return True
+        except Exception:
+            return False
+
+    def contains(self, filename):
+        return filename in self.filenames
+
+    def add(self, filename):
+        """Учёт файла, сохранённого в текущем запуске"""
+        self.filenames.add(filename)
+
+
+def load_output_index(settings_manager):
+    """
+    Индекс готовых файлов по настройкам SKIP_EXISTING_OUTPUTS, SAVE_FOLDER и OUTPUT_MIN_SIZE.
+
+    Returns:
+        OutputIndex: построенный индекс или None, если пропуск готовых файлов выключен
+    """
+    if not settings_manager.get('SKIP_EXISTING_OUTPUTS'):
+        return None
+    save_folder = settings_manager.get('SAVE_FOLDER')
+    if not save_folder:
+        Logger().log_action("⚠️ SAVE_FOLDER не задана - готовые файлы не проверяются")
+        return None
+    return OutputIndex(save_folder, settings_manager.get('OUTPUT_MIN_SIZE') or 1024).build()
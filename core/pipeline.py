@@ -0,0 +1,213 @@
+"""
+Конвейерная генерация по нескольким вкладкам браузера: ожидания генерации перекрываются
+"""
+import time
+from utils.logger import Logger
+from .naming import side_filename
+from .records import SIDE_FORMATS, SideJob
+from .ui_state import UIState
+
+# Порядок задач (JOB_ORDER)
+JOB_ORDER_PAIRS = 'pairs'    # По парам: лицо, оборот, лицо, оборот... - формат меняется на каждой стороне
+JOB_ORDER_FORMAT = 'format'  # По форматам: в пачке карточек сначала все лица 4:3, затем все обороты 3:2
+
+
+def build_side_jobs(cards_to_process_list):
+    """
+    Список задач на генерацию одной стороны из списка карточек FileHandler.
+
+    Returns:
+        list: SideJob (card_number, card_name, pair_number, side, format_ratio, prompt, filename)
+    """
+    side_jobs = []
+    for card_number, card_name, pairs_list in cards_to_process_list:
+        for pair_number, pair_dict in enumerate(pairs_list, 1):
+            for side, format_ratio in SIDE_FORMATS:
+                side_jobs.append(SideJob(card_number, card_name, pair_number, side, format_ratio, pair_dict[side],
+                                         side_filename(card_number, card_name, side, pair_number, format_ratio)))
+    return side_jobs
+
+
+def order_side_jobs(side_jobs, job_order, batch_cards=0):
+    """
+    Порядок задач для запуска.
+
+    В порядке JOB_ORDER_FORMAT карточки делятся на пачки по batch_cards (0 - весь запуск одной пачкой),
+    внутри пачки задачи идут по формату, затем по карточке и паре - формат меняется один раз на пачку.
+    Чем меньше пачка, тем раньше у карточки готовы обе стороны.
+
+    Returns:
+        list: задачи в порядке генерации
+    """
+    if job_order != JOB_ORDER_FORMAT:
+        return list(side_jobs)
+
+    card_positions = {}
+    for job in side_jobs:
+        card_positions.setdefault(job['card_number'], len(card_positions))
+    format_positions = {format_ratio: index for index, (_, format_ratio) in enumerate(SIDE_FORMATS)}
+
+    def sort_key(job):
+        card_position = card_positions[job['card_number']]
+        batch = card_position // batch_cards if batch_cards else 0
+        return (batch, format_positions.get(job['format_ratio'], len(format_positions)), card_position, job['pair_number'])
+
+    return sorted(side_jobs, key=sort_key)
+
+
+def iter_side_jobs(cards, job_order, batch_cards=0):
+    """
+    Задачи сторон по мере чтения карточек (генератор) - тот же порядок, что у
+    order_side_jobs(build_side_jobs(cards), job_order, batch_cards).
+
+    В памяти задачи одной карточки (JOB_ORDER_PAIRS) или одной пачки из batch_cards карточек
+    (JOB_ORDER_FORMAT); только batch_cards=0 (весь запуск одной пачкой) собирает все задачи сразу.
+    """
+    if job_order != JOB_ORDER_FORMAT:
+        for card in cards:
+            yield from build_side_jobs([card])
+        return
+    if not batch_cards:
+        yield from order_side_jobs(build_side_jobs(cards), job_order)
+        return
+
+    batch = []
+    for card in cards:
+        batch.append(card)
+        if len(batch) == batch_cards:
+            yield from order_side_jobs(build_side_jobs(batch), job_order)
+            batch = []
+    if batch:
+        yield from order_side_jobs(build_side_jobs(batch), job_order)
+
+
+class TabPipeline:
+    """
+    Отправляет промпты по очереди в N вкладок и сохраняет то изображение, которое готово первым.
+
+    Ввод (клики, клавиши) по-прежнему строго последовательный - одна вкладка за раз,
+    но пока в одной вкладке идёт генерация, в остальных уже отправлены следующие промпты.
+
+    Вкладки с AI Studio должны быть открыты заранее и идти первыми (переключение Ctrl+1..Ctrl+N).
+    """
+
+    def __init__(self, generator, tab_count):
+        self.generator = generator
+        self.tab_count = max(1, min(int(tab_count), 8))  # Ctrl+9 в браузере - последняя вкладка
+        self.logger = Logger()
+        self.current_tab = None
+        self.tab_switch_count = 0
+        # У каждой вкладки своё состояние интерфейса (чат, формат, фокус)
+        self.tab_states = [UIState(generator.settings_manager.get('FORMAT_KEPT_IN_NEW_CHAT'))
+                           for _ in range(self.tab_count)]
+
+    def switch_to_tab(self, tab_index):
+        """Переключение на вкладку tab_index (с 0)"""
+        if tab_index == self.current_tab:
+            return
+
+        ui_waiter = self.generator.ui_waiter
+        region_probe = ui_waiter.probe_region(self.generator.completion_detector.get_image_region())
+        self.generator.input_driver.hotkey('ctrl', str(tab_index + 1))
+        ui_waiter.wait_step(region_probe, 'TAB_SWITCH_WAIT', "переключение вкладки")
+        self.current_tab = tab_index
+        self.tab_switch_count += 1
+
+    def submit_next(self, tab_index, jobs_iterator, results, stop_event):
+        """
+        Отправка следующей задачи во вкладку.
+
+        Returns:
+            tuple: (job, submission) или None, если задачи закончились
+        """
+        for job in jobs_iterator:
+            if stop_event.is_set():
+                return None
+
+            self.switch_to_tab(tab_index)
+            self.logger.log_action(f"🗂️ Вкладка {tab_index + 1}: отправка")
+            self.generator.ui_state = self.tab_states[tab_index]
+            submission = self.generator.submit_side(job['card_number'], job['card_name'], job['pair_number'],
+                                                    job['side'], job['prompt'], job['format_ratio'], stop_event)
+            if submission is not None:
+                submission['wait_budget'] = self.get_wait_budget(submission)
+                # Время готовности видно только при проверке вкладки - с несколькими вкладками оно завышено
+                submission['record_latency'] = self.tab_count == 1
+                return job, submission
+
+            results.append((job, False))
+            self.generator.complete_job(job, False, stop_event)
+        return None
+
+    def get_wait_budget(self, submission):
+        """Бюджет ожидания генерации для отправки (по истории LatencyModel)"""
+        return self.generator.latency_model.get_wait_budget(
+            submission['generation_mode'], submission['format_ratio'], submission['reference_attached'],
+            self.generator.settings_manager.get('GENERATION_TIMEOUT') or 90.0
+        )
+
+    def run(self, side_jobs, stop_event):
+        """
+        Конвейерная обработка задач.
+
+        Args:
+            side_jobs: итерируемый набор задач (см. build_side_jobs)
+            stop_event: событие остановки
+
+        Returns:
+            list: (job, success) в порядке завершения
+        """
+        settings_manager = self.generator.settings_manager
+        poll_interval = settings_manager.get('COMPLETION_POLL_INTERVAL') or 0.5
+        stable_polls = settings_manager.get('COMPLETION_STABLE_POLLS') or 3
+        # Минимальное время на подтверждение стабильности уже появившегося изображения
+        confirm_timeout = poll_interval * (stable_polls + 2)
+
+        self.logger.log_action(f"🗂️ Конвейер по {self.tab_count} вкладкам")
+
+        jobs_iterator = iter(side_jobs)
+        results = []
+        slots = [None] * self.tab_count  # tab_index -> (job, submission)
+
+        for tab_index in range(self.tab_count):
+            slots[tab_index] = self.submit_next(tab_index, jobs_iterator, results, stop_event)
+
+        while any(slots) and not stop_event.is_set():
+            harvested = False
+
+            # Сначала проверяем самые давние отправки - они, скорее всего, готовы первыми
+            busy_tabs = sorted((tab_index for tab_index in range(self.tab_count) if slots[tab_index]),
+                               key=lambda tab_index: slots[tab_index][1]['submitted_at'])
+
+            for tab_index in busy_tabs:
+                if stop_event.is_set():
+                    break
+
+                job, submission = slots[tab_index]
+                self.switch_to_tab(tab_index)
+
+                wait_budget = submission['wait_budget']
+                elapsed = time.time() - submission['submitted_at']
+                appeared = self.generator.completion_detector.check_image_appeared(
+                    submission['baseline_frame'], submission.get('previous_result_frame'))
+
+                # None - область не снимается: harvest_side сам перейдёт на ожидание по времени
+                if appeared is False and elapsed < wait_budget:
+                    continue
+
+                self.logger.log_action(f"🗂️ Вкладка {tab_index + 1}: сбор результата через {elapsed:.1f} сек")
+                self.generator.ui_state = self.tab_states[tab_index]
+                success = self.generator.harvest_side(submission, stop_event,
+                                                      max(wait_budget - elapsed, confirm_timeout))
+                results.append((job, success))
+                self.generator.complete_job(job, success, stop_event)
+                harvested = True
+
+                # Вкладка освободилась - сразу отправляем в неё следующую задачу
+                slots[tab_index] = self.submit_next(tab_index, jobs_iterator, results, stop_event)
+
+            if not harvested:
+                self.generator.ui_waiter.pause(poll_interval, stop_event)
+
+        self.logger.log_action(f"🗂️ Конвейер завершён: {len(results)} задач, переключений вкладок: {self.tab_switch_count}")
+        return results
@@ -0,0 +1,349 @@
+"""
+Кэш разобранного файла промптов в SQLite: основной процесс и рабочие процессы не разбирают файл заново
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from .prompt_parser import parse_prompts_file
+from .records import Card, PromptPair, SharedTexts
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    """sha256 содержимого файла"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source_file:
+        for chunk in iter(lambda: source_file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parse_card_selection(selection):
+    """
+    Выбор карточек (CARD_SELECTION) в список диапазонов.
+
+    '11-20, 25, 40-' -> [(11, 20), (25, 25), (40, None)]; None - без верхней границы.
+
+    Raises:
+        ValueError: если выражение не разбирается
+    """
+    ranges = []
+    for part in selection.replace(';', ',').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            start, end = (value.strip() for value in part.split('-', 1))
+            card_range = (int(start), int(end) if end else None)
+        else:
+            card_range = (int(part), int(part))
+        if card_range[1] is not None and card_range[1] < card_range[0]:
+            raise ValueError(f"пустой диапазон карточек: {part}")
+        ranges.append(card_range)
+    if not ranges:
+        raise ValueError("пустой выбор карточек")
+    return ranges
+
+
+def card_in_ranges(card_number, ranges):
+    return any(start <= card_number and (end is None or card_number <= end) for start, end in ranges)
+
+
+def merge_ranges(ranges):
+    """Диапазоны по возрастанию без пересечений: [(11, 20), (15, 30), (40, None)] -> [(11, 30), (40, None)]"""
+    merged = []
+    for start, end in sorted(ranges, key=lambda card_range: card_range[0]):
+        if merged and (merged[-1][1] is None or start <= merged[-1][1] + 1):
+            previous_start, previous_end = merged[-1]
+            merged[-1] = (previous_start, None if previous_end is None or end is None else max(previous_end, end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def select_cards(all_prompts, ranges=None, start_card=1, cards_to_process=None):
+    """
+    Выбор карточек из уже загруженных промптов (без кэша): по диапазонам или
+    первые cards_to_process карточек, начиная со start_card.
+    """
+    selected_numbers = [card_number for card_number in sorted(all_prompts)
+                        if (card_in_ranges(card_number, ranges) if ranges else card_number >= start_card)]
+    if not ranges and cards_to_process is not None:
+        selected_numbers = selected_numbers[:cards_to_process]
+    return {card_number: all_prompts[card_number] for card_number in selected_numbers}
+
+
+class PromptCache:
+    """
+    Разобранные промпты в data/prompts_cache.sqlite (по строке на полную пару).
+
+    Запись действительна, пока у файла те же размер и mtime - проверка без чтения файла.
+    Если размер или mtime изменились, сравнивается хеш содержимого: файл, который только
+    пересохранили без изменений, заново не разбирается.
+
+    Строки пар лежат по ключу (path, card_number, pair_number): выбор диапазона
+    карточек (load_range, load_selection) читает только нужные строки по индексу,
+    iter_selection читает выбранные карточки пачками (core/card_source.py).
+
+    Соединение открывается на каждую операцию (как в JobQueue): кэш читают
+    основной процесс, рабочий процесс и параллельные линии.
+    """
+
+    def __init__(self, db_path='data/prompts_cache.sqlite'):
+        self.db_path = db_path
+        self.create_tables()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def create_tables(self):
+        """Создание таблиц кэша (если их нет)"""
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        connection = self._connect()
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS prompt_files (
+                    path TEXT PRIMARY KEY,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    encoding TEXT,
+                    report_lines TEXT NOT NULL,
+                    parsed_at REAL NOT NULL
+                )
+            """)
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS prompt_pairs (
+                    path TEXT NOT NULL,
+                    card_number INTEGER NOT NULL,
+                    card_name TEXT NOT NULL,
+                    pair_number INTEGER NOT NULL,
+                    face TEXT NOT NULL,
+                    back TEXT NOT NULL,
+                    PRIMARY KEY (path, card_number, pair_number)
+                )
+            """)
+        finally:
+            connection.close()
+
+    def get_file_row(self, path):
+        """
+        Запись кэша, если она соответствует текущему файлу.
+
+        Returns:
+            sqlite3.Row или None
+        """
+        connection = self._connect()
+        try:
+            return self._current_file_row(connection, os.path.abspath(path))
+        finally:
+            connection.close()
+
+    def _current_file_row(self, connection, abs_path):
+        """Запись кэша файла через открытое соединение (в том числе внутри транзакции store)"""
+        stat = os.stat(abs_path)
+        row = connection.execute("SELECT * FROM prompt_files WHERE path = ?", (abs_path,)).fetchone()
+        if row is None:
+            return None
+        if row['size'] == stat.st_size and row['mtime_ns'] == stat.st_mtime_ns:
+            return row
+        if row['size'] == stat.st_size and row['content_hash'] == hash_file(abs_path):
+            # Файл пересохранён без изменений - запоминаем новый mtime
+            connection.execute("UPDATE prompt_files SET mtime_ns = ? WHERE path = ?", (stat.st_mtime_ns, abs_path))
+            return row
+        return None
+
+    def _query_prompts(self, where, parameters):
+        """Промпты по условию: номер карточки -> (название, список пар PromptPair)"""
+        connection = self._connect()
+        try:
+            rows = connection.execute(
+                f"SELECT card_number, card_name, face, back FROM prompt_pairs WHERE path = ? AND {where} "
+                f"ORDER BY card_number, pair_number",
+                parameters
+            ).fetchall()
+        finally:
+            connection.close()
+
+        shared_texts = SharedTexts()
+        prompts = {}
+        for card_number, card_name, face, back in rows:
+            pair = PromptPair(shared_texts.share(face), shared_texts.share(back))
+            prompts.setdefault(card_number, (card_name, []))[1].append(pair)
+        return prompts
+
+    def load(self, path):
+        """Все промпты файла из кэша"""
+        return self._query_prompts("1", (os.path.abspath(path),))
+
+    def get_range_end(self, path, start_card, cards_to_process, end_card=None):
+        """
+        Номер последней из первых cards_to_process карточек с номером не меньше start_card
+        (и не больше end_card, если задан).
+
+        Returns:
+            int или None, если таких карточек нет
+        """
+        where = "path = ? AND card_number >= ?" + (" AND card_number <= ?" if end_card is not None else "")
+        parameters = (os.path.abspath(path), start_card) + ((end_card,) if end_card is not None else ())
+        connection = self._connect()
+        try:
+            row = connection.execute(
+                f"SELECT MAX(card_number) FROM (SELECT DISTINCT card_number FROM prompt_pairs "
+                f"WHERE {where} ORDER BY card_number LIMIT ?)",
+                parameters + (cards_to_process,)
+            ).fetchone()
+        finally:
+            connection.close()
+        return row[0]
+
+    def load_range(self, path, start_card, cards_to_process):
+        """Первые cards_to_process карточек с номером не меньше start_card"""
+        end_card = self.get_range_end(path, start_card, cards_to_process)
+        if end_card is None:
+            return {}
+        return self._query_prompts("card_number BETWEEN ? AND ?", (os.path.abspath(path), start_card, end_card))
+
+    def load_selection(self, path, ranges):
+        """Карточки из диапазонов parse_card_selection (каждый диапазон - отдельный запрос по индексу)"""
+        abs_path = os.path.abspath(path)
+        prompts = {}
+        for start, end in ranges:
+            if end is None:
+                prompts.update(self._query_prompts("card_number >= ?", (abs_path, start)))
+            else:
+                prompts.update(self._query_prompts("card_number BETWEEN ? AND ?", (abs_path, start, end)))
+        return {card_number: prompts[card_number] for card_number in sorted(prompts)}
+
+    def iter_selection(self, path, ranges, batch_size=100):
+        """
+        Карточки из диапазонов по возрастанию номера, пачками по batch_size карточек (генератор).
+
+        Каждая пачка - отдельный запрос по индексу от последней прочитанной карточки:
+        в памяти только текущая пачка, сколько бы карточек ни было выбрано.
+
+        Yields:
+            Card: (номер карточки, название, список пар)
+        """
+        abs_path = os.path.abspath(path)
+        for start, end in merge_ranges(ranges):
+            while True:
+                batch_end = self.get_range_end(path, start, batch_size, end)
+                if batch_end is None:
+                    break
+                batch = self._query_prompts("card_number BETWEEN ? AND ?", (abs_path, start, batch_end))
+                for card_number, (card_name, pairs_list) in batch.items():
+                    yield Card(card_number, card_name, pairs_list)
+                start = batch_end + 1
+
+    def count_selection(self, path, ranges):
+        """
+        Число карточек и пар в диапазонах (без чтения текстов промптов).
+
+        Returns:
+            tuple: (карточек, пар)
+        """
+        abs_path = os.path.abspath(path)
+        card_count = pair_count = 0
+        connection = self._connect()
+        try:
+            for start, end in merge_ranges(ranges):
+                where = "path = ? AND card_number >= ?" + (" AND card_number <= ?" if end is not None else "")
+                parameters = (abs_path, start) + ((end,) if end is not None else ())
+                cards, pairs = connection.execute(
+                    f"SELECT COUNT(DISTINCT card_number), COUNT(*) FROM prompt_pairs WHERE {where}", parameters
+                ).fetchone()
+                card_count += cards
+                pair_count += pairs
+        finally:
+            connection.close()
+        return card_count, pair_count
+
+    def count_prompts(self, path):
+        """
+        Число карточек и пар в файле (без чтения текстов промптов).
+
+        Returns:
+            tuple: (карточек, пар)
+        """
+        connection = self._connect()
+        try:
+            return tuple(connection.execute(
+                "SELECT COUNT(DISTINCT card_number), COUNT(*) FROM prompt_pairs WHERE path = ?", (os.path.abspath(path),)
+            ).fetchone())
+        finally:
+            connection.close()
+
+    def store(self, path, stat, content_hash, valid_prompts, report):
+        """
+        Сохранение результата разбора (старая запись файла заменяется).
+
+        Актуальность записи проверяется ещё раз внутри транзакции: если другой процесс уже
+        разобрал и сохранил текущий файл, пока этот разбирал его, запись не переписывается.
+
+        Returns:
+            bool: True - результат записан, False - в кэше уже актуальная запись
+        """
+        abs_path = os.path.abspath(path)
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            if self._current_file_row(connection, abs_path) is not None:
+                connection.execute("COMMIT")
+                return False
+            connection.execute("DELETE FROM prompt_pairs WHERE path = ?", (abs_path,))
+            connection.execute("DELETE FROM prompt_files WHERE path = ?", (abs_path,))
+            connection.executemany(
+                "INSERT INTO prompt_pairs (path, card_number, card_name, pair_number, face, back) VALUES (?, ?, ?, ?, ?, ?)",
+                [(abs_path, card_number, card_name, pair_number, pair_dict['лицо'], pair_dict['оборот'])
+                 for card_number, (card_name, pairs_list) in valid_prompts.items()
+                 for pair_number, pair_dict in enumerate(pairs_list, 1)]
+            )
+            connection.execute(
+                "INSERT INTO prompt_files (path, size, mtime_ns, content_hash, encoding, report_lines, parsed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (abs_path, stat.st_size, stat.st_mtime_ns, content_hash, report.encoding,
+                 json.dumps(report.format_lines(), ensure_ascii=False), time.time())
+            )
+            connection.execute("COMMIT")
+            return True
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        finally:
+            connection.close()
+
+    def refresh(self, path):
+        """
+        Актуальный кэш файла: разбор и сохранение, только если файл изменился.
+
+        Returns:
+            tuple: (кодировка, замечания разбора строками, был ли кэш актуален, промпты или None)
+                   промпты возвращаются только после разбора (они уже в памяти)
+        """
+        row = self.get_file_row(path)
+        if row is not None:
+            return row['encoding'], json.loads(row['report_lines']), True, None
+
+        # stat и хеш - до разбора: если файл изменится во время разбора, следующий запуск разберёт его снова
+        stat = os.stat(path)
+        content_hash = hash_file(path)
+        valid_prompts, report = parse_prompts_file(path)
+        self.store(path, stat, content_hash, valid_prompts, report)
+        return report.encoding, report.format_lines(), False, valid_prompts
+
+    def load_or_parse(self, path):
+        """
+        Промпты файла: из кэша или разбор с сохранением в кэш.
+
+        Returns:
+            tuple: (промпты, кодировка, замечания разбора строками, взято ли из кэша)
+        """
+        encoding, report_lines, from_cache, valid_prompts = self.refresh(path)
+        if from_cache:
+            valid_prompts = self.load(path)
+        return valid_prompts, encoding, report_lines, from_cache
@@ -0,0 +1,198 @@
+"""
+Потоковый разбор файла промптов: кодировка определяется по началу файла, замечания собираются в отчёт
+"""
+import codecs
+import re
+from collections import namedtuple
+from .records import SIDE_BACK, SIDE_BY_NAME, SIDE_FACE, SIDES, PromptPair, SharedTexts
+
+# Сколько байт читается для определения кодировки
+ENCODING_SAMPLE_SIZE = 64 * 1024
+
+# Если файл дальше не читается в определённой кодировке, разбор начинается заново в следующей
+# (latin-1 читает любые байты - на ней перебор заканчивается)
+FALLBACK_ENCODINGS = {'utf-8-sig': 'cp1251', 'utf-8': 'cp1251', 'cp1251': 'latin-1'}
+
+# "Карточка X лицо Название - Промпт Y: текст" (строка уже без пробелов по краям)
+PROMPT_LINE_PATTERN = re.compile(r'Карточка (\d+) (лицо|оборот) ([^-]+) - Промпт (\d+): (.+)')
+
+# Одна строка файла промптов
+PromptRecord = namedtuple('PromptRecord', ['card_number', 'side', 'card_name', 'prompt_number', 'text', 'line_number'])
+
+
+def detect_encoding(sample):
+    """
+    Кодировка по первым байтам файла: utf-8-sig (BOM), utf-8, cp1251, иначе latin-1.
+
+    Символ UTF-8, обрезанный концом выборки, ошибкой не считается.
+    """
+    if sample.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    try:
+        sample.decode('utf-8')
+        return 'utf-8'
+    except UnicodeDecodeError as e:
+        if e.reason == 'unexpected end of data' and e.start >= len(sample) - 3:
+            return 'utf-8'
+    try:
+        sample.decode('cp1251')
+        return 'cp1251'
+    except UnicodeDecodeError:
+        return 'latin-1'
+
+
+class ParseReport:
+    """
+    Замечания разбора вместо построчного вывода в консоль.
+
+    Строки не по формату считаются все, примеры хранятся только первые MAX_EXAMPLES.
+    """
+
+    MAX_EXAMPLES = 10
+
+    def __init__(self, path):
+        self.path = path
+        self.encoding = None
+        self.line_count = 0
+        self.record_count = 0
+        self.mismatched_count = 0
+        self.mismatched_examples = []  # (номер строки, начало строки)
+        self.rejected_encodings = []  # (кодировка, строк прочитано до ошибки) - разбор начат заново в следующей
+        self.name_conflicts = []  # (номер карточки, первое название, другое название, номер строки)
+        self.incomplete_pairs = []  # (номер карточки, название, номер пары, отсутствующая сторона)
+
+    def add_mismatch(self, line_number, line):
+        self.mismatched_count += 1
+        if len(self.mismatched_examples) < self.MAX_EXAMPLES:
+            self.mismatched_examples.append((line_number, line[:50]))
+
+    def has_problems(self):
+        return bool(self.mismatched_count or self.rejected_encodings or self.name_conflicts or self.incomplete_pairs)
+
+    def format_lines(self):
+        """Замечания строками для лога"""
+        lines = []
+        if self.mismatched_count:
+            examples = ", ".join(str(line_number) for line_number, _ in self.mismatched_examples)
+            more = " и др." if self.mismatched_count > len(self.mismatched_examples) else ""
+            lines.append(f"Строк не по формату: {self.mismatched_count} (строки {examples}{more})")
+            for line_number, line_start in self.mismatched_examples:
+                lines.append(f"   Строка {line_number}: {line_start}...")
+        for encoding, line_count in self.rejected_encodings:
+            lines.append(f"Файл не читается в кодировке {encoding} (ошибка после строки {line_count}), "
+                         f"разобран заново")
+        if self.rejected_encodings:
+            lines.append(f"Файл прочитан в кодировке {self.encoding}")
+        for card_number, first_name, other_name, line_number in self.name_conflicts[:self.MAX_EXAMPLES]:
+            lines.append(f"Карточка {card_number} имеет разное название в разных строках: "
+                         f"'{first_name}' и '{other_name}' (строка {line_number})")
+        if len(self.name_conflicts) > self.MAX_EXAMPLES:
+            lines.append(f"   ... всего разных названий: {len(self.name_conflicts)}")
+        for card_number, card_name, pair_number, missing_side in self.incomplete_pairs[:self.MAX_EXAMPLES]:
+            lines.append(f"Карточка {card_number} ({card_name}), Пара {pair_number}: "
+                         f"отсутствует '{missing_side}', пара пропускается")
+        if len(self.incomplete_pairs) > self.MAX_EXAMPLES:
+            lines.append(f"   ... всего неполных пар: {len(self.incomplete_pairs)}")
+        return lines
+
+
+def iter_prompt_records(path, report=None, encoding=None):
+    """
+    Строки файла промптов по одной (генератор PromptRecord).
+
+    Файл читается в кодировке encoding (по умолчанию - определённой по началу файла) без замены байтов:
+    если дальше в файле встретятся байты не в этой кодировке, генератор выбросит UnicodeDecodeError
+    (parse_prompts_file в этом случае разбирает файл заново в следующей кодировке).
+    """
+    if report is None:
+        report = ParseReport(path)
+
+    if encoding is None:
+        with open(path, 'rb') as sample_file:
+            encoding = detect_encoding(sample_file.read(ENCODING_SAMPLE_SIZE))
+    report.encoding = encoding
+
+    match_line = PROMPT_LINE_PATTERN.match
+    line_number = 0
+    try:
+        with open(path, 'r', encoding=encoding) as prompts_file:
+            for line_number, line in enumerate(prompts_file, 1):
+                line = line.strip()
+
+                # Обычная строка начинается с "Карточка" - якорный match; иначе ищем внутри строки
+                match = match_line(line)
+                if match is None:
+                    if 'Карточка' not in line:
+                        continue
+                    match = PROMPT_LINE_PATTERN.search(line)
+                    if match is None:
+                        report.add_mismatch(line_number, line)
+                        continue
+
+                report.record_count += 1
+                card_number, side, card_name, prompt_number, text = match.groups()
+                yield PromptRecord(int(card_number), SIDE_BY_NAME[side], card_name.strip(), int(prompt_number), text,
+                                   line_number)
+    finally:
+        # Число прочитанных строк - и при ошибке декодирования (для отчёта о перезапуске)
+        report.line_count = line_number
+
+
+def collect_prompts(records, report):
+    """
+    Сборка карточек из строк: номер карточки -> (название, список полных пар PromptPair).
+
+    Неполные пары пропускаются и попадают в отчёт. Название карточки - из первой её строки,
+    одинаковые тексты промптов хранятся одним объектом (SharedTexts).
+    """
+    shared_texts = SharedTexts()
+    prompts_by_card = {}
+    card_names = {}
+    for record in records:
+        if record.card_number not in card_names:
+            card_names[record.card_number] = record.card_name
+        elif card_names[record.card_number] != record.card_name:
+            report.name_conflicts.append((record.card_number, card_names[record.card_number],
+                                          record.card_name, record.line_number))
+        prompts_by_card.setdefault(record.card_number, {}).setdefault(record.prompt_number, {})[record.side] = shared_texts.share(record.text)
+
+    valid_prompts = {}
+    for card_number in sorted(prompts_by_card):
+        card_name = card_names.get(card_number, f"Карточка {card_number}")
+        valid_pairs = []
+        for pair_number in sorted(prompts_by_card[card_number]):
+            pair_dict = prompts_by_card[card_number][pair_number]
+            missing_sides = [side for side in SIDES if side not in pair_dict]
+            if missing_sides:
+                for missing_side in missing_sides:
+                    report.incomplete_pairs.append((card_number, card_name, pair_number, missing_side))
+                continue
+            valid_pairs.append(PromptPair(pair_dict[SIDE_FACE], pair_dict[SIDE_BACK]))
+        if valid_pairs:
+            valid_prompts[card_number] = (card_name, valid_pairs)
+    return valid_prompts
+
+
+def parse_prompts_file(path):
+    """
+    Разбор файла промптов: обычно за один проход.
+
+    Если после первых ENCODING_SAMPLE_SIZE байт встретились байты не в определённой кодировке,
+    разбор начинается заново в следующей по FALLBACK_ENCODINGS (как прежний перебор кодировок),
+    а не заменяет нечитаемые символы; отброшенные кодировки попадают в отчёт.
+
+    Returns:
+        tuple: (номер карточки -> (название, список пар), ParseReport)
+    """
+    with open(path, 'rb') as sample_file:
+        encoding = detect_encoding(sample_file.read(ENCODING_SAMPLE_SIZE))
+
+    rejected_encodings = []
+    while True:
+        report = ParseReport(path)
+        report.rejected_encodings = rejected_encodings
+        try:
+            return collect_prompts(iter_prompt_records(path, report, encoding), report), report
+        except UnicodeDecodeError:
+            rejected_encodings.append((encoding, report.line_count))
+            encoding = FALLBACK_ENCODINGS[encoding]
@@ -0,0 +1,153 @@
+"""
+Компактные записи промптов и задач: __slots__ вместо словарей, общие объекты сторон, форматов и текстов промптов
+"""
+import sys
+from collections import namedtuple
+from collections.abc import Mapping, Sequence
+
+# Стороны и форматы - одни и те же объекты строк во всех записях
+SIDE_FACE = sys.intern('лицо')
+SIDE_BACK = sys.intern('оборот')
+FORMAT_FACE = sys.intern('4:3')
+FORMAT_BACK = sys.intern('3:2')
+
+SIDES = (SIDE_FACE, SIDE_BACK)
+# Стороны пары и их форматы в порядке генерации
+SIDE_FORMATS = ((SIDE_FACE, FORMAT_FACE), (SIDE_BACK, FORMAT_BACK))
+
+# Строка стороны из файла -> общий объект стороны
+SIDE_BY_NAME = {side: side for side in SIDES}
+
+SIDE_JOB_FIELDS = ('card_number', 'card_name', 'pair_number', 'side', 'format_ratio', 'prompt', 'filename')
+
+
+class SharedTexts:
+    """
+    Общее хранилище текстов на одну загрузку промптов: одинаковые тексты
+    (шаблоны, повторы в библиотеке) хранятся одним объектом строки.
+    """
+
+    __slots__ = ('texts',)
+
+    def __init__(self):
+        self.texts = {}
+
+    def share(self, text):
+        return self.texts.setdefault(text, text)
+
+    def __len__(self):
+        return len(self.texts)
+
+
+class PromptPair(Mapping):
+    """
+    Полная пара промптов карточки (не изменяется).
+
+    Доступ как у прежнего словаря: pair['лицо'], pair['оборот'], 'лицо' in pair;
+    пара равна словарю {'лицо': ..., 'оборот': ...} с теми же текстами.
+    """
+
+    __slots__ = ('face', 'back')
+
+    def __init__(self, face, back):
+        object.__setattr__(self, 'face', face)
+        object.__setattr__(self, 'back', back)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} не изменяется")
+
+    def __getitem__(self, side):
+        if side == SIDE_FACE:
+            return self.face
+        if side == SIDE_BACK:
+            return self.back
+        raise KeyError(side)
+
+    def __iter__(self):
+        return iter(SIDES)
+
+    def __len__(self):
+        return len(SIDES)
+
+    def __reduce__(self):
+        return PromptPair, (self.face, self.back)
+
+    def __repr__(self):
+        return f"PromptPair(face={self.face!r}, back={self.back!r})"
+
+
+class Card(namedtuple('Card', ['card_number', 'card_name', 'pairs'])):
+    """Карточка запуска: распаковывается как прежний кортеж (номер, название, список пар)"""
+
+    __slots__ = ()
+
+
+class CardPrompts(Sequence):
+    """
+    Промпты карточки для стандартного режима: лицо, оборот, лицо, оборот...
+
+    Представление над списком пар - тексты не копируются в отдельный список.
+    Равно списку с теми же промптами.
+    """
+
+    __slots__ = ('pairs',)
+
+    def __init__(self, pairs):
+        self.pairs = pairs
+
+    def __len__(self):
+        return len(self.pairs) * len(SIDES)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[position] for position in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        pair_index, side_index = divmod(index, len(SIDES))
+        return self.pairs[pair_index][SIDES[side_index]]
+
+    def __eq__(self, other):
+        if isinstance(other, Sequence) and not isinstance(other, str):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return f"CardPrompts({list(self)!r})"
+
+
+class SideJob(Mapping):
+    """
+    Задача на генерацию одной стороны (не изменяется).
+
+    Доступ как у прежнего словаря (job['card_number'], 'id' in job, dict(job, attempts=2)) -
+    задачи из build_side_jobs и строки очереди задач (словари) обрабатываются одинаково.
+    """
+
+    __slots__ = SIDE_JOB_FIELDS
+
+    def __init__(self, card_number, card_name, pair_number, side, format_ratio, prompt, filename):
+        for field, value in zip(SIDE_JOB_FIELDS, (card_number, card_name, pair_number, side,
+                                                  format_ratio, prompt, filename)):
+            object.__setattr__(self, field, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} не изменяется")
+
+    def __getitem__(self, field):
+        if field not in SIDE_JOB_FIELDS:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def __iter__(self):
+        return iter(SIDE_JOB_FIELDS)
+
+    def __len__(self):
+        return len(SIDE_JOB_FIELDS)
+
+    def __reduce__(self):
+        return SideJob, tuple(getattr(self, field) for field in SIDE_JOB_FIELDS)
+
+    def __repr__(self):
+        return f"SideJob(#{self.card_number} пара {self.pair_number} {self.side} {self.format_ratio})"
@@ -0,0 +1,142 @@
+"""
+Кэш референсов в готовом для буфера обмена виде (данные запроса бэкенда в памяти) и фоновая подготовка следующей карточки
+"""
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from utils.image_clipboard import read_png_bytes
+from utils.logger import Logger
+from .records import SIDE_FORMATS
+
+
+class ReferenceCache:
+    """
+    LRU-кэш: путь к референсу -> данные для буфера обмена, ограничение по суммарному размеру.
+
+    encode(path) - кодирование файла в тот вид, который отправляет бэкенд буфера обмена
+    (ImageClipboardBackend.encode_payload: PNG-байты или строка base64 для помощника PowerShell),
+    чтобы при копировании из кэша ничего не перекодировалось.
+
+    Ключ - абсолютный путь и mtime файла: изменённый файл кодируется заново.
+    Дольше всех не использованные записи вытесняются, когда сумма превышает max_bytes.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, encode=read_png_bytes):
+        self.max_bytes = max_bytes
+        self.encode = encode
+        self.entries = OrderedDict()  # абсолютный путь -> (mtime_ns, payload)
+        self.total_bytes = 0
+        self.lock = threading.Lock()  # Кэш заполняется и фоновым потоком подготовки
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, image_path):
+        """
+        Данные референса: из кэша или чтение/кодирование файла с сохранением в кэш.
+
+        Returns:
+            bytes или str (см. encode)
+        """
+        abs_path = os.path.abspath(image_path)
+        mtime_ns = os.stat(abs_path).st_mtime_ns
+
+        with self.lock:
+            entry = self.entries.get(abs_path)
+            if entry is not None and entry[0] == mtime_ns:
+                self.entries.move_to_end(abs_path)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        # Кодирование вне блокировки: основной поток не ждёт фоновую подготовку
+        payload = self.encode(abs_path)
+        self.put(abs_path, mtime_ns, payload)
+        return payload
+
+    def put(self, abs_path, mtime_ns, payload):
+        with self.lock:
+            old_entry = self.entries.pop(abs_path, None)
+            if old_entry is not None:
+                self.total_bytes -= len(old_entry[1])
+            if len(payload) > self.max_bytes:
+                # Один файл больше всего кэша - не храним
+                return
+            self.entries[abs_path] = (mtime_ns, payload)
+            self.total_bytes += len(payload)
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted_bytes) = self.entries.popitem(last=False)
+                self.total_bytes -= len(evicted_bytes)
+                self.evictions += 1
+
+    def contains(self, image_path):
+        """Есть ли в кэше актуальная запись (без учёта в попаданиях)"""
+        abs_path = os.path.abspath(image_path)
+        with self.lock:
+            entry = self.entries.get(abs_path)
+        return entry is not None and os.path.exists(abs_path) and entry[0] == os.stat(abs_path).st_mtime_ns
+
+    def __len__(self):
+        return len(self.entries)
+
+    def format_metrics(self):
+        """Попадания и заполнение кэша одной строкой для лога"""
+        return (f"попаданий {self.hits}, промахов {self.misses}, в кэше {len(self.entries)} "
+                f"({self.total_bytes / (1024 * 1024):.1f}/{self.max_bytes / (1024 * 1024):.0f} МБ), "
+                f"вытеснено {self.evictions}")
+
+
+class ReferencePrefetcher:
+    """
+    Фоновая подготовка референсов следующей карточки, пока генерируется текущая.
+
+    card_order - карточки в порядке задач: [(card_number, card_name), ...].
+    resolve_path(card_number, card_name, side) - поиск файла референса (None, если не найден).
+    sides - стороны карточки (по умолчанию все стороны SIDE_FORMATS в порядке генерации).
+    Каждая карточка готовится не больше одного раза за запуск.
+    """
+
+    def __init__(self, cache, card_order, resolve_path, sides=None):
+        self.cache = cache
+        self.resolve_path = resolve_path
+        self.sides = sides or tuple(side for side, _ in SIDE_FORMATS)
+        self.logger = Logger()
+        self.next_card = {}  # card_number -> следующая карточка (card_number, card_name)
+        for (card_number, _), next_card in zip(card_order, card_order[1:]):
+            self.next_card.setdefault(card_number, next_card)
+        self.scheduled_cards = set()
+        self.futures = []
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.prefetched_count = 0
+
+    def prefetch_card(self, card_number, card_name):
+        """Подготовка референсов карточки в фоне"""
+        if card_number in self.scheduled_cards:
+            return
+        self.scheduled_cards.add(card_number)
+        self.futures.append(self.executor.submit(self._prefetch, card_number, card_name))
+
+    def prefetch_after(self, card_number):
+        """Подготовка карточки, идущей после card_number"""
+        next_card = self.next_card.get(card_number)
+        if next_card is not None:
+            self.prefetch_card(*next_card)
+
+    def _prefetch(self, card_number, card_name):
+        for side in self.sides:
+            try:
+                ref_path = self.resolve_path(card_number, card_name, side)
+                if ref_path:
+                    self.cache.get(ref_path)
+                    self.prefetched_count += 1
+            except Exception as e:
+                self.logger.log_action(f"⚠️ Фоновая подготовка референса карточки #{card_number} ({side}): {e}")
+
+    def wait(self):
+        """Ожидание уже поставленных подготовок (для тестов и замеров)"""
+        for future in self.futures:
+            future.result()
+
+    def close(self):
+        self.executor.shutdown(wait=False)
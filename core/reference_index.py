@@ -0,0 +1,109 @@
+"""
+Индекс папок с референсами: одно сканирование на сторону, поиск по номеру карточки и нормализованному названию
+"""
+import difflib
+import os
+import re
+from .naming import safe_card_name
+
+REFERENCE_ROOT = os.path.join('data', 'images')
+REFERENCE_SIDES = ('лицо', 'оборот')
+# Порядок - приоритет, если для карточки есть несколько файлов
+REFERENCE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+# {сторона}_{номер}_{название}.{расширение}
+REFERENCE_FILENAME_PATTERN = re.compile(r'^(?P<side>[^_]+)_(?P<number>\d+)_(?P<name>.+)$')
+
+
+def normalize_name(name):
+    """Название для сравнения: регистр, ё/е, пробелы и подчёркивания не различаются"""
+    name = name.lower().replace('ё', 'е')
+    return re.sub(r'[\s_]+', '_', name).strip('_')
+
+
+class ReferenceIndex:
+    """
+    Файлы референсов по (сторона, номер карточки).
+
+    Папка каждой стороны сканируется один раз (build), дальше поиск идёт по словарю.
+    Сначала ищется точное имя (как раньше: .png, затем .jpg), затем совпадение
+    нормализованного названия (normalize_name) с любым поддерживаемым расширением.
+    """
+
+    def __init__(self, root=REFERENCE_ROOT, sides=REFERENCE_SIDES):
+        self.root = root
+        self.sides = sides
+        self.files = {}  # (side, card_number) -> [(имя файла, нормализованное название, путь)]
+        self.names = {}  # side -> все имена файлов папки (для похожих вариантов)
+        self.missing_dirs = []
+
+    def build(self):
+        """Сканирование папок сторон"""
+        self.files = {}
+        self.names = {}
+        self.missing_dirs = []
+        for side in self.sides:
+            side_dir = os.path.join(self.root, side)
+            self.names[side] = []
+            try:
+                entries = list(os.scandir(side_dir))
+            except OSError:
+                self.missing_dirs.append(side_dir)
+                continue
+
+            for entry in entries:
+                stem, extension = os.path.splitext(entry.name)
+                if extension.lower() not in REFERENCE_EXTENSIONS or not entry.is_file():
+                    continue
+                self.names[side].append(entry.name)
+                match = REFERENCE_FILENAME_PATTERN.match(stem)
+                if match is None or normalize_name(match.group('side')) != normalize_name(side):
+                    continue
+                key = (side, int(match.group('number')))
+                self.files.setdefault(key, []).append((entry.name, normalize_name(match.group('name')), entry.path))
+
+        for candidates in self.files.values():
+            candidates.sort(key=lambda candidate: REFERENCE_EXTENSIONS.index(os.path.splitext(candidate[0])[1].lower()))
+        return self
+
+    def find(self, card_number, card_name, side):
+        """
+        Путь к референсу карточки.
+
+        Returns:
+            str: путь или None, если подходящего файла нет
+        """
+        candidates = self.files.get((side, card_number), [])
+        expected_stem = f"{side}_{card_number}_{safe_card_name(card_name)}"
+        for filename, _, path in candidates:
+            if os.path.splitext(filename)[0] == expected_stem:
+                return path
+
+        normalized = normalize_name(card_name)
+        for _, candidate_name, path in candidates:
+            if candidate_name == normalized:
+                return path
+        return None
+
+    def find_near_misses(self, card_number, card_name, side, limit=3):
+        """
+        Похожие файлы для отчёта о ненайденном референсе: тот же номер с другим названием,
+        то же название с другим номером, близкие по написанию имена.
+        """
+        near_misses = [filename for filename, _, _ in self.files.get((side, card_number), [])]
+
+        normalized = normalize_name(card_name)
+        for (candidate_side, candidate_number), candidates in self.files.items():
+            if candidate_side != side or candidate_number == card_number:
+                continue
+            near_misses += [filename for filename, candidate_name, _ in candidates if candidate_name == normalized]
+
+        expected_stem = normalize_name(f"{side}_{card_number}_{card_name}")
+        stems = {normalize_name(os.path.splitext(filename)[0]): filename for filename in self.names.get(side, [])}
+        for stem in difflib.get_close_matches(expected_stem, list(stems), n=limit, cutoff=0.8):
+            if stems[stem] not in near_misses:
+                near_misses.append(stems[stem])
+        return near_misses[:limit]
+
+    def __len__(self):
+        return sum(len(candidates) for candidates in self.files.values())
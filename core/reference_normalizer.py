@@ -0,0 +1,104 @@
+"""
+Уменьшение больших референсов перед вставкой: результат хранится на диске по хешу содержимого и переживает перезапуск
+"""
+import os
+import threading
+from PIL import Image
+from utils.logger import Logger
+from .prompt_cache import hash_file
+
+# Качество пересохранения JPEG-референсов
+JPEG_QUALITY = 90
+
+
+class ReferenceNormalizer:
+    """
+    Референс больше max_side по длинной стороне уменьшается (LANCZOS). Формат сохраняется:
+    JPEG остаётся JPEG (пересохранение фото в PNG увеличивает файл), остальные - PNG.
+
+    Файл кэша: {cache_dir}/{sha256 содержимого}_{max_side}.jpg/.png - одна и та же картинка
+    обрабатывается один раз, даже если её переименовали или скопировали в другую папку.
+    Референсы, которые уже не больше max_side, используются как есть (без перекодирования).
+    """
+
+    def __init__(self, cache_dir, max_side=1536):
+        self.cache_dir = cache_dir
+        self.max_side = max_side
+        self.logger = Logger()
+        self.lock = threading.Lock()  # Референсы нормализуются и из фонового потока подготовки
+        self.resolved = {}  # (путь, mtime_ns) -> путь для вставки (хеш считается один раз за запуск)
+        self.normalized_count = 0  # Уменьшено в этом запуске
+        self.reused_count = 0  # Взято из кэша на диске
+        self.unchanged_count = 0  # Уже достаточно маленькие
+        self.original_bytes = 0
+        self.normalized_bytes = 0
+
+    def normalize(self, ref_path):
+        """
+        Путь к референсу для вставки: уменьшенная копия из кэша или исходный файл.
+
+        При ошибке возвращается исходный файл - вставка важнее экономии.
+        """
+        try:
+            resolved_key = (os.path.abspath(ref_path), os.stat(ref_path).st_mtime_ns)
+            with self.lock:
+                if resolved_key in self.resolved:
+                    return self.resolved[resolved_key]
+
+            normalized_path = self._normalize(ref_path)
+            with self.lock:
+                self.resolved[resolved_key] = normalized_path
+            return normalized_path
+        except Exception as e:
+            self.logger.log_action(f"⚠️ Не удалось уменьшить референс {ref_path}: {e}, вставляем исходный")
+            return ref_path
+
+    def _normalize(self, ref_path):
+        with Image.open(ref_path) as image:
+            # Читается только заголовок: маленький референс не читается целиком, не хешируется и не перекодируется
+            if max(image.size) <= self.max_side:
+                with self.lock:
+                    self.unchanged_count += 1
+                return ref_path
+
+            original_size = os.path.getsize(ref_path)
+            output_format = 'JPEG' if image.format == 'JPEG' else 'PNG'
+            extension = '.jpg' if output_format == 'JPEG' else '.png'
+            # Хеш по частям - файл не загружается в память целиком
+            cache_path = os.path.join(self.cache_dir, f"{hash_file(ref_path)}_{self.max_side}{extension}")
+            if os.path.exists(cache_path):
+                self._count_saving('reused_count', original_size, os.path.getsize(cache_path))
+                return cache_path
+
+            image.thumbnail((self.max_side, self.max_side), Image.LANCZOS)
+            if output_format == 'JPEG':
+                if image.mode not in ('RGB', 'L', 'CMYK'):
+                    image = image.convert('RGB')
+                save_options = {'quality': JPEG_QUALITY, 'optimize': True}
+            else:
+                if image.mode not in ('RGB', 'RGBA'):
+                    image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+                save_options = {'optimize': True}
+
+            # Запись через временный файл: параллельная нормализация того же референса не увидит недописанный файл
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            image.save(temp_path, format=output_format, **save_options)
+        os.replace(temp_path, cache_path)
+
+        self._count_saving('normalized_count', original_size, os.path.getsize(cache_path))
+        self.logger.log_action(f"🗜️ Референс уменьшен до {self.max_side} px: {ref_path} "
+                               f"({original_size / 1024:.0f} -> {os.path.getsize(cache_path) / 1024:.0f} КБ)")
+        return cache_path
+
+    def _count_saving(self, counter_name, original_size, normalized_size):
+        with self.lock:
+            setattr(self, counter_name, getattr(self, counter_name) + 1)
+            self.original_bytes += original_size
+            self.normalized_bytes += normalized_size
+
+    def format_metrics(self):
+        """Статистика одной строкой для лога"""
+        saved_mb = (self.original_bytes - self.normalized_bytes) / (1024 * 1024)
+        return (f"уменьшено {self.normalized_count}, из кэша {self.reused_count}, без изменений {self.unchanged_count}, "
+                f"сэкономлено {saved_mb:.1f} МБ")
@@ -0,0 +1,69 @@
+"""
+Проверка референсов до первого клика: декодирование, пропорции и размер файлов в пуле потоков
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+
+
+def parse_ratio(format_ratio):
+    """'4:3' -> 1.333..."""
+    width, height = format_ratio.split(':')
+    return float(width) / float(height)
+
+
+def validate_reference(ref_path, format_ratio, max_file_bytes=0, aspect_tolerance=0.05):
+    """
+    Проверка одного референса.
+
+    Изображение декодируется полностью (load), чтобы найти и обрезанные файлы.
+    Пропорции сравниваются с форматом стороны: отклонение больше aspect_tolerance - предупреждение.
+
+    Returns:
+        dict: path, width, height, file_size, corrupt (не декодируется), problems (список строк)
+    """
+    result = {'path': ref_path, 'width': None, 'height': None, 'file_size': None,
+              'corrupt': False, 'problems': []}
+    try:
+        result['file_size'] = os.path.getsize(ref_path)
+        with Image.open(ref_path) as image:
+            image.load()
+            result['width'], result['height'] = image.size
+    except Exception as e:
+        result['corrupt'] = True
+        result['problems'].append(f"не декодируется ({e})")
+        return result
+
+    if max_file_bytes and result['file_size'] > max_file_bytes:
+        result['problems'].append(f"файл {result['file_size'] / (1024 * 1024):.1f} МБ "
+                                  f"(больше {max_file_bytes / (1024 * 1024):.0f} МБ)")
+
+    target_ratio = parse_ratio(format_ratio)
+    actual_ratio = result['width'] / result['height']
+    if abs(actual_ratio / target_ratio - 1) > aspect_tolerance:
+        result['problems'].append(f"{result['width']}x{result['height']} - пропорции {actual_ratio:.2f}, "
+                                  f"для {format_ratio} нужно {target_ratio:.2f}")
+    return result
+
+
+def run_reference_preflight(references, max_file_bytes=0, aspect_tolerance=0.05, max_workers=8):
+    """
+    Проверка всех референсов запуска параллельно.
+
+    Args:
+        references: [(card_number, card_name, side, format_ratio, ref_path), ...]
+
+    Returns:
+        list: результаты validate_reference в порядке references, с card_number, card_name, side
+    """
+    if not references:
+        return []
+
+    def validate(reference):
+        card_number, card_name, side, format_ratio, ref_path = reference
+        result = validate_reference(ref_path, format_ratio, max_file_bytes, aspect_tolerance)
+        result.update({'card_number': card_number, 'card_name': card_name, 'side': side})
+        return result
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(references)))) as executor:
+        return list(executor.map(validate, references))
@@ -0,0 +1,86 @@
+"""
+Отложенные повторы неудачных сторон: основной проход не останавливается на ошибках
+"""
+import heapq
+import itertools
+import time
+from utils.logger import Logger
+
+
+class RetryQueue:
+    """
+    Очередь с приоритетом: раньше выходит задача, у которой раньше закончилась пауза,
+    при равном времени - задача с меньшим числом попыток.
+
+    Пауза перед попыткой N+1 - base_delay * 2^(N-1), но не больше max_delay.
+    После max_attempts попыток этого запуска (get_run_attempts) задача в очередь не возвращается.
+    """
+
+    def __init__(self, max_attempts=3, base_delay=30.0, max_delay=300.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.logger = Logger()
+        self.heap = []  # (ready_at, attempts, порядковый номер, job)
+        self.counter = itertools.count()
+        self.failure_reasons = {}  # job_key -> причины неудач по попыткам
+        self.abandoned_jobs = []
+
+    def get_backoff(self, attempts):
+        """Пауза перед следующей попыткой после attempts неудачных (сек)"""
+        return min(self.base_delay * (2 ** max(attempts - 1, 0)), self.max_delay)
+
+    def push(self, job, reason=''):
+        """
+        Постановка неудачной задачи на повтор.
+
+        Returns:
+            bool: True если задача поставлена, False если попытки исчерпаны
+        """
+        attempts = get_run_attempts(job)
+        self.failure_reasons.setdefault(get_job_key(job), []).append(reason)
+
+        if attempts >= self.max_attempts:
+            self.abandoned_jobs.append(job)
+            self.logger.log_action(f"❌ {format_job(job)}: попытки исчерпаны ({attempts}), последняя причина: {reason}")
+            return False
+
+        backoff = self.get_backoff(attempts)
+        heapq.heappush(self.heap, (time.time() + backoff, attempts, next(self.counter), job))
+        self.logger.log_action(f"🔁 {format_job(job)}: повтор через {backoff:.0f} сек "
+                               f"(попытка {attempts + 1}/{self.max_attempts}), причина: {reason}")
+        return True
+
+    def pop(self):
+        """
+        Следующая задача на повтор.
+
+        Returns:
+            tuple: (ready_at, job) или None, если очередь пуста
+        """
+        if not self.heap:
+            return None
+        ready_at, _, _, job = heapq.heappop(self.heap)
+        return ready_at, job
+
+    def __len__(self):
+        return len(self.heap)
+
+
+def get_job_key(job):
+    return (job['card_number'], job['pair_number'], job['side'], job['format_ratio'])
+
+
+def get_run_attempts(job):
+    """
+    Число попыток задачи в этом запуске.
+
+    У задачи из очереди задач - run_attempts (attempts там общий по всем запускам:
+    задача, не удавшаяся вчера, иначе сразу считалась бы исчерпанной), у задачи в памяти - attempts.
+    """
+    return job.get('run_attempts') or job.get('attempts') or 1
+
+
+def format_job(job):
+    """Задача одной строкой для лога"""
+    return f"Карточка #{job['card_number']} пара {job['pair_number']} {job['side']}"
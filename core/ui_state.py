@@ -0,0 +1,54 @@
+"""
+Модель состояния интерфейса AI Studio: действия, чей результат уже на экране, не выполняются
+"""
+
+
+class UIState:
+    """
+    Что сейчас на экране (по последним успешным действиям генератора).
+
+    Значения обновляются только после успешного действия. После любой ошибки
+    состояние сбрасывается (reset) - неизвестное состояние означает, что действие выполняется.
+
+    Атрибуты:
+        chat: открытый чат - {'card_number', 'sides', 'result_frame'} или None
+              (result_frame - кадр последнего сохранённого изображения чата)
+        format_ratio: выбранный формат или None
+        prompt_focused: курсор в поле ввода промпта
+        reference_attached: в поле ввода вставлен референс (ещё не отправлен)
+    """
+
+    def __init__(self, format_kept_in_new_chat=False):
+        # AI Studio может сохранять выбранный формат при создании нового чата (FORMAT_KEPT_IN_NEW_CHAT)
+        self.format_kept_in_new_chat = format_kept_in_new_chat
+        self.reset()
+
+    def reset(self):
+        """Состояние неизвестно"""
+        self.chat = None
+        self.format_ratio = None
+        self.prompt_focused = False
+        self.reference_attached = False
+
+    def new_chat(self, card_number):
+        """Создан новый чат карточки"""
+        self.chat = {'card_number': card_number, 'sides': 0, 'result_frame': None}
+        if not self.format_kept_in_new_chat:
+            self.format_ratio = None
+        self.prompt_focused = False
+        self.reference_attached = False
+
+    def focus_lost(self):
+        """Клик/диалог вне поля ввода (переименование, список форматов, сохранение)"""
+        self.prompt_focused = False
+
+    def result_saved(self, frame):
+        """Изображение стороны сохранено: следующая сторона чата не должна принять его за новое"""
+        if self.chat is not None:
+            self.chat['result_frame'] = frame
+
+    def prompt_submitted(self):
+        """Промпт отправлен (Ctrl+Enter): поле ввода очищено, фокус остаётся в нём"""
+        if self.chat is not None:
+            self.chat['sides'] += 1
+        self.reference_attached = False
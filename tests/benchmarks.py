@@ -0,0 +1,370 @@
+"""
+Замеры производительности AI Studio Automation
+
+Запуск: python -m tests.benchmarks
+"""
+import os
+import time
+import numpy as np
+from config.settings import SettingsManager
+
+
+def _load_recorded_frames(frames_dir):
+    """
+    Загрузка записанных кадров области изображения.
+
+    Ожидаемая структура:
+        frames_dir/image/*.png - в области есть изображение
+        frames_dir/empty/*.png - в области только фон / индикатор загрузки
+    """
+    from PIL import Image
+
+    frames = []
+    for label, expected in [('image', True), ('empty', False)]:
+        label_dir = os.path.join(frames_dir, label)
+        if not os.path.isdir(label_dir):
+            continue
+        for entry in sorted(os.scandir(label_dir), key=lambda item: item.name):
+            if entry.is_file() and entry.name.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp')):
+                frames.append((entry.name, np.asarray(Image.open(entry.path).convert('RGB')), expected))
+    return frames
+
+
+def _synthetic_frames(frame_size=240, count=50):
+    """Синтетические кадры: фон, фон со спиннером в центре, изображения (в т.ч. с тёмным центром)"""
+    random_generator = np.random.default_rng(0)
+    frames = []
+    center = frame_size // 2
+
+    for index in range(count):
+        # Пустая область с небольшим шумом
+        empty = np.full((frame_size, frame_size, 3), 25, dtype=np.uint8)
+        empty += random_generator.integers(0, 4, empty.shape, dtype=np.uint8)
+        frames.append((f"empty_{index}", empty, False))
+
+        # Пустая область с индикатором загрузки ровно в центре
+        spinner = empty.copy()
+        spinner[center - 6:center + 6, center - 6:center + 6] = (180, 180, 255)
+        frames.append((f"spinner_{index}", spinner, False))
+
+        # Изображение
+        image = random_generator.integers(0, 256, (frame_size, frame_size, 3), dtype=np.uint8)
+        frames.append((f"image_{index}", image, True))
+
+        # Изображение с тёмным (почти фоновым) пятном в центре
+        dark_center = image.copy()
+        dark_center[center - 20:center + 20, center - 20:center + 20] = (24, 26, 25)
+        frames.append((f"dark_center_{index}", dark_center, True))
+
+    return frames
+
+
+def _single_pixel_probe(frame, tolerance):
+    """Старая проверка: один пиксель в центре области против фонового цвета (25, 25, 25)"""
+    center_y, center_x = frame.shape[0] // 2, frame.shape[1] // 2
+    r, g, b = (int(channel) for channel in frame[center_y, center_x, :3])
+    is_background = abs(r - 25) <= tolerance and abs(g - 25) <= tolerance and abs(b - 25) <= tolerance
+    return not is_background
+
+
+def benchmark_image_presence(frames_dir=os.path.join('data', 'frames')):
+    """Сравнение проверки по одному пикселю и NumPy-оценки области на записанных кадрах"""
+    from core.image_presence import ImagePresenceDetector
+
+    print("=== ⏱️ ЗАМЕР: ПРОВЕРКА НАЛИЧИЯ ИЗОБРАЖЕНИЯ ===")
+
+    settings_manager = SettingsManager()
+    tolerance = settings_manager.get('BACKGROUND_COLOR_TOLERANCE')
+    detector = ImagePresenceDetector(settings_manager)
+
+    frames = _load_recorded_frames(frames_dir)
+    if frames:
+        print(f"   📂 Записанные кадры: {len(frames)} шт. из {frames_dir}")
+    else:
+        frames = _synthetic_frames()
+        print(f"   ⚠️ Папка {frames_dir} не найдена, используются синтетические кадры: {len(frames)} шт.")
+
+    results = {}
+    for method_name, method in [
+        ('один пиксель', lambda frame: _single_pixel_probe(frame, tolerance)),
+        ('область NumPy', detector.is_image_present),
+    ]:
+        false_positives = 0
+        false_negatives = 0
+        start_time = time.perf_counter()
+        for _, frame, expected in frames:
+            detected = method(frame)
+            if detected and not expected:
+                false_positives += 1
+            if expected and not detected:
+                false_negatives += 1
+        elapsed_ms = (time.perf_counter() - start_time) * 1000 / len(frames)
+
+        results[method_name] = (false_positives, false_negatives, elapsed_ms)
+        print(f"   {method_name}: ложных срабатываний {false_positives}, пропусков {false_negatives}, "
+              f"{elapsed_ms:.3f} мс/кадр")
+
+    return results
+
+
+def benchmark_image_clipboard(count=10):
+    """Время копирования одного референса в буфер: отдельный запуск PowerShell против постоянного помощника"""
+    import shutil
+    import sys
+    import tempfile
+    from PIL import Image
+    from utils.image_clipboard import (CommandBackend, PowerShellHelperBackend, PowerShellOneShotBackend,
+                                       create_image_clipboard_backend)
+
+    print("=== ⏱️ ЗАМЕР: КОПИРОВАНИЕ РЕФЕРЕНСА В БУФЕР ОБМЕНА ===")
+
+    if sys.platform.startswith('win') and shutil.which('powershell'):
+        backends = [PowerShellOneShotBackend(), PowerShellHelperBackend()]
+    else:
+        backend = create_image_clipboard_backend('auto')
+        if not isinstance(backend, CommandBackend) or (not os.environ.get('DISPLAY') and not os.environ.get('WAYLAND_DISPLAY')):
+            print("   ⚠️ Нет доступного буфера обмена (PowerShell / xclip / wl-copy с дисплеем), замер пропущен")
+            return {}
+        backends = [backend]
+
+    temp_folder = tempfile.mkdtemp()
+    results = {}
+    try:
+        image_path = os.path.join(temp_folder, 'reference.png')
+        Image.fromarray(np.random.default_rng(0).integers(0, 256, (512, 512, 3), dtype=np.uint8)).save(image_path)
+
+        for backend in backends:
+            timings = []
+            try:
+                for _ in range(count):
+                    start_time = time.perf_counter()
+                    success, error = backend.copy_image(image_path)
+                    timings.append(time.perf_counter() - start_time)
+                    if not success:
+                        print(f"   ❌ {backend.name}: {error}")
+                        break
+            finally:
+                backend.close()
+
+            if timings:
+                # Первый запрос помощника включает его запуск - показываем отдельно
+                steady = timings[1:] or timings
+                results[backend.name] = (timings[0] * 1000, sum(steady) / len(steady) * 1000)
+                print(f"   {backend.name}: первое изображение {timings[0] * 1000:.0f} мс, "
+                      f"далее в среднем {results[backend.name][1]:.0f} мс/изображение")
+    finally:
+        shutil.rmtree(temp_folder, ignore_errors=True)
+
+    return results
+
+
+def benchmark_reference_cache(count=20):
+    """Подготовка референса к копированию: чтение и кодирование файла каждый раз против кэша"""
+    import shutil
+    import tempfile
+    from PIL import Image
+    from core.reference_cache import ReferenceCache
+    from utils.image_clipboard import read_png_bytes
+
+    print("=== ⏱️ ЗАМЕР: КЭШ РЕФЕРЕНСОВ ===")
+
+    temp_folder = tempfile.mkdtemp()
+    results = {}
+    try:
+        image_path = os.path.join(temp_folder, 'reference.jpg')
+        Image.fromarray(np.random.default_rng(0).integers(0, 256, (1024, 1024, 3), dtype=np.uint8)).save(image_path)
+
+        start_time = time.perf_counter()
+        for _ in range(count):
+            read_png_bytes(image_path)
+        results['без кэша'] = (time.perf_counter() - start_time) / count * 1000
+
+        cache = ReferenceCache()
+        cache.get(image_path)  # Подготовка заранее (как фоновая подготовка следующей карточки)
+        start_time = time.perf_counter()
+        for _ in range(count):
+            cache.get(image_path)
+        results['кэш'] = (time.perf_counter() - start_time) / count * 1000
+
+        for name, elapsed_ms in results.items():
+            print(f"   {name}: {elapsed_ms:.2f} мс/референс")
+    finally:
+        shutil.rmtree(temp_folder, ignore_errors=True)
+
+    return results
+
+
+def write_synthetic_prompts(path, line_count=100000, encoding='utf-8'):
+    """Синтетический файл промптов: по 3 пары на карточку, каждая 50-я строка - комментарий"""
+    with open(path, 'w', encoding=encoding) as prompts_file:
+        for line_number in range(line_count):
+            if line_number % 50 == 49:
+                prompts_file.write("# Карточка без формата - комментарий\n")
+                continue
+            card_number, position = divmod(line_number, 6)
+            pair_number, side_index = divmod(position, 2)
+            side = ('лицо', 'оборот')[side_index]
+            prompts_file.write(f"Карточка {card_number + 1} {side} Название карточки {card_number + 1} - "
+                               f"Промпт {pair_number + 1}: A cheerful cartoon illustration in flat design style, "
+                               f"simple shapes, vibrant colors, no text, variant {line_number}\n")
+
+
+def load_prompts_legacy(prompts_path):
+    """Прежний FileHandler.load_prompts (для сравнения): перебор кодировок, re.search по строке шаблона, print замечаний"""
+    import re
+    prompts_by_card = {}
+    for encoding in ['utf-8', 'utf-8-sig', 'cp1251', 'latin-1']:
+        try:
+            prompts_by_card = {}
+            with open(prompts_path, 'r', encoding=encoding) as prompts_file:
+                for line_number, line in enumerate(prompts_file, 1):
+                    line = line.strip()
+                    if line and 'Карточка' in line:
+                        match = re.search(r'Карточка (\d+) (лицо|оборот) ([^-]+) - Промпт (\d+): (.+)', line)
+                        if match:
+                            pair_dict = prompts_by_card.setdefault(int(match.group(1)), {}).setdefault(int(match.group(4)), {})
+                            pair_dict[match.group(2)] = match.group(5)
+                        else:
+                            print(f"[ПРЕДУПРЕЖДЕНИЕ] Строка {line_number} не соответствует формату: {line[:50]}...")
+            break
+        except UnicodeDecodeError:
+            continue
+
+    valid_prompts = {}
+    for card_number in sorted(prompts_by_card):
+        valid_pairs = [prompts_by_card[card_number][pair_number] for pair_number in sorted(prompts_by_card[card_number])
+                       if len(prompts_by_card[card_number][pair_number]) == 2]
+        if valid_pairs:
+            valid_prompts[card_number] = valid_pairs
+    return valid_prompts
+
+
+def benchmark_prompt_parser(line_count=100000):
+    """Разбор файла промптов: потоковый парсер против прежнего load_prompts"""
+    import contextlib
+    import io
+    import shutil
+    import tempfile
+    from core.prompt_parser import parse_prompts_file
+
+    print(f"=== ⏱️ ЗАМЕР: РАЗБОР ФАЙЛА ПРОМПТОВ ({line_count} строк) ===")
+
+    temp_folder = tempfile.mkdtemp()
+    results = {}
+    try:
+        for case_name, encoding, bad_tail in [('utf-8', 'utf-8', False), ('cp1251', 'cp1251', False),
+                                              ('utf-8 + строка cp1251 в конце', 'utf-8', True)]:
+            prompts_path = os.path.join(temp_folder, 'prompts.txt')
+            write_synthetic_prompts(prompts_path, line_count, encoding)
+            if bad_tail:
+                # Строка, дописанная в другой кодировке: прежний способ перечитывал весь файл в следующей
+                with open(prompts_path, 'ab') as prompts_file:
+                    prompts_file.write("Карточка 1 лицо Дописано - Промпт 99: текст\n".encode('cp1251'))
+
+            start_time = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                legacy_cards = len(load_prompts_legacy(prompts_path))
+            legacy_time = time.perf_counter() - start_time
+
+            start_time = time.perf_counter()
+            valid_prompts, report = parse_prompts_file(prompts_path)
+            parser_time = time.perf_counter() - start_time
+
+            results[case_name] = (legacy_time, parser_time)
+            print(f"   {case_name}: прежний {legacy_time:.2f} сек ({legacy_cards} карточек), "
+                  f"потоковый {parser_time:.2f} сек ({len(valid_prompts)} карточек, "
+                  f"строк не по формату {report.mismatched_count}, кодировка {report.encoding}, перезапусков {len(report.rejected_encodings)})")
+    finally:
+        shutil.rmtree(temp_folder, ignore_errors=True)
+
+    return results
+
+
+def build_side_jobs_legacy(cards_to_process_list):
+    """Прежний build_side_jobs (для сравнения): задача - словарь"""
+    from core.naming import side_filename
+    side_jobs = []
+    for card_number, card_name, pairs_list in cards_to_process_list:
+        for pair_number, pair_dict in enumerate(pairs_list, 1):
+            for side, format_ratio in [('лицо', '4:3'), ('оборот', '3:2')]:
+                side_jobs.append({
+                    'card_number': card_number,
+                    'card_name': card_name,
+                    'pair_number': pair_number,
+                    'side': side,
+                    'format_ratio': format_ratio,
+                    'prompt': pair_dict[side],
+                    'filename': side_filename(card_number, card_name, side, pair_number, format_ratio),
+                })
+    return side_jobs
+
+
+def benchmark_prompt_records(card_count=20000):
+    """Память библиотеки промптов и задач: словари против записей core/records.py"""
+    import contextlib
+    import io
+    import pickle
+    import shutil
+    import tempfile
+    import tracemalloc
+    from core.pipeline import build_side_jobs
+    from core.prompt_parser import parse_prompts_file
+    from core.records import Card
+
+    print(f"=== ⏱️ ЗАМЕР: ПАМЯТЬ ПРОМПТОВ И ЗАДАЧ ({card_count} карточек по 3 пары) ===")
+
+    temp_folder = tempfile.mkdtemp()
+    results = {}
+    try:
+        prompts_path = os.path.join(temp_folder, 'prompts.txt')
+        with open(prompts_path, 'w', encoding='utf-8') as prompts_file:
+            for card_number in range(1, card_count + 1):
+                for pair_number in range(1, 4):
+                    for side in ('лицо', 'оборот'):
+                        # Часть текстов повторяется между карточками (общие шаблоны сторон)
+                        prompts_file.write(f"Карточка {card_number} {side} Название карточки {card_number} - "
+                                           f"Промпт {pair_number}: A cheerful cartoon illustration, {side} template "
+                                           f"{(card_number * 3 + pair_number) % 200}\n")
+
+        tracemalloc.start()
+        with contextlib.redirect_stdout(io.StringIO()):
+            legacy_prompts = load_prompts_legacy(prompts_path)
+        legacy_cards = [(card_number, f"Название карточки {card_number}", pairs_list)
+                        for card_number, pairs_list in legacy_prompts.items()]
+        legacy_jobs = build_side_jobs_legacy(legacy_cards)
+        legacy_memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        legacy_pickle = len(pickle.dumps(legacy_cards))
+        del legacy_prompts, legacy_cards, legacy_jobs
+
+        tracemalloc.start()
+        valid_prompts = parse_prompts_file(prompts_path)[0]
+        cards = [Card(card_number, card_name, pairs_list) for card_number, (card_name, pairs_list) in valid_prompts.items()]
+        side_jobs = build_side_jobs(cards)
+        records_memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        records_pickle = len(pickle.dumps(cards))
+
+        results = {'dicts': (legacy_memory, legacy_pickle), 'records': (records_memory, records_pickle),
+                   'jobs': len(side_jobs)}
+        for case_name, (memory, pickle_size) in [('словари', (legacy_memory, legacy_pickle)),
+                                                 ('записи', (records_memory, records_pickle))]:
+            print(f"   {case_name}: {memory / (1024 * 1024):.1f} МБ в памяти ({len(side_jobs)} задач), "
+                  f"карточки для процесса - {pickle_size / (1024 * 1024):.1f} МБ")
+    finally:
+        shutil.rmtree(temp_folder, ignore_errors=True)
+
+    return results
+
+
+def run_all_benchmarks():
+    """Запуск всех замеров"""
+    benchmark_image_presence()
+    benchmark_image_clipboard()
+    benchmark_reference_cache()
+    benchmark_prompt_parser()
+    benchmark_prompt_records()
+
+
+if __name__ == "__main__":
+    run_all_benchmarks()
@@ -816,6 +816,2119 @@ def test_final_system():
         return False
 
 
+def test_completion_detector():
+    """Тест детектора завершения генерации на подготовленных кадрах"""
+    print("=== 🖼️ ТЕСТ ДЕТЕКТОРА ЗАВЕРШЕНИЯ ГЕНЕРАЦИИ ===")
+    
+    try:
+        from PIL import Image
+        from core.completion_detector import CompletionDetector
+        
+        settings_manager = SettingsManager()
+        settings_manager.settings['COMPLETION_POLL_INTERVAL'] = 0.01
+        settings_manager.settings['COMPLETION_STABLE_POLLS'] = 2
+        detector = CompletionDetector(settings_manager)
+        print("   ✅ CompletionDetector создан")
+        
+        background = Image.new('RGB', (40, 40), (25, 25, 25))
+        half_image = Image.new('RGB', (40, 40), (25, 25, 25))
+        half_image.paste(Image.new('RGB', (40, 20), (200, 120, 40)), (0, 0))
+        full_image = Image.new('RGB', (40, 40), (200, 120, 40))
+        full_image.paste(Image.new('RGB', (20, 20), (30, 90, 210)), (10, 10))
+        
+        # Фон -> частичная отрисовка -> готовое изображение (не меняется)
+        frames = [background, background, half_image, full_image, full_image, full_image, full_image]
+        detector.capture_region = lambda: frames.pop(0) if len(frames) > 1 else frames[0]
+        
+        stop_event = multiprocessing.Event()
+        status = detector.wait_for_image(stop_event, 5.0, baseline=background)
+        if status != 'completed':
+            print(f"   ❌ Ожидался статус 'completed', получен '{status}'")
+            return False
+        print(f"   ✅ Изображение обнаружено за {detector.last_elapsed:.2f} сек")
+        
+        # Фон не меняется -> таймаут
+        detector.capture_region = lambda: background
+        status = detector.wait_for_image(stop_event, 0.1, baseline=background)
+        if status != 'timeout':
+            print(f"   ❌ Ожидался статус 'timeout', получен '{status}'")
+            return False
+        print("   ✅ Жёсткий таймаут срабатывает")
+        
+        # Сигнал остановки
+        stop_event.set()
+        status = detector.wait_for_image(stop_event, 5.0, baseline=background)
+        if status != 'stopped':
+            print(f"   ❌ Ожидался статус 'stopped', получен '{status}'")
+            return False
+        print("   ✅ Сигнал остановки обрабатывается")
+        
+        print("\n🎉 ТЕСТ ДЕТЕКТОРА ЗАВЕРШЕНИЯ ГЕНЕРАЦИИ ЗАВЕРШЕН!")
+        return True
+        
+    except Exception as e:
+        print(f"❌ ОШИБКА В ТЕСТЕ ДЕТЕКТОРА ЗАВЕРШЕНИЯ: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_image_presence_detector():
+    """Тест NumPy-оценки области изображения"""
+    print("=== 🔬 ТЕСТ ОЦЕНКИ ОБЛАСТИ ИЗОБРАЖЕНИЯ ===")
+    
+    try:
+        import numpy as np
+        from core.image_presence import ImagePresenceDetector
+        
+        settings_manager = SettingsManager()
+        detector = ImagePresenceDetector(settings_manager)
+        print("   ✅ ImagePresenceDetector создан")
+        
+        background = np.full((60, 60, 3), 25, dtype=np.uint8)
+        spinner = background.copy()
+        spinner[27:33, 27:33] = 220  # Индикатор загрузки в центре - старая проверка по пикселю ошибалась
+        image = np.random.default_rng(1).integers(0, 256, (60, 60, 3), dtype=np.uint8)
+        image[20:40, 20:40] = 25     # Тёмный центр изображения - старая проверка по пикселю ошибалась
+        
+        score = detector.score_frame(background)
+        print(f"   📊 Фон: {score}")
+        if detector.is_image_present(background):
+            print("   ❌ Фон распознан как изображение!")
+            return False
+        
+        if detector.is_image_present(spinner):
+            print("   ❌ Индикатор загрузки распознан как изображение!")
+            return False
+        print("   ✅ Пустая область не считается изображением")
+        
+        score = detector.score_frame(image)
+        print(f"   📊 Изображение: {score}")
+        if not detector.is_image_present(image):
+            print("   ❌ Изображение с тёмным центром не распознано!")
+            return False
+        print("   ✅ Изображение распознано")
+        
+        # Изучение фона по однотонному кадру
+        light_background = np.full((60, 60, 3), 240, dtype=np.uint8)
+        if not detector.learn_background(light_background):
+            print("   ❌ Однотонный кадр не принят как фон!")
+            return False
+        if detector.is_image_present(light_background):
+            print("   ❌ Изученный светлый фон распознан как изображение!")
+            return False
+        if detector.learn_background(image):
+            print("   ❌ Изображение принято как фон!")
+            return False
+        print("   ✅ Фон изучается только по однотонным кадрам")
+        
+        print("\n🎉 ТЕСТ ОЦЕНКИ ОБЛАСТИ ИЗОБРАЖЕНИЯ ЗАВЕРШЕН!")
+        return True
+        
+    except Exception as e:
+        print(f"❌ ОШИБКА В ТЕСТЕ ОЦЕНКИ ОБЛАСТИ ИЗОБРАЖЕНИЯ: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_screen_capture():
+    """Тест захвата областей экрана с кэшем кадра на такт опроса"""
+    print("=== 📸 ТЕСТ ЗАХВАТА ЭКРАНА ===")
+    
+    try:
+        import numpy as np
+        from utils.screen_capture import ScreenCapture
+        
+        capture = ScreenCapture()
+        grabbed_boxes = []
+        
+        def fake_grab(left, top, width, height):
+            grabbed_boxes.append((left, top, width, height))
+            return np.zeros((height, width, 3), dtype=np.uint8)
+        
+        capture._grab_rgb = fake_grab
+        print("   ✅ ScreenCapture создан")
+        
+        # Первый такт: две области - второй запрос расширяет снимок
+        capture.new_tick()
+        capture.get_region((100, 100, 50, 50))
+        capture.get_region((300, 120, 20, 20))
+        
+        # Второй такт: обе области из одного снимка общего прямоугольника
+        grabbed_boxes.clear()
+        capture.new_tick()
+        image_view = capture.get_region((100, 100, 50, 50))
+        title_view = capture.get_region((300, 120, 20, 20))
+        
+        if grabbed_boxes != [(100, 100, 220, 50)]:
+            print(f"   ❌ Ожидался один снимок общего прямоугольника, получено: {grabbed_boxes}")
+            return False
+        print("   ✅ Один снимок на такт для всех областей")
+        
+        if image_view.shape != (50, 50, 3) or title_view.shape != (20, 20, 3):
+            print(f"   ❌ Неверные размеры областей: {image_view.shape}, {title_view.shape}")
+            return False
+        if not (np.shares_memory(image_view, capture._frame) and np.shares_memory(title_view, capture._frame)):
+            print("   ❌ Области скопированы, а не выданы как view!")
+            return False
+        print("   ✅ Области выдаются без копирования")
+        
+        # Области старых тактов не расширяют снимок; далёкие области снимаются по отдельности
+        for probe_region in [(10, 10, 80, 80), (900, 1000, 80, 80), (880, 460, 160, 160)]:
+            capture.new_tick()
+            capture.get_region(probe_region)
+        grabbed_boxes.clear()
+        capture.new_tick()
+        capture.get_region((800, 300, 240, 240))
+        # Только вместе с областью прошлого такта (880, 460, 160, 160), без областей старых тактов
+        if grabbed_boxes != [(800, 300, 240, 320)]:
+            print(f"   ❌ Снимок больше запрошенной области: {grabbed_boxes}")
+            return False
+        capture.get_region((10, 10, 80, 80))
+        if grabbed_boxes[-1] != (10, 10, 80, 80):
+            print(f"   ❌ Далёкие области сняты одним большим прямоугольником: {grabbed_boxes}")
+            return False
+        print("   ✅ Снимок ограничен областями текущего и прошлого такта")
+        
+        metrics = capture.get_metrics()
+        print(f"   📊 Метрики: {capture.format_metrics()}")
+        if metrics['capture_count'] != 8:
+            print(f"   ❌ Неверное количество снимков: {metrics['capture_count']}")
+            return False
+        print("   ✅ Метрики захвата собираются")
+        
+        print("\n🎉 ТЕСТ ЗАХВАТА ЭКРАНА ЗАВЕРШЕН!")
+        return True
+        
+    except Exception as e:
+        print(f"❌ ОШИБКА В ТЕСТЕ ЗАХВАТА ЭКРАНА: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_latency_model():
+    """Тест бюджета ожидания по истории времени генерации"""
+    print("=== 📈 ТЕСТ ИСТОРИИ ВРЕМЕНИ ГЕНЕРАЦИИ ===")
+    
+    test_file = 'data/test_latency_history.json'
+    try:
+        from core.latency_model import LatencyModel
+        
+        settings_manager = SettingsManager()
+        settings_manager.settings['LATENCY_MIN_SAMPLES'] = 3
+        settings_manager.settings['LATENCY_PERCENTILE'] = 100
+        settings_manager.settings['LATENCY_MARGIN'] = 1.5
+        latency_model = LatencyModel(settings_manager, history_file=test_file)
+        print("   ✅ LatencyModel создан")
+        
+        # Пока истории мало - значение по умолчанию
+        budget = latency_model.get_wait_budget('multi_format', '4:3', False, 20.0)
+        if budget != 20.0:
+            print(f"   ❌ Без истории ожидался бюджет 20.0, получен {budget}")
+            return False
+        print("   ✅ Без истории используется значение по умолчанию")
+        
+        for seconds in [8.0, 9.0, 10.0]:
+            latency_model.record('multi_format', '4:3', False, seconds)
+        for seconds in [30.0, 32.0, 40.0]:
+            latency_model.record('multi_format_with_refs', '3:2', True, seconds)
+        
+        fast_budget = latency_model.get_wait_budget('multi_format', '4:3', False, 20.0)
+        slow_budget = latency_model.get_wait_budget('multi_format_with_refs', '3:2', True, 20.0)
+        print(f"   📊 Бюджеты: 4:3 без референса = {fast_budget}, 3:2 с референсом = {slow_budget}")
+        
+        if fast_budget != 15.0 or slow_budget != 60.0:
+            print("   ❌ Бюджеты рассчитаны неверно (ожидались 15.0 и 60.0)")
+            return False
+        print("   ✅ Бюджет сжимается для быстрых и растёт для медленных комбинаций")
+        
+        # История переживает перезапуск
+        reloaded_model = LatencyModel(settings_manager, history_file=test_file)
+        if reloaded_model.get_wait_budget('multi_format', '4:3', False, 20.0) != 15.0:
+            print("   ❌ История не сохранилась в файл!")
+            return False
+        print("   ✅ История сохраняется между запусками")
+
+        # Две линии загрузили историю одновременно - замеры обеих остаются в файле
+        first_lane = LatencyModel(settings_manager, history_file=test_file)
+        second_lane = LatencyModel(settings_manager, history_file=test_file)
+        first_lane.record('multi_format', '3:2', False, 11.0)
+        second_lane.record('multi_format', '3:2', False, 12.0)
+        # Блокировка от упавшего процесса не мешает записи
+        with open(f"{test_file}.lock", 'w'):
+            pass
+        os.utime(f"{test_file}.lock", (0, 0))
+        first_lane.record('multi_format', '3:2', False, 13.0)
+        merged_samples = LatencyModel(settings_manager, history_file=test_file).history.get(
+            first_lane.make_key('multi_format', '3:2', False))
+        print(f"   📊 Замеры двух линий в файле: {merged_samples}")
+        if sorted(merged_samples or []) != [11.0, 12.0, 13.0] or os.path.exists(f"{test_file}.lock"):
+            print("   ❌ Линии затирают замеры друг друга!")
+            return False
+        print("   ✅ Замеры параллельных линий сливаются под блокировкой")
+
+        # Таймауты подряд не попадают в историю и увеличивают бюджет ограниченным шагом
+        settings_manager.settings['LATENCY_TIMEOUT_STEP'] = 0.25
+        timeout_budgets = []
+        for _ in range(5):
+            reloaded_model.record_timeout('multi_format', '4:3', False)
+            timeout_budgets.append(reloaded_model.get_wait_budget('multi_format', '4:3', False, 20.0))
+        print(f"   📊 Бюджеты после таймаутов подряд: {timeout_budgets}")
+        if timeout_budgets != [18.8, 22.5, 22.5, 22.5, 22.5]:
+            print("   ❌ Таймауты увеличивают бюджет без ограничения!")
+            return False
+        if len(reloaded_model.history[reloaded_model.make_key('multi_format', '4:3', False)]) != 3:
+            print("   ❌ Таймаут записан в историю как обычный замер!")
+            return False
+        reloaded_model.record('multi_format', '4:3', False, 9.0)
+        if reloaded_model.get_wait_budget('multi_format', '4:3', False, 20.0) != 15.0:
+            print("   ❌ Обнаруженное изображение не сбросило счёт таймаутов!")
+            return False
+        print("   ✅ Таймауты не накручивают бюджет до LATENCY_MAX_WAIT")
+
+        print("\n🎉 ТЕСТ ИСТОРИИ ВРЕМЕНИ ГЕНЕРАЦИИ ЗАВЕРШЕН!")
+        return True
+        
+    except Exception as e:
+        print(f"❌ ОШИБКА В ТЕСТЕ ИСТОРИИ ВРЕМЕНИ ГЕНЕРАЦИИ: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        for path in (test_file, f"{test_file}.lock"):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def test_ui_waiter():
+    """Тест ожидания шагов UI по визуальному подтверждению"""
+    print("=== ⚡ ТЕСТ ОЖИДАНИЯ ШАГОВ UI ===")
+    
+    try:
+        import time
+        import numpy as np
+        from utils.screen_capture import ScreenCapture
+        from utils.ui_wait import UIWaiter, TemplateVisibleProbe, PixelMatchesProbe
+        
+        screen = np.zeros((200, 200, 3), dtype=np.uint8)
+        capture = ScreenCapture()
+        capture._grab_rgb = lambda left, top, width, height: screen[top:top + height, left:left + width].copy()
+        
+        ui_waiter = UIWaiter(screen_capture=capture)
+        ui_waiter.poll_interval = 0.01
+        ui_waiter.settle_time = 0.0
+        print("   ✅ UIWaiter создан")
+        
+        # Область меняется - ожидание заканчивается сразу, без полного таймаута
+        probe = ui_waiter.probe_region((50, 50, 20, 20))
+        screen[55:65, 55:65] = 255
+        if not ui_waiter.wait_until(probe, 'AFTER_SAVE', timeout=2.0) or ui_waiter.last_elapsed > 0.5:
+            print(f"   ❌ Изменение не обнаружено быстро: {ui_waiter.last_elapsed:.2f} сек")
+            return False
+        print(f"   ✅ Изменение области обнаружено за {ui_waiter.last_elapsed:.2f} сек")
+        
+        # Ничего не меняется - таймаут, шаг записывается в отчёт
+        probe = ui_waiter.probe_region((120, 120, 20, 20))
+        if ui_waiter.wait_until(probe, 'BETWEEN_CLICKS', timeout=0.1):
+            print("   ❌ Неизменная область распознана как изменившаяся!")
+            return False
+        if ui_waiter.timeouts_by_step.get('BETWEEN_CLICKS') != 1:
+            print("   ❌ Таймаут не записан!")
+            return False
+        print("   ✅ Без подтверждения ожидание ограничено таймаутом")
+        
+        # Таймаут шага (сокращённый калибровкой) - дожидаемся прежней паузы DELAYS по умолчанию
+        ui_waiter.timeout_scale = 0.1
+        start_time = time.perf_counter()
+        confirmed = ui_waiter.wait_step(ui_waiter.probe_region((120, 120, 20, 20)), 'BETWEEN_CLICKS')
+        step_time = time.perf_counter() - start_time
+        ui_waiter.timeout_scale = 1.0
+        if confirmed or step_time < 0.45:
+            print(f"   ❌ Без подтверждения шаг занял {step_time:.2f} сек вместо прежней паузы 0.5")
+            return False
+        print(f"   ✅ Без подтверждения - прежняя пауза ({step_time:.2f} сек)")
+        
+        # Подсветка у точки клика не подтверждает открытие списка - проверяется область под полем
+        from config.coordinates import COORDINATES
+        from utils.ui_wait import DROPDOWN_OFFSET
+        original_selector = COORDINATES.get('FORMAT_SELECTOR')
+        COORDINATES['FORMAT_SELECTOR'] = (100, 40)
+        try:
+            list_probe = ui_waiter.probe_coordinate('FORMAT_SELECTOR', (0, DROPDOWN_OFFSET))
+            screen[30:50, 80:120] = 90  # Подсветка поля при наведении
+            if ui_waiter.wait_until(list_probe, 'BETWEEN_CLICKS', timeout=0.1):
+                print("   ❌ Подсветка поля принята за открытие списка!")
+                return False
+            screen[90:160, 70:130] = 200  # Список под полем
+            if not ui_waiter.wait_until(list_probe, 'BETWEEN_CLICKS', timeout=1.0):
+                print("   ❌ Открытие списка не обнаружено!")
+                return False
+        finally:
+            COORDINATES['FORMAT_SELECTOR'] = original_selector
+        print("   ✅ Открытие списка подтверждается под полем, а не подсветкой у курсора")
+        
+        # Шаблон и цвет пикселя
+        template = screen[55:65, 55:65].copy()
+        if not TemplateVisibleProbe(capture, (40, 40, 40, 40), template).check():
+            print("   ❌ Шаблон не найден!")
+            return False
+        if not PixelMatchesProbe(capture, 60, 60, (255, 255, 255)).check():
+            print("   ❌ Цвет пикселя не совпал!")
+            return False
+        print("   ✅ Проверки шаблона и цвета пикселя работают")
+        
+        for report_line in ui_waiter.format_report():
+            print(f"   📊 {report_line}")
+        
+        print("\n🎉 ТЕСТ ОЖИДАНИЯ ШАГОВ UI ЗАВЕРШЕН!")
+        return True
+        
+    except Exception as e:
+        print(f"❌ ОШИБКА В ТЕСТЕ ОЖИДАНИЯ ШАГОВ UI: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_delay_calibrator():
+    """Тест калибровки задержек по времени отклика интерфейса"""
+    print("=== 🎯 ТЕСТ КАЛИБРОВКИ ЗАДЕРЖЕК ===")
+    
+    coordinates_manager = get_coordinates_manager()
+    original_file = coordinates_manager.coordinates_file
+    original_delays = dict(coordinates_manager.delays)
+    test_file = 'data/test_coordinates.json'
+    try:
+        import json
+        from config.coordinates import DELAYS
+        from core.calibration import DelayCalibrator
+        from utils.ui_wait import UIWaiter
+        
+        class ConfirmedProbe:
+            def check(self):
+                return True
+        
+        class NeverConfirmedProbe:
+            def check(self):
+                return False
+        
+        class FakeChatManager:
+            def __init__(self, ui_waiter):
+                self.ui_waiter = ui_waiter
+            
+            def create_new_chat_only(self):
+                return self.ui_waiter.wait_until(ConfirmedProbe(), 'NEW_CHAT_WAIT')
+            
+            def rename_current_chat(self, chat_name):
+                self.ui_waiter.wait_until(ConfirmedProbe(), 'POPUP_OPEN_WAIT')
+                return self.ui_waiter.wait_until(ConfirmedProbe(), 'CHAT_RENAME_WAIT')
+        
+        class FakeGenerator:
+            def __init__(self):
+                self.ui_waiter = UIWaiter()
+                self.ui_waiter.settle_time = 0.0
+                self.chat_manager = FakeChatManager(self.ui_waiter)
+                self.formats = []
+            
+            def select_image_format(self, format_ratio):
+                self.formats.append(format_ratio)
+                # Список форматов не открывается - таймаут
+                self.ui_waiter.wait_until(NeverConfirmedProbe(), 'BETWEEN_CLICKS', timeout=0.05)
+                return True
+        
+        coordinates_manager.coordinates_file = test_file
+        settings_manager = SettingsManager()
+        settings_manager.settings['CALIBRATION_ROUNDS'] = 2
+        settings_manager.settings['CALIBRATION_MIN_DELAY'] = 0.25
+        
+        generator = FakeGenerator()
+        calibrator = DelayCalibrator(settings_manager, generator)
+        calibrator.is_image_on_screen = lambda: False
+        original_waiter = generator.ui_waiter
+        print("   ✅ DelayCalibrator создан")
+        
+        new_delays = calibrator.calibrate()
+        print(f"   📊 Новые задержки: {new_delays}")
+        
+        if generator.ui_waiter is not original_waiter or generator.chat_manager.ui_waiter is not original_waiter:
+            print("   ❌ UIWaiter генератора не восстановлен после калибровки!")
+            return False
+        if generator.formats != ['4:3', '3:2']:
+            print(f"   ❌ Неверные форматы при калибровке: {generator.formats}")
+            return False
+        print("   ✅ Шаги интерфейса прогнаны нужное количество раз")
+        
+        # Нижняя граница - половина значения по умолчанию (CALIBRATION_FLOOR_RATIO), а не CALIBRATION_MIN_DELAY
+        if new_delays.get('NEW_CHAT_WAIT') != 1.0 or new_delays.get('CHAT_RENAME_WAIT') != 0.5:
+            print("   ❌ Быстрые шаги не сокращены до нижней границы около прежних значений!")
+            return False
+        if 'BETWEEN_CLICKS' in new_delays:
+            print("   ❌ Шаг с таймаутом не должен меняться!")
+            return False
+        print("   ✅ Задержки рассчитаны, шаги с таймаутами не тронуты")
+        
+        if DELAYS['NEW_CHAT_WAIT'] != 1.0:
+            print("   ❌ DELAYS не обновлён!")
+            return False
+        with open(test_file, 'r', encoding='utf-8') as f:
+            saved_delays = json.load(f).get('delays', {})
+        if saved_delays.get('NEW_CHAT_WAIT') != 1.0 or 'GENERATION_WAIT' in saved_delays:
+            print(f"   ❌ Неверно сохранены задержки: {saved_delays}")
+            return False
+        print("   ✅ Задержки сохранены в файл координат")
+        
+        # Таймауты - цензурированные замеры: учитываются в перцентиле, пока он не приходится на них
+        settings_manager.settings['CALIBRATION_FLOOR_RATIO'] = 0.0
+        settings_manager.settings['CALIBRATION_PERCENTILE'] = 90
+        censored_waiter = UIWaiter()
+        censored_waiter.elapsed_by_step = {'AFTER_SAVE': [0.2] * 18 + [1.0, 6.0], 'SAVE_DIALOG_WAIT': [0.2] * 17 + [3.0] * 3}
+        censored_waiter.timeouts_by_step = {'AFTER_SAVE': 1, 'SAVE_DIALOG_WAIT': 3}
+        censored_delays = calibrator.compute_delays(censored_waiter)
+        print(f"   📊 С таймаутами: {censored_delays}")
+        if censored_delays.get('AFTER_SAVE') != 0.42 or 'SAVE_DIALOG_WAIT' in censored_delays:
+            print("   ❌ Таймауты учтены неверно!")
+            return False
+        print("   ✅ Таймауты поднимают перцентиль; если он приходится на таймаут - задержка не уменьшается")
+        
+        # Перекалибровка посреди запуска - только при явной настройке
+        calibrations = []
+        mf_generator = MultiFormatGenerator(settings_manager)
+        mf_generator.delay_calibrator.calibrate = lambda stop_event: calibrations.append(True)
+        stop_event = multiprocessing.Event()
+        settings_manager.settings['CALIBRATION_FAILURE_STREAK'] = 2
+        for _ in range(4):
+            mf_generator.track_generation_result(False, stop_event)
+        if calibrations:
+            print("   ❌ Перекалибровка запущена без CALIBRATION_AUTO_RECALIBRATE!")
+            return False
+        settings_manager.settings['CALIBRATION_AUTO_RECALIBRATE'] = True
+        for _ in range(2):
+            mf_generator.track_generation_result(False, stop_event)
+        if len(calibrations) != 1:
+            print("   ❌ Перекалибровка не запущена при CALIBRATION_AUTO_RECALIBRATE!")
+            return False
+        print("   ✅ Перекалибровка посреди запуска - только при CALIBRATION_AUTO_RECALIBRATE")
+        
+        # Калибровка в другом процессе записала задержки в файл - рабочий процесс перечитывает их при старте
+        import json
+        from config.coordinates import DELAYS
+        with open(test_file, 'w', encoding='utf-8') as file:
+            json.dump({'coordinates': {}, 'relative_movements': {}, 'delays': {'AFTER_SAVE': 0.7}}, file)
+        coordinates_manager.delays['AFTER_SAVE'] = 2.0
+        coordinates_manager.delays['NEW_CHAT_WAIT'] = 0.3
+        delays = coordinates_manager.delays
+        generation_wait = delays['GENERATION_WAIT']
+        coordinates_manager.reload_delays()
+        if (delays is not DELAYS or delays['AFTER_SAVE'] != 0.7
+                or delays['NEW_CHAT_WAIT'] != coordinates_manager.default_delays['NEW_CHAT_WAIT']
+                or delays['GENERATION_WAIT'] != generation_wait):
+            print(f"   ❌ Задержки из файла не перечитаны: {delays}")
+            return False
+        print("   ✅ Задержки калибровки перечитываются из файла в тот же DELAYS")
+        
+        print("\n🎉 ТЕСТ КАЛИБРОВКИ ЗАДЕРЖЕК ЗАВЕРШЕН!")
+        return True
+        
+    except Exception as e:
+        print(f"❌ ОШИБКА В ТЕСТЕ КАЛИБРОВКИ ЗАДЕРЖЕК: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        coordinates_manager.delays.update(original_delays)
+        coordinates_manager.coordinates_file = original_file
+        if os.path.exists(test_file):
+            os.remove(test_file)
+
+
+def test_input_driver():
+    """Тест драйвера ввода с явными задержками"""
+    print("=== ⌨️ ТЕСТ ДРАЙВЕРА ВВОДА ===")
+    
+    coordinates_manager = get_coordinates_manager()
+    original_coordinate = coordinates_manager.coordinates['PROMPT_INPUT']
+    try:
+        import pickle
+        import types
+        import pyautogui
+        import utils.input_driver as input_driver_module
+        from core.chat_manager import ChatManager
+        from utils.input_driver import PyAutoGUIInputDriver, RecordingInputDriver
+        
+        # Вызовы pyautogui подменяются записью: пауза должна отключаться в каждом вызове,
+        # в том числе у драйвера, восстановленного через pickle (как в рабочем процессе)
+        original_pause = pyautogui.PAUSE
+        pause_flags = []
+        def record_call(*args, **kwargs):
+            pause_flags.append(kwargs.get('_pause', True))
+        fake_pyautogui = types.SimpleNamespace(**{name: record_call for name in
+                                                  ('click', 'rightClick', 'move', 'hotkey', 'press', 'write')})
+        original_module = input_driver_module.pyautogui
+        input_driver_module.pyautogui = fake_pyautogui
+        try:
+            restored_driver = pickle.loads(pickle.dumps(PyAutoGUIInputDriver({action: 0.0 for action in input_driver_module.ACTION_LATENCY})))
+            restored_driver.click(1, 2)
+            restored_driver.click()
+            restored_driver.right_click(1, 2)
+            restored_driver.move(0, 10)
+            restored_driver.key_sequence([('ctrl', 'a'), 'enter'])
+            restored_driver.write("текст")
+        finally:
+            input_driver_module.pyautogui = original_module
+        if len(pause_flags) != 7 or any(pause_flags) or pyautogui.PAUSE != original_pause:
+            print(f"   ❌ Скрытая пауза pyautogui не отключена: {pause_flags}, PAUSE={pyautogui.PAUSE}")
+            return False
+        print("   ✅ Пауза pyautogui отключена в каждом вызове, глобальная PAUSE не меняется")
+        
+        input_driver = RecordingInputDriver()
+        chat_manager = ChatManager(input_driver=input_driver)
+        coordinates_manager.coordinates['PROMPT_INPUT'] = (100, 200)
+        
+        if not chat_manager.click_coordinate('PROMPT_INPUT', "поле ввода промпта"):
+            print("   ❌ Клик по координате не выполнен!")
+            return False
+        input_driver.key_sequence([('ctrl', 'a'), ('ctrl', 'v'), 'enter'])
+        
+        expected_actions = [
+            ('click', (100, 200)),
+            ('hotkey', ('ctrl', 'a')),
+            ('hotkey', ('ctrl', 'v')),
+            ('press', ('enter',)),
+        ]
+        if input_driver.actions != expected_actions:
+            print(f"   ❌ Неверные действия: {input_driver.actions}")
+            return False
+        print("   ✅ Клик ChatManager и последовательность клавиш идут через драйвер")
+        
+        metrics = input_driver.get_metrics()
+        print(f"   📊 Метрики: {input_driver.format_metrics()}")
+        if metrics['action_counts'] != {'click': 1, 'key_sequence': 1} or metrics['latency_ms'] != 0:
+            print(f"   ❌ Неверные метрики: {metrics}")
+            return False
+        print("   ✅ Последовательность считается одним действием, задержки учитываются")
+        
+        print("\n🎉 ТЕСТ ДРАЙВЕРА ВВОДА ЗАВЕРШЕН!")
+        return True
+        
+    except Exception as e:
+        print(f"❌ ОШИБКА В ТЕСТЕ ДРАЙВЕРА ВВОДА: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        coordinates_manager.coordinates['PROMPT_INPUT'] = original_coordinate
+
+
+def test_tab_pipeline():
+    """Тест конвейерной генерации по вкладкам"""
+    print("=== 🗂️ ТЕСТ КОНВЕЙЕРА ПО ВКЛАДКАМ ===")
+    
+    try:
+        import time
+        import threading
+        from core.pipeline import TabPipeline, build_side_jobs
+        from utils.input_driver import RecordingInputDriver
+        
+        # Время генерации (сек) для каждой задачи по порядку
+        durations = [0.3, 0.1, 0.2, 0.1, 0.1, 0.1]
+        
+        class FakeUIWaiter:
+            def probe_region(self, region):
+                return None
+            
+            def wait_until(self, probe, step_name, description="", timeout=None, stop_event=None):
+                return False
+            
+            def wait_step(self, probe, step_name, description="", stop_event=None):
+                return False
+            
+            def pause(self, seconds, stop_event=None):
+                time.sleep(min(seconds, 0.02))
+                return True
+        
+        class FakeDetector:
+            def get_image_region(self):
+                return (0, 0, 10, 10)
+            
+            def check_image_appeared(self, baseline, previous_result=None):
+                return time.time() - baseline['submitted_at'] >= baseline['duration']
+        
+        class FakeLatencyModel:
+            def get_wait_budget(self, generation_mode, format_ratio, has_reference, default_wait):
+                return 5.0
+        
+        class FakeGenerator:
+            def __init__(self):
+                self.settings_manager = SettingsManager()
+                self.ui_waiter = FakeUIWaiter()
+                self.input_driver = RecordingInputDriver()
+                self.completion_detector = FakeDetector()
+                self.latency_model = FakeLatencyModel()
+                self.submitted = 0
+                self.harvested = []
+                self.record_flags = []
+                self.completed = []
+            
+            def submit_side(self, card_number, card_name, pair_number, side, prompt, format_ratio, stop_event):
+                baseline = {'submitted_at': time.time(), 'duration': durations[self.submitted % len(durations)]}
+                self.submitted += 1
+                return {'chat_name': f"{card_number}-{pair_number}-{side}", 'generation_mode': 'multi_format',
+                        'format_ratio': format_ratio, 'reference_attached': False,
+                        'baseline_frame': baseline, 'submitted_at': baseline['submitted_at']}
+            
+            def harvest_side(self, submission, stop_event, wait_timeout=None):
+                self.harvested.append(submission['chat_name'])
+                self.record_flags.append(submission.get('record_latency', True))
+                return True
+            
+            def complete_job(self, job, success, stop_event):
+                self.completed.append((job['card_number'], job['pair_number'], job['side'], success))
+        
+        cards = [
+            (1, "Первая", [{'лицо': "п1", 'оборот': "о1"}, {'лицо': "п2", 'оборот': "о2"}]),
+            (2, "Вторая", [{'лицо': "п3", 'оборот': "о3"}]),
+        ]
+        side_jobs = build_side_jobs(cards)
+        if len(side_jobs) != 6 or side_jobs[1]['format_ratio'] != '3:2' or side_jobs[4]['card_number'] != 2:
+            print(f"   ❌ Неверный список задач: {side_jobs}")
+            return False
+        print("   ✅ Задачи сторон построены из списка карточек")
+        
+        generator = FakeGenerator()
+        generator.settings_manager.settings['COMPLETION_POLL_INTERVAL'] = 0.01
+        pipeline = TabPipeline(generator, 3)
+        
+        start_time = time.time()
+        results = pipeline.run(side_jobs, threading.Event())
+        total_time = time.time() - start_time
+        
+        print(f"   📊 Порядок сбора: {generator.harvested}, {total_time:.2f} сек")
+        if len(results) != 6 or not all(success for _, success in results):
+            print(f"   ❌ Обработаны не все задачи: {results}")
+            return False
+        if len(generator.completed) != 6:
+            print(f"   ❌ Результаты не переданы генератору: {generator.completed}")
+            return False
+        if generator.harvested[0] != "1-1-оборот":
+            print("   ❌ Первым должен собираться самый быстрый результат!")
+            return False
+        if total_time >= sum(durations):
+            print("   ❌ Ожидания генерации не перекрываются!")
+            return False
+        print("   ✅ Результаты собираются по готовности, ожидания перекрываются")
+        
+        tab_hotkeys = [keys for action, keys in generator.input_driver.actions if action == 'hotkey']
+        if not tab_hotkeys or any(keys[0] != 'ctrl' or keys[1] not in ('1', '2', '3') for keys in tab_hotkeys):
+            print(f"   ❌ Неверное переключение вкладок: {tab_hotkeys}")
+            return False
+        print(f"   ✅ Вкладки переключаются через Ctrl+1..3 ({pipeline.tab_switch_count} раз)")
+        
+        # Время готовности при нескольких вкладках завышено обслуживанием остальных - в историю не идёт
+        single_tab_generator = FakeGenerator()
+        single_tab_generator.settings_manager.settings['COMPLETION_POLL_INTERVAL'] = 0.01
+        TabPipeline(single_tab_generator, 1).run(side_jobs[:2], threading.Event())
+        if any(generator.record_flags) or not all(single_tab_generator.record_flags):
+            print(f"   ❌ Замеры конвейера: {generator.record_flags}, одна вкладка: {single_tab_generator.record_flags}")
+            return False
+        print("   ✅ Замеры времени при нескольких вкладках не попадают в историю LatencyModel")
+        
+        print("\n🎉 ТЕСТ КОНВЕЙЕРА ПО ВКЛАДКАМ ЗАВЕРШЕН!")
+        return True
+        
+    except Exception as e:
+        print(f"❌ ОШИБКА В ТЕСТЕ КОНВЕЙЕРА ПО ВКЛАДКАМ: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_parallel_lanes():
+    """Тест распределения карточек по параллельным линиям и сводного прогресса"""
+    print("=== 🛤️ ТЕСТ ПАРАЛЛЕЛЬНЫХ ЛИНИЙ ===")
+    
+    try:
+        import queue
+        from core.lanes import LaneProgress, lane_coordinates_file, split_cards_across_lanes
+        
+        pair = {'лицо': "п", 'оборот': "о"}
+        cards = [(number, f"Карточка {number}", [pair] * pairs_count)
+                 for number, pairs_count in [(1, 5), (2, 1), (3, 3), (4, 2), (5, 1)]]
+        
+        lanes = split_cards_across_lanes(cards, 2)
+        lane_pairs = [sum(len(pairs_list) for _, _, pairs_list in lane) for lane in lanes]
+        lane_numbers = [[card[0] for card in lane] for lane in lanes]
+        print(f"   📊 Линии: {lane_numbers}, пар: {lane_pairs}")
+        
+        if sorted(number for lane in lane_numbers for number in lane) != [1, 2, 3, 4, 5]:
+            print("   ❌ Карточки потеряны или задублированы!")
+            return False
+        if max(lane_pairs) - min(lane_pairs) > 1:
+            print("   ❌ Нагрузка линий не выровнена!")
+            return False
+        if any(lane != sorted(lane) for lane in lane_numbers):
+            print("   ❌ Внутри линии нарушен порядок карточек!")
+            return False
+        print("   ✅ Карточки распределены по линиям с выравниванием по парам")
+        
+        if lane_coordinates_file(0) == lane_coordinates_file(1):
+            print("   ❌ У линий общий файл координат!")
+            return False
+        print("   ✅ У каждой линии свой файл координат")
+        
+        # Генератор линии отправляет результат каждой задачи в очередь
+        generator = MultiFormatGenerator(SettingsManager())
+        generator.progress_queue = queue.Queue()
+        generator.lane_name = '2'
+        generator.report_job_progress({'card_number': 3, 'pair_number': 1, 'side': 'лицо'}, True)
+        generator.report_job_progress({'card_number': 3, 'pair_number': 1, 'side': 'оборот'}, False)
+        
+        progress = LaneProgress(['1', '2'], total_images=24)
+        while not generator.progress_queue.empty():
+            print(f"   📊 {progress.apply(generator.progress_queue.get_nowait())}")
+        progress.apply({'lane': '1', 'finished': True})
+        if progress.get_images_created() != 1 or progress.is_finished():
+            print("   ❌ Неверный сводный прогресс!")
+            return False
+        progress.apply({'lane': '2', 'finished': True})
+        if not progress.is_finished():
+            print("   ❌ Завершение линий не учтено!")
+            return False
+        print("   ✅ Прогресс линий сводится в одну картину")
+        
+        print("\n🎉 ТЕСТ ПАРАЛЛЕЛЬНЫХ ЛИНИЙ ЗАВЕРШЕН!")
+        return True
+        
+    except Exception as e:
+        print(f"❌ ОШИБКА В ТЕСТЕ ПАРАЛЛЕЛЬНЫХ ЛИНИЙ: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_job_queue():
+    """Тест очереди задач SQLite: захват, завершение и продолжение после перезапуска"""
+    print("\n🧪 ТЕСТ ОЧЕРЕДИ ЗАДАЧ")
+    print("=" * 50)
+    
+    import tempfile
+    db_path = os.path.join(tempfile.mkdtemp(), 'jobs.sqlite')
+    
+    try:
+        from core.job_queue import JobQueue, STATE_DONE, STATE_FAILED, STATE_PENDING, STATE_RUNNING
+        from core.pipeline import build_side_jobs
+        
+        cards = [
+            (1, "Первая", [{'лицо': "п1", 'оборот': "о1"}, {'лицо': "п2", 'оборот': "о2"}]),
+            (2, "Вторая", [{'лицо': "п3", 'оборот': "о3"}]),
+        ]
+        job_queue = JobQueue(db_path)
+        job_keys = job_queue.sync_jobs(build_side_jobs(cards))
+        if len(job_keys) != 6 or job_queue.get_counts(current_run=True)[STATE_PENDING] != 6:
+            print(f"   ❌ Неверное наполнение очереди: {job_queue.get_counts(current_run=True)}")
+            return False
+        print("   ✅ Задачи добавлены в очередь")
+        
+        first_job = job_queue.claim_next()
+        second_job = job_queue.claim_next()
+        if (first_job['card_number'], first_job['pair_number'], first_job['side']) != (1, 1, 'лицо'):
+            print(f"   ❌ Нарушен порядок задач: {first_job}")
+            return False
+        job_queue.mark_done(first_job['id'])
+        job_queue.mark_failed(second_job['id'], 'тест')
+        third_job = job_queue.claim_next()  # "Падение" процесса: задача остаётся в running
+        
+        counts = job_queue.get_counts(current_run=True)
+        print(f"   📊 {job_queue.format_counts(current_run=True)}")
+        if counts[STATE_DONE] != 1 or counts[STATE_FAILED] != 1 or counts[STATE_RUNNING] != 1:
+            print("   ❌ Неверные состояния задач!")
+            return False
+        
+        # Перезапуск: running и failed возвращаются в pending, выполненная задача пропускается
+        restarted_queue = JobQueue(db_path)
+        if restarted_queue.recover_running() != 1:
+            print("   ❌ Незавершённая задача не возвращена в очередь!")
+            return False
+        job_keys = restarted_queue.sync_jobs(build_side_jobs(cards))
+        remaining_jobs = list(restarted_queue.iter_claims())
+        remaining_sides = [(job['card_number'], job['pair_number'], job['side']) for job in remaining_jobs]
+        if len(remaining_jobs) != 5 or (1, 1, 'лицо') in remaining_sides:
+            print(f"   ❌ Неверное продолжение: {remaining_sides}")
+            return False
+        if remaining_sides[0] != (1, 1, 'оборот') or third_job['attempts'] != 1:
+            print(f"   ❌ Повторная попытка не в исходном порядке: {remaining_sides}")
+            return False
+        print("   ✅ После перезапуска продолжаем с места остановки")
+        
+        # Задачи другого запуска (другие карточки) не захватываются; захват - по индексу, без чтения очереди
+        other_queue = JobQueue(db_path)
+        other_queue.sync_jobs(build_side_jobs([(3, "Третья", [{'лицо': "п4", 'оборот': "о4"}])]))
+        next_queue = JobQueue(db_path)
+        next_queue.sync_jobs(build_side_jobs(cards[1:]))
+        if next_queue.claim_next() is not None:
+            print("   ❌ Захвачена задача не из своего запуска!")
+            return False
+        import sqlite3
+        connection = sqlite3.connect(db_path)
+        plan = connection.execute("EXPLAIN QUERY PLAN SELECT * FROM jobs WHERE run_id = ? AND state = ? "
+                                  "ORDER BY position LIMIT 1", (next_queue.run_id, STATE_PENDING)).fetchall()
+        connection.close()
+        if not any('jobs_run_claim' in str(row[-1]) for row in plan) or any('TEMP B-TREE' in str(row[-1]) for row in plan):
+            print(f"   ❌ Захват не использует индекс: {plan}")
+            return False
+        if other_queue.get_counts(current_run=True)[STATE_PENDING] != 2 or sum(next_queue.get_counts().values()) != 8:
+            print(f"   ❌ Неверный счёт по запуску: {other_queue.get_counts(current_run=True)}")
+            return False
+        print("   ✅ Захват и счёт - запросами по индексу в пределах своего запуска")
+        
+        print("\n🎉 ТЕСТ ОЧЕРЕДИ ЗАДАЧ ЗАВЕРШЕН!")
+        return True
+        
+    except Exception as e:
+        print(f"❌ ОШИБКА В ТЕСТЕ ОЧЕРЕДИ ЗАДАЧ: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        import shutil
+        shutil.rmtree(os.path.dirname(db_path), ignore_errors=True)
+
+
+def test_output_index():
+    """Тест индекса готовых файлов: пропуск уже сохранённых сторон"""
+    print("\n🧪 ТЕСТ ИНДЕКСА ГОТОВЫХ ФАЙЛОВ")
+    print("=" * 50)
+    
+    import shutil
+    import tempfile
+    save_folder = tempfile.mkdtemp()
+    
+    try:
+        import numpy as np
+        from PIL import Image
+        from core.job_queue import JobQueue, STATE_DONE, STATE_PENDING
+        from core.output_index import OutputIndex
+        from core.pipeline import build_side_jobs
+        
+        cards = [(7, "Балтийское море", [{'лицо': "п1", 'оборот': "о1"}])]
+        side_jobs = build_side_jobs(cards)
+        face_filename, back_filename = side_jobs[0]['filename'], side_jobs[1]['filename']
+        if face_filename != "Карточка_7_Балтийское_море_лицо_промпт_1_4x3.png":
+            print(f"   ❌ Неверное имя файла: {face_filename}")
+            return False
+        
+        # Готовое лицо, недописанный оборот (обрезанный PNG) и посторонний файл
+        noise = np.random.randint(0, 255, (64, 64, 3), dtype=np.uint8)
+        Image.fromarray(noise).save(os.path.join(save_folder, face_filename))
+        with open(os.path.join(save_folder, face_filename), 'rb') as f:
+            png_bytes = f.read()
+        with open(os.path.join(save_folder, back_filename), 'wb') as f:
+            f.write(png_bytes[:len(png_bytes) // 2])
+        with open(os.path.join(save_folder, 'notes.txt'), 'w') as f:
+            f.write("не изображение")
+        
+        output_index = OutputIndex(save_folder, min_size=100).build()
+        print(f"   📊 Готовых: {sorted(output_index.filenames)}, повреждённых: {output_index.invalid_filenames}")
+        if not output_index.contains(face_filename) or output_index.contains(back_filename):
+            print("   ❌ Неверная проверка готовых файлов!")
+            return False
+        print("   ✅ Готовый файл найден, недописанный будет сгенерирован заново")
+        
+        # Очередь задач приводится к индексу: готовые закрываются, пропавшие возвращаются
+        job_queue = JobQueue(os.path.join(save_folder, 'jobs.sqlite'))
+        job_keys = job_queue.sync_jobs(side_jobs)
+        job_queue.mark_keys_done([job_keys[0]])
+        job_queue.mark_done(job_queue.claim_next()['id'])
+        job_queue.reopen_keys([job_keys[1]])
+        remaining_jobs = list(job_queue.iter_claims())
+        if [job['side'] for job in remaining_jobs] != ['оборот']:
+            print(f"   ❌ Неверные задачи после сверки с индексом: {remaining_jobs}")
+            return False
+        print("   ✅ Очередь задач сверяется с папкой сохранения")
+        
+        print("\n🎉 ТЕСТ ИНДЕКСА ГОТОВЫХ ФАЙЛОВ ЗАВЕРШЕН!")
+        return True
+        
+    except Exception as e:
+        print(f"❌ ОШИБКА В ТЕСТЕ ИНДЕКСА ГОТОВЫХ ФАЙЛОВ: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        shutil.rmtree(save_folder, ignore_errors=True)
+
+
+def test_retry_queue():
+    """Тест отложенных повторов: экспоненциальная пауза, лимит попыток, причины неудач"""
+    print("\n🧪 ТЕСТ ОТЛОЖЕННЫХ ПОВТОРОВ")
+    print("=" * 50)
+    
+    import shutil
+    import tempfile
+    import threading
+    temp_folder = tempfile.mkdtemp()
+    
+    try:
+        from core.job_queue import JobQueue
+        from core.pipeline import build_side_jobs
+        from core.retry_queue import RetryQueue
+        
+        retry_queue = RetryQueue(max_attempts=4, base_delay=10.0, max_delay=30.0)
+        backoffs = [retry_queue.get_backoff(attempts) for attempts in range(1, 5)]
+        print(f"   📊 Паузы перед повторами: {backoffs}")
+        if backoffs != [10.0, 20.0, 30.0, 30.0]:
+            print("   ❌ Неверная экспоненциальная пауза!")
+            return False
+        
+        # Раньше выходит задача, у которой раньше закончилась пауза
+        side_jobs = build_side_jobs([(1, "Первая", [{'лицо': "п1", 'оборот': "о1"}])])
+        retry_queue.push(dict(side_jobs[0], attempts=2), "таймаут")
+        retry_queue.push(dict(side_jobs[1], attempts=1), "сохранение")
+        if retry_queue.pop()[1]['side'] != 'оборот':
+            print("   ❌ Нарушен порядок повторов!")
+            return False
+        if retry_queue.push(dict(side_jobs[0], attempts=4), "таймаут") or len(retry_queue.abandoned_jobs) != 1:
+            print("   ❌ Лимит попыток не соблюдается!")
+            return False
+        print("   ✅ Порядок повторов и лимит попыток")
+        
+        # Генератор: неудача основного прохода повторяется после него, причины пишутся в очередь задач
+        settings_manager = SettingsManager()
+        settings_manager.settings['CALIBRATION_FAILURE_STREAK'] = 0
+        generator = MultiFormatGenerator(settings_manager)
+        generator.job_queue = JobQueue(os.path.join(temp_folder, 'jobs.sqlite'))
+        generator.retry_queue = RetryQueue(max_attempts=3, base_delay=0.01, max_delay=0.02)
+        job_keys = generator.job_queue.sync_jobs(side_jobs[:1])
+        
+        outcomes = [False, False, True]
+        def fake_generate_single_side(card_number, card_name, pair_number, side, prompt, format_ratio, stop_event):
+            generator.last_failure_reason = "" if outcomes[0] else f"сбой {len(outcomes)}"
+            return outcomes.pop(0)
+        generator.generate_single_side = fake_generate_single_side
+        
+        stop_event = threading.Event()
+        results = generator.run_side_jobs(generator.job_queue.iter_claims(stop_event), stop_event)
+        results += generator.run_side_jobs(generator.iter_retries(stop_event), stop_event)
+        
+        attempts = generator.job_queue.get_attempts(results[-1][0]['id'])
+        print(f"   📊 Попытки: {[(attempt['attempt'], attempt['state'], attempt['reason']) for attempt in attempts]}")
+        if [success for _, success in results] != [False, False, True]:
+            print(f"   ❌ Неверные результаты повторов: {results}")
+            return False
+        if [attempt['reason'] for attempt in attempts[:2]] != ["сбой 3", "сбой 2"] or attempts[2]['state'] != 'done':
+            print("   ❌ Причины неудач не записаны!")
+            return False
+        print("   ✅ Сторона догенерирована повторами, причины неудач сохранены")
+        
+        # Задача, исчерпавшая попытки в прошлом запуске, в новом запуске снова повторяется
+        for run_outcomes in ([False, False], [False, True]):
+            generator.job_queue = JobQueue(generator.job_queue.db_path)
+            generator.retry_queue = RetryQueue(max_attempts=2, base_delay=0.01, max_delay=0.02)
+            generator.job_queue.sync_jobs(side_jobs[1:])
+            outcomes = list(run_outcomes)
+            results = generator.run_side_jobs(generator.job_queue.iter_claims(stop_event), stop_event)
+            results += generator.run_side_jobs(generator.iter_retries(stop_event), stop_event)
+        attempts = generator.job_queue.get_attempts(results[-1][0]['id'])
+        print(f"   📊 Второй запуск: {[success for _, success in results]}, всего попыток {len(attempts)}")
+        if [success for _, success in results] != [False, True] or generator.retry_queue.abandoned_jobs:
+            print("   ❌ Попытки прошлого запуска засчитаны в новом!")
+            return False
+        if [attempt['attempt'] for attempt in attempts] != [1, 2, 3, 4]:
+            print("   ❌ Общая история попыток не продолжается!")
+            return False
+        print("   ✅ Лимит попыток считается по текущему запуску, история - по всем")
+        
+        print("\n🎉 ТЕСТ ОТЛОЖЕННЫХ ПОВТОРОВ ЗАВЕРШЕН!")
+        return True
+        
+    except Exception as e:
+        print(f"❌ ОШИБКА В ТЕСТЕ ОТЛОЖЕННЫХ ПОВТОРОВ: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        shutil.rmtree(temp_folder, ignore_errors=True)
+
+
+def test_chat_reuse():
+    """Тест режима общего чата: новый чат и переименование - один раз на карточку"""
+    print("\n🧪 ТЕСТ РЕЖИМА ОБЩЕГО ЧАТА")
+    print("=" * 50)
+    
+    try:
+        import threading
+        from utils.input_driver import RecordingInputDriver, set_input_driver
+        
+        class FakeUIWaiter:
+            def probe_coordinate(self, coord_name, offset=(0, 0)):
+                return None
+            
+            def wait_until(self, probe, step_name, description="", timeout=None, stop_event=None):
+                return True
+            
+            def wait_step(self, probe, step_name, description="", stop_event=None):
+                return True
+        
+        class FakeChatManager:
+            def __init__(self):
+                self.calls = []
+            
+            def create_new_chat_only(self):
+                self.calls.append('new_chat')
+                return True
+            
+            def rename_current_chat(self, chat_name):
+                self.calls.append(f"rename: {chat_name}")
+                return True
+            
+            def click_coordinate(self, coord_name, description=""):
+                return True
+        
+        class FakeClipboard:
+            def safe_paste_text(self, text, select_all=False):
+                return True
+        
+        input_driver = RecordingInputDriver()
+        set_input_driver(input_driver)
+        settings_manager = SettingsManager()
+        settings_manager.settings.update({'CHAT_REUSE_MODE': True, 'CHAT_REUSE_MAX_SIDES': 3,
+                                          'COMPLETION_DETECTION': False, 'GENERATION_MODE': 'multi_format'})
+        generator = MultiFormatGenerator(settings_manager)
+        generator.ui_waiter = FakeUIWaiter()
+        generator.chat_manager = FakeChatManager()
+        generator.clipboard = FakeClipboard()
+        
+        stop_event = threading.Event()
+        sides = [(1, 1, 'лицо', '4:3'), (1, 2, 'лицо', '4:3'), (1, 1, 'оборот', '3:2'),
+                 (1, 2, 'оборот', '3:2'), (2, 1, 'лицо', '4:3')]
+        filenames = []
+        for card_number, pair_number, side, format_ratio in sides:
+            submission = generator.submit_side(card_number, "Тест", pair_number, side, "промпт", format_ratio, stop_event)
+            filenames.append(submission['filename'])
+        
+        new_chats = generator.chat_manager.calls.count('new_chat')
+        selected_formats = [args[0] for action, args in input_driver.actions if action == 'write']
+        print(f"   📊 Чатов: {new_chats}, выбор формата: {selected_formats}")
+        print(f"   📊 Действия чата: {generator.chat_manager.calls}")
+        # Карточка 1: 3 стороны в первом чате + 1 во втором (лимит), карточка 2 - свой чат
+        if new_chats != 3 or len(generator.chat_manager.calls) != 6:
+            print("   ❌ Неверное число новых чатов/переименований!")
+            return False
+        if selected_formats != ['4:3', '3:2', '3:2', '4:3']:
+            print("   ❌ Формат выбирается без необходимости!")
+            return False
+        # Без переименования и выбора формата фокус остаётся в поле ввода - возврат к нему не нужен
+        if generator.skipped_ui_actions.get('возврат к полю промпта') != 1:
+            print(f"   ❌ Лишний возврат к полю промпта: {generator.skipped_ui_actions}")
+            return False
+        if filenames[3] != "Карточка_1_Тест_оборот_промпт_2_3x2.png":
+            print(f"   ❌ Имя файла изменилось: {filenames[3]}")
+            return False
+        print("   ✅ Чат карточки переиспользуется, формат меняется только при смене")
+        
+        # После ошибки чат не продолжается: состояние UI неизвестно
+        generator.chat_manager.click_coordinate = lambda coord_name, description="": False
+        generator.submit_side(2, "Тест", 2, 'оборот', "промпт", '3:2', stop_event)
+        if generator.ui_state.chat is not None or generator.ui_state.format_ratio is not None:
+            print("   ❌ Чат продолжается после ошибки!")
+            return False
+        print("   ✅ После ошибки следующая сторона начинает новый чат")
+        
+        # В продолженном чате до отправки в области ещё предыдущее изображение
+        import numpy as np
+        from core.completion_detector import CompletionDetector
+        settings_manager.settings.update({'COMPLETION_DETECTION': True, 'COMPLETION_POLL_INTERVAL': 0.01,
+                                          'COMPLETION_STABLE_POLLS': 2})
+        rng = np.random.default_rng(13)
+        background = np.full((40, 40, 3), 25, dtype=np.uint8)
+        previous_image = rng.integers(0, 256, (40, 40, 3), dtype=np.uint8)
+        reply_in_progress = rng.integers(0, 256, (40, 40, 3), dtype=np.uint8)  # Чат прокручен к новому ответу
+        new_image = rng.integers(0, 256, (40, 40, 3), dtype=np.uint8)
+        screen = [background]
+        detector = CompletionDetector(settings_manager)
+        detector.capture_region = lambda: screen[0]
+        generator.completion_detector = detector
+        generator.chat_manager = FakeChatManager()
+        
+        def submit_hotkey(*keys):
+            if keys == ('ctrl', 'enter') and screen[0] is previous_image:
+                screen[0] = reply_in_progress
+        generator.input_driver._hotkey = submit_hotkey
+        
+        generator.submit_side(3, "Тест", 1, 'лицо', "промпт", '4:3', stop_event)
+        screen[0] = previous_image
+        generator.ui_state.result_saved(previous_image)  # Сохранено первое изображение чата
+        submission = generator.submit_side(3, "Тест", 1, 'оборот', "промпт", '3:2', stop_event)
+        if submission['baseline_frame'] is not reply_in_progress or submission['previous_result_frame'] is not previous_image:
+            print("   ❌ В продолженном чате базовый кадр должен сниматься после отправки!")
+            return False
+        status = detector.wait_for_image(stop_event, 0.1, submission['baseline_frame'], submission['previous_result_frame'])
+        screen[0] = previous_image
+        if status != 'timeout' or detector.check_image_appeared(submission['baseline_frame'], submission['previous_result_frame']):
+            print(f"   ❌ Предыдущее изображение или прокрутка чата приняты за новое изображение ({status})!")
+            return False
+        screen[0] = new_image
+        status = detector.wait_for_image(stop_event, 2.0, submission['baseline_frame'], submission['previous_result_frame'])
+        if status != 'completed' or detector.last_frame is not new_image:
+            print(f"   ❌ Новое изображение в продолженном чате не обнаружено ({status})!")
+            return False
+        print("   ✅ Базовый кадр в продолженном чате - после отправки, предыдущее изображение не принимается за новое")
+        
+        print("\n🎉 ТЕСТ РЕЖИМА ОБЩЕГО ЧАТА ЗАВЕРШЕН!")
+        return True
+        
+    except Exception as e:
+        print(f"❌ ОШИБКА В ТЕСТЕ РЕЖИМА ОБЩЕГО ЧАТА: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        from utils.input_driver import set_input_driver
+        set_input_driver(None)
+
+
+def test_ui_state():
+    """Тест модели состояния интерфейса: действия с уже выполненным результатом пропускаются"""
+    print("\n🧪 ТЕСТ СОСТОЯНИЯ ИНТЕРФЕЙСА")
+    print("=" * 50)
+    
+    try:
+        import threading
+        from core.ui_state import UIState
+        from utils.input_driver import RecordingInputDriver, set_input_driver
+        
+        ui_state = UIState()
+        ui_state.new_chat(5)
+        ui_state.format_ratio = '4:3'
+        ui_state.prompt_focused = True
+        ui_state.reference_attached = True
+        ui_state.prompt_submitted()
+        if ui_state.chat['sides'] != 1 or ui_state.reference_attached or not ui_state.prompt_focused:
+            print("   ❌ Неверное состояние после отправки промпта!")
+            return False
+        ui_state.new_chat(6)
+        if ui_state.format_ratio is not None or UIState(format_kept_in_new_chat=True).format_ratio is not None:
+            print("   ❌ Формат нового чата должен быть неизвестен!")
+            return False
+        print("   ✅ Переходы состояния")
+        
+        class FakeUIWaiter:
+            def probe_coordinate(self, coord_name, offset=(0, 0)):
+                return None
+            
+            def wait_until(self, probe, step_name, description="", timeout=None, stop_event=None):
+                return True
+            
+            def wait_step(self, probe, step_name, description="", stop_event=None):
+                return True
+        
+        class FakeChatManager:
+            def __init__(self):
+                self.clicks = []
+            
+            def create_new_chat_only(self):
+                return True
+            
+            def rename_current_chat(self, chat_name):
+                return True
+            
+            def click_coordinate(self, coord_name, description=""):
+                self.clicks.append(coord_name)
+                return True
+        
+        class FakeClipboard:
+            def safe_paste_text(self, text, select_all=False):
+                return True
+        
+        # Формат сохраняется в новом чате: при задачах, сгруппированных по формату, список открывается 2 раза из 4
+        input_driver = RecordingInputDriver()
+        set_input_driver(input_driver)
+        settings_manager = SettingsManager()
+        settings_manager.settings.update({'FORMAT_KEPT_IN_NEW_CHAT': True, 'COMPLETION_DETECTION': False,
+                                          'GENERATION_MODE': 'multi_format'})
+        generator = MultiFormatGenerator(settings_manager)
+        generator.ui_waiter = FakeUIWaiter()
+        generator.chat_manager = FakeChatManager()
+        generator.clipboard = FakeClipboard()
+        
+        stop_event = threading.Event()
+        for card_number, side, format_ratio in [(1, 'лицо', '4:3'), (2, 'лицо', '4:3'),
+                                                (1, 'оборот', '3:2'), (2, 'оборот', '3:2')]:
+            generator.submit_side(card_number, "Тест", 1, side, "промпт", format_ratio, stop_event)
+            generator.ui_state.focus_lost()  # Сохранение результата
+        
+        format_clicks = generator.chat_manager.clicks.count('FORMAT_SELECTOR')
+        print(f"   📊 Открытий списка форматов: {format_clicks}, пропущено: {generator.skipped_ui_actions}")
+        if format_clicks != 2 or generator.skipped_ui_actions.get('выбор формата') != 2:
+            print("   ❌ Формат выбирается повторно!")
+            return False
+        print("   ✅ Выбор формата пропускается, когда формат уже выбран")
+        
+        print("\n🎉 ТЕСТ СОСТОЯНИЯ ИНТЕРФЕЙСА ЗАВЕРШЕН!")
+        return True
+        
+    except Exception as e:
+        print(f"❌ ОШИБКА В ТЕСТЕ СОСТОЯНИЯ ИНТЕРФЕЙСА: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        from utils.input_driver import set_input_driver
+        set_input_driver(None)
+
+
+def test_job_order():
+    """Тест порядка задач по форматам: меньше переключений формата, имена файлов прежние"""
+    print("\n🧪 ТЕСТ ПОРЯДКА ЗАДАЧ ПО ФОРМАТАМ")
+    print("=" * 50)
+    
+    try:
+        from core.pipeline import JOB_ORDER_FORMAT, JOB_ORDER_PAIRS, build_side_jobs, order_side_jobs
+        
+        pair = {'лицо': "п", 'оборот': "о"}
+        cards = [(1, "Первая", [pair]), (2, "Вторая", [pair, pair]), (3, "Третья", [pair])]
+        side_jobs = build_side_jobs(cards)
+        
+        def count_format_switches(jobs):
+            return sum(1 for previous, job in zip(jobs, jobs[1:]) if previous['format_ratio'] != job['format_ratio'])
+        
+        pairs_order = order_side_jobs(side_jobs, JOB_ORDER_PAIRS)
+        format_order = order_side_jobs(side_jobs, JOB_ORDER_FORMAT, batch_cards=2)
+        sequence = [(job['card_number'], job['pair_number'], job['format_ratio']) for job in format_order]
+        print(f"   📊 Порядок по форматам: {sequence}")
+        print(f"   📊 Переключений формата: по парам {count_format_switches(pairs_order)}, "
+              f"по форматам {count_format_switches(format_order)}")
+        
+        expected = [(1, 1, '4:3'), (2, 1, '4:3'), (2, 2, '4:3'), (1, 1, '3:2'), (2, 1, '3:2'), (2, 2, '3:2'),
+                    (3, 1, '4:3'), (3, 1, '3:2')]
+        if sequence != expected:
+            print("   ❌ Неверный порядок задач!")
+            return False
+        if pairs_order != side_jobs or count_format_switches(format_order) != 3:
+            print("   ❌ Неверное число переключений формата!")
+            return False
+        if sorted(job['filename'] for job in format_order) != sorted(job['filename'] for job in side_jobs):
+            print("   ❌ Изменились имена файлов!")
+            return False
+        print("   ✅ Формат меняется один раз на пачку, набор файлов тот же")
+        
+        print("\n🎉 ТЕСТ ПОРЯДКА ЗАДАЧ ПО ФОРМАТАМ ЗАВЕРШЕН!")
+        return True
+        
+    except Exception as e:
+        print(f"❌ ОШИБКА В ТЕСТЕ ПОРЯДКА ЗАДАЧ ПО ФОРМАТАМ: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+def test_image_clipboard():
+    """Тест копирования референсов: постоянный помощник запускается один раз на весь запуск"""
+    print("\n🧪 ТЕСТ КОПИРОВАНИЯ РЕФЕРЕНСОВ В БУФЕР")
+    print("=" * 50)
+    
+    import shutil
+    import sys
+    import tempfile
+    import time
+    temp_folder = tempfile.mkdtemp()
+    
+    try:
+        from PIL import Image
+        from utils.clipboard import ClipboardManager
+        from utils.image_clipboard import FakeClipboardBackend, create_image_clipboard_backend, read_png_bytes
+        from utils.input_driver import RecordingInputDriver
+        
+        image_paths = []
+        for index, extension in enumerate(['png', 'jpg', 'png']):
+            image_path = os.path.join(temp_folder, f"лицо_{index}_тест.{extension}")
+            Image.new('RGB', (16, 16), (index * 80, 0, 0)).save(image_path)
+            image_paths.append(image_path)
+        
+        if not read_png_bytes(image_paths[1]).startswith(b'\x89PNG'):
+            print("   ❌ JPEG не сконвертирован в PNG!")
+            return False
+        print("   ✅ Референс любого формата передаётся как PNG")
+        
+        clipboard = ClipboardManager(RecordingInputDriver())
+        clipboard.image_backend = FakeClipboardBackend(start_delay=0.05)
+        results = [clipboard.copy_image_to_clipboard(image_path) for image_path in image_paths]
+        missing = clipboard.copy_image_to_clipboard(os.path.join(temp_folder, "нет_файла.png"))
+        
+        print(f"   📊 {clipboard.format_image_metrics()}")
+        if not all(results) or missing or clipboard.image_backend.copied_paths != image_paths:
+            print("   ❌ Неверный результат копирования!")
+            return False
+        if clipboard.image_backend.start_count != 1:
+            print(f"   ❌ Помощник запускался {clipboard.image_backend.start_count} раз!")
+            return False
+        print("   ✅ Помощник запущен один раз на все изображения")
+        
+        if sys.platform != 'win32':
+            # Как xclip/wl-copy: читает stdin, оставляет в фоне потомка-владельца буфера с тем же stderr
+            from utils.image_clipboard import CommandBackend
+            forking_command = [sys.executable, '-c',
+                               "import os, sys, time\n"
+                               "sys.stdin.buffer.read()\n"
+                               "if os.fork() == 0:\n"
+                               "    time.sleep(5)\n"
+                               "    os._exit(0)\n"]
+            start_time = time.time()
+            success, error = CommandBackend('fork-copy', forking_command).copy_image(image_paths[0])
+            elapsed = time.time() - start_time
+            print(f"   📊 Копирование через утилиту с фоновым потомком: {elapsed:.2f} сек")
+            if not success or elapsed > 3:
+                print(f"   ❌ Копирование ждёт фоновый процесс утилиты: {error}")
+                return False
+            failing_command = [sys.executable, '-c', "import sys; sys.stdin.buffer.read(); "
+                                                     "sys.stderr.write('нет дисплея'); sys.exit(1)"]
+            success, error = CommandBackend('fail-copy', failing_command).copy_image(image_paths[0])
+            if success or 'нет дисплея' not in error:
+                print(f"   ❌ Ошибка утилиты не передана: {success}, {error}")
+                return False
+            print("   ✅ Утилита с фоновым потомком не задерживает копирование, ошибка утилиты передаётся")
+        
+        try:
+            create_image_clipboard_backend('clipboard.exe')
+            print("   ❌ Неизвестный бэкенд принят!")
+            return False
+        except ValueError:
+            print("   ✅ Неизвестный бэкенд отклоняется")
+        
+        print("\n🎉 ТЕСТ КОПИРОВАНИЯ РЕФЕРЕНСОВ В БУФЕР ЗАВЕРШЕН!")
+        return True
+        
+    except Exception as e:
+        print(f"❌ ОШИБКА В ТЕСТЕ КОПИРОВАНИЯ РЕФЕРЕНСОВ В БУФЕР: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        shutil.rmtree(temp_folder, ignore_errors=True)
+
+
+def test_reference_cache():
+    """Тест кэша референсов: LRU по размеру, перекодирование изменённого файла, фоновая подготовка"""
+    print("\n🧪 ТЕСТ КЭША РЕФЕРЕНСОВ")
+    print("=" * 50)
+    
+    import shutil
+    import tempfile
+    temp_folder = tempfile.mkdtemp()
+    
+    try:
+        from PIL import Image
+        from core.reference_cache import ReferenceCache, ReferencePrefetcher
+        from utils.clipboard import ClipboardManager
+        from utils.image_clipboard import FakeClipboardBackend, read_png_bytes
+        from utils.input_driver import RecordingInputDriver
+        
+        image_paths = []
+        for index in range(3):
+            image_path = os.path.join(temp_folder, f"лицо_{index}_тест.jpg")
+            Image.new('RGB', (32, 32), (index * 80, 0, 0)).save(image_path)
+            image_paths.append(image_path)
+        entry_size = len(read_png_bytes(image_paths[0]))
+        
+        # Помещаются две записи: третья вытесняет дольше всех не использованную
+        cache = ReferenceCache(entry_size * 2 + entry_size // 2)
+        cache.get(image_paths[0])
+        cache.get(image_paths[1])
+        cache.get(image_paths[0])
+        cache.get(image_paths[2])
+        print(f"   📊 {cache.format_metrics()}")
+        if cache.contains(image_paths[1]) or not cache.contains(image_paths[0]) or cache.hits != 1:
+            print("   ❌ Вытеснена не та запись!")
+            return False
+        print("   ✅ Вытесняется дольше всех не использованная запись")
+        
+        stat = os.stat(image_paths[0])
+        Image.new('RGB', (32, 32), (0, 0, 255)).save(image_paths[0])
+        os.utime(image_paths[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        if cache.contains(image_paths[0]) or cache.get(image_paths[0]) != read_png_bytes(image_paths[0]):
+            print("   ❌ Изменённый файл взят из кэша!")
+            return False
+        print("   ✅ Изменённый файл кодируется заново")
+        
+        card_paths = {1: image_paths[0], 2: image_paths[1], 3: image_paths[2]}
+        cache = ReferenceCache()
+        prefetcher = ReferencePrefetcher(cache, [(1, 'а'), (2, 'б'), (3, 'в')],
+                                         lambda card_number, card_name, side: card_paths[card_number] if side == 'лицо' else None)
+        prefetcher.prefetch_after(1)
+        prefetcher.prefetch_after(1)
+        prefetcher.prefetch_after(3)
+        prefetcher.wait()
+        prefetcher.close()
+        if not cache.contains(image_paths[1]) or len(cache) != 1 or prefetcher.prefetched_count != 1:
+            print("   ❌ Следующая карточка не подготовлена (или подготовлена повторно)!")
+            return False
+        print("   ✅ Референсы следующей карточки подготовлены в фоне один раз")
+        
+        clipboard = ClipboardManager(RecordingInputDriver())
+        clipboard.image_backend = FakeClipboardBackend()
+        clipboard.image_cache = cache
+        if not clipboard.copy_image_to_clipboard(image_paths[1]) or clipboard.image_backend.copied_from_memory != 1 or cache.hits != 1:
+            print("   ❌ Подготовленный референс не взят из кэша!")
+            return False
+        print("   ✅ Подготовленный референс копируется из памяти")
+        
+        # В кэше - готовый запрос бэкенда: для помощника PowerShell строка base64 не кодируется заново
+        from utils.image_clipboard import PowerShellHelperBackend
+        helper_cache = ReferenceCache(encode=PowerShellHelperBackend().encode_payload)
+        clipboard.image_cache = helper_cache
+        payload = helper_cache.get(image_paths[2])
+        if not payload.startswith('base64:') or not clipboard.copy_image_to_clipboard(image_paths[2]):
+            print("   ❌ Запрос помощника не закэширован!")
+            return False
+        if clipboard.image_backend.last_payload is not payload or helper_cache.hits != 1:
+            print("   ❌ Из кэша отправлены не те данные!")
+            return False
+        print("   ✅ В кэше - данные в том виде, в каком они отправляются")
+        
+        print("\n🎉 ТЕСТ КЭША РЕФЕРЕНСОВ ЗАВЕРШЕН!")
+        return True
+        
+    except Exception as e:
+        print(f"❌ ОШИБКА В ТЕСТЕ КЭША РЕФЕРЕНСОВ: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        shutil.rmtree(temp_folder, ignore_errors=True)
+
+
+def test_reference_index():
+    """Тест индекса референсов: точное имя, нормализованное название, похожие файлы для отчёта"""
+    print("\n🧪 ТЕСТ ИНДЕКСА РЕФЕРЕНСОВ")
+    print("=" * 50)
+    
+    import shutil
+    import tempfile
+    temp_folder = tempfile.mkdtemp()
+    
+    try:
+        from core.reference_index import ReferenceIndex, normalize_name
+        
+        os.makedirs(os.path.join(temp_folder, 'лицо'))
+        os.makedirs(os.path.join(temp_folder, 'оборот'))
+        for side, filename in [('лицо', 'лицо_1_балтийское_море.jpg'), ('лицо', 'лицо_1_балтийское_море.png'),
+                               ('лицо', 'лицо_2_Ёлки  Зелёные.JPEG'), ('лицо', 'лицо_3_северное_морe.png'),
+                               ('оборот', 'оборот_4_горы.png'), ('оборот', 'заметки.txt')]:
+            with open(os.path.join(temp_folder, side, filename), 'wb') as file:
+                file.write(b'ref')
+        
+        index = ReferenceIndex(temp_folder).build()
+        print(f"   📊 Файлов в индексе: {len(index)}")
+        if len(index) != 5 or index.missing_dirs:
+            print("   ❌ Неверное число файлов в индексе!")
+            return False
+        
+        if os.path.basename(index.find(1, 'балтийское море', 'лицо')) != 'лицо_1_балтийское_море.png':
+            print("   ❌ При точном совпадении .png должен быть в приоритете!")
+            return False
+        print("   ✅ Точное имя: .png в приоритете перед .jpg")
+        
+        if normalize_name('Ёлки  Зелёные') != 'елки_зеленые':
+            print("   ❌ Неверная нормализация названия!")
+            return False
+        if os.path.basename(index.find(2, 'елки зеленые', 'лицо') or '') != 'лицо_2_Ёлки  Зелёные.JPEG':
+            print("   ❌ Файл не найден по нормализованному названию!")
+            return False
+        print("   ✅ Регистр, ё/е, пробелы и расширение не мешают поиску")
+        
+        # В названии файла латинская «e» - не совпадает, но попадает в похожие
+        if index.find(3, 'северное море', 'лицо') is not None:
+            print("   ❌ Найден файл с другим названием!")
+            return False
+        near_misses = index.find_near_misses(3, 'северное море', 'лицо')
+        wrong_number = index.find_near_misses(5, 'горы', 'оборот')
+        print(f"   📊 Похожие: {near_misses}, {wrong_number}")
+        if near_misses != ['лицо_3_северное_морe.png'] or wrong_number != ['оборот_4_горы.png']:
+            print("   ❌ Неверный список похожих файлов!")
+            return False
+        print("   ✅ Для ненайденных референсов предлагаются похожие файлы")
+        
+        if ReferenceIndex(os.path.join(temp_folder, 'нет')).build().missing_dirs == []:
+            print("   ❌ Отсутствующая папка не отмечена!")
+            return False
+        
+        print("\n🎉 ТЕСТ ИНДЕКСА РЕФЕРЕНСОВ ЗАВЕРШЕН!")
+        return True
+        
+    except Exception as e:
+        print(f"❌ ОШИБКА В ТЕСТЕ ИНДЕКСА РЕФЕРЕНСОВ: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        shutil.rmtree(temp_folder, ignore_errors=True)
+
+
+def test_reference_preflight():
+    """Тест проверки референсов перед запуском: битый файл, пропорции, размер файла"""
+    print("\n🧪 ТЕСТ ПРОВЕРКИ РЕФЕРЕНСОВ")
+    print("=" * 50)
+    
+    import shutil
+    import tempfile
+    temp_folder = tempfile.mkdtemp()
+    
+    try:
+        import numpy as np
+        from PIL import Image
+        from core.reference_preflight import run_reference_preflight, validate_reference
+        
+        good_face = os.path.join(temp_folder, 'лицо_1_а.png')
+        good_back = os.path.join(temp_folder, 'оборот_1_а.jpg')
+        wrong_ratio = os.path.join(temp_folder, 'оборот_2_б.png')
+        truncated = os.path.join(temp_folder, 'лицо_2_б.png')
+        Image.new('RGB', (400, 300)).save(good_face)
+        Image.new('RGB', (300, 200)).save(good_back)
+        Image.new('RGB', (300, 300)).save(wrong_ratio)
+        Image.fromarray(np.random.default_rng(0).integers(0, 256, (300, 400, 3), dtype=np.uint8)).save(truncated)
+        with open(truncated, 'rb') as file:
+            data = file.read()
+        with open(truncated, 'wb') as file:
+            file.write(data[:len(data) // 2])
+        
+        results = run_reference_preflight([
+            (1, 'а', 'лицо', '4:3', good_face),
+            (1, 'а', 'оборот', '3:2', good_back),
+            (2, 'б', 'лицо', '4:3', truncated),
+            (2, 'б', 'оборот', '3:2', wrong_ratio),
+        ], max_workers=4)
+        for result in results:
+            print(f"   📊 #{result['card_number']} {result['side']}: {result['problems'] or 'ок'}")
+        
+        if [result['card_number'] for result in results] != [1, 1, 2, 2]:
+            print("   ❌ Порядок результатов не совпадает с порядком референсов!")
+            return False
+        if results[0]['problems'] or results[1]['problems']:
+            print("   ❌ Замечания к правильным референсам!")
+            return False
+        if not results[2]['corrupt'] or results[3]['corrupt'] or len(results[3]['problems']) != 1:
+            print("   ❌ Битый файл или неверные пропорции не найдены!")
+            return False
+        print("   ✅ Битый файл и неверные пропорции найдены")
+        
+        oversized = validate_reference(good_face, '4:3', max_file_bytes=100)
+        if len(oversized['problems']) != 1 or (oversized['width'], oversized['height']) != (400, 300):
+            print("   ❌ Большой файл не отмечен!")
+            return False
+        print("   ✅ Слишком большой файл отмечен")
+        
+        print("\n🎉 ТЕСТ ПРОВЕРКИ РЕФЕРЕНСОВ ЗАВЕРШЕН!")
+        return True
+        
+    except Exception as e:
+        print(f"❌ ОШИБКА В ТЕСТЕ ПРОВЕРКИ РЕФЕРЕНСОВ: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        shutil.rmtree(temp_folder, ignore_errors=True)
+
+
+def test_reference_normalizer():
+    """Тест уменьшения референсов: кэш по хешу содержимого переживает перезапуск и переименование"""
+    print("\n🧪 ТЕСТ УМЕНЬШЕНИЯ РЕФЕРЕНСОВ")
+    print("=" * 50)
+    
+    import shutil
+    import tempfile
+    temp_folder = tempfile.mkdtemp()
+    
+    try:
+        import numpy as np
+        from PIL import Image
+        from core.reference_normalizer import ReferenceNormalizer
+        
+        cache_dir = os.path.join(temp_folder, 'ref_cache')
+        large_path = os.path.join(temp_folder, 'лицо_1_а.png')
+        small_path = os.path.join(temp_folder, 'лицо_2_б.png')
+        Image.fromarray(np.random.default_rng(0).integers(0, 256, (600, 800, 3), dtype=np.uint8)).save(large_path)
+        Image.new('RGB', (200, 150)).save(small_path)
+        
+        normalizer = ReferenceNormalizer(cache_dir, max_side=400)
+        normalized_path = normalizer.normalize(large_path)
+        with Image.open(normalized_path) as image:
+            normalized_size = image.size
+        print(f"   📊 {normalizer.format_metrics()}, размер {normalized_size}")
+        if normalized_size != (400, 300) or os.path.dirname(normalized_path) != cache_dir:
+            print("   ❌ Референс не уменьшен с сохранением пропорций!")
+            return False
+        if normalizer.normalize(small_path) != small_path or normalizer.normalize(large_path) != normalized_path:
+            print("   ❌ Маленький референс изменён или большой обработан повторно!")
+            return False
+        if normalizer.normalized_count != 1 or normalizer.unchanged_count != 1 or normalizer.original_bytes <= normalizer.normalized_bytes:
+            print("   ❌ Неверная статистика!")
+            return False
+        print("   ✅ Большой референс уменьшен, маленький вставляется как есть")
+        
+        # Новый запуск и переименованная копия того же файла - берётся готовый результат
+        renamed_path = os.path.join(temp_folder, 'лицо_1_а_копия.png')
+        shutil.copy(large_path, renamed_path)
+        next_run = ReferenceNormalizer(cache_dir, max_side=400)
+        if next_run.normalize(renamed_path) != normalized_path or next_run.reused_count != 1 or next_run.normalized_count:
+            print("   ❌ Результат прошлого запуска не использован!")
+            return False
+        print("   ✅ Кэш на диске переживает перезапуск и переименование")
+        
+        # JPEG остаётся JPEG: пересохранение фото в PNG увеличивало файл
+        photo = np.linspace(0, 255, 800, dtype=np.uint8)[None, :, None].repeat(600, axis=0).repeat(3, axis=2)
+        jpeg_path = os.path.join(temp_folder, 'оборот_1_а.jpg')
+        Image.fromarray(photo).save(jpeg_path, quality=95)
+        small_jpeg_path = os.path.join(temp_folder, 'оборот_2_б.jpg')
+        Image.fromarray(photo[:150, :200]).save(small_jpeg_path)
+        normalized_jpeg_path = next_run.normalize(jpeg_path)
+        with Image.open(normalized_jpeg_path) as image:
+            jpeg_format, jpeg_size = image.format, image.size
+        print(f"   📊 JPEG: {os.path.getsize(jpeg_path) // 1024} -> {os.path.getsize(normalized_jpeg_path) // 1024} КБ")
+        if jpeg_format != 'JPEG' or jpeg_size != (400, 300) or os.path.getsize(normalized_jpeg_path) >= os.path.getsize(jpeg_path):
+            print(f"   ❌ JPEG пересохранён как {jpeg_format} {jpeg_size}!")
+            return False
+        # Маленький референс не хешируется: достаточно заголовка
+        import core.reference_normalizer as normalizer_module
+        hashed_paths = []
+        original_hash_file = normalizer_module.hash_file
+        normalizer_module.hash_file = lambda path: hashed_paths.append(path) or original_hash_file(path)
+        try:
+            small_result = next_run.normalize(small_jpeg_path)
+        finally:
+            normalizer_module.hash_file = original_hash_file
+        if small_result != small_jpeg_path or hashed_paths:
+            print(f"   ❌ Маленький JPEG перекодирован или прочитан целиком: {hashed_paths}")
+            return False
+        print("   ✅ JPEG уменьшается в JPEG, маленький JPEG вставляется как есть без чтения и хеша")
+        
+        with open(os.path.join(temp_folder, 'битый.png'), 'wb') as file:
+            file.write(b'not an image')
+        broken_path = os.path.join(temp_folder, 'битый.png')
+        if next_run.normalize(broken_path) != broken_path:
+            print("   ❌ При ошибке должен возвращаться исходный файл!")
+            return False
+        print("   ✅ При ошибке вставляется исходный файл")
+        
+        print("\n🎉 ТЕСТ УМЕНЬШЕНИЯ РЕФЕРЕНСОВ ЗАВЕРШЕН!")
+        return True
+        
+    except Exception as e:
+        print(f"❌ ОШИБКА В ТЕСТЕ УМЕНЬШЕНИЯ РЕФЕРЕНСОВ: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        shutil.rmtree(temp_folder, ignore_errors=True)
+
+
+def test_prompt_parser():
+    """Тест потокового парсера промптов: кодировка по началу файла, замечания в отчёте, а не в консоли"""
+    print("\n🧪 ТЕСТ ПОТОКОВОГО ПАРСЕРА ПРОМПТОВ")
+    print("=" * 50)
+    
+    import contextlib
+    import io
+    import shutil
+    import tempfile
+    temp_folder = tempfile.mkdtemp()
+    
+    try:
+        from core.prompt_parser import detect_encoding, iter_prompt_records, parse_prompts_file
+        
+        utf8_bytes = "Карточка".encode('utf-8')
+        checks = [
+            (b'\xef\xbb\xbf' + utf8_bytes, 'utf-8-sig'),
+            (utf8_bytes, 'utf-8'),
+            (utf8_bytes[:-1], 'utf-8'),  # Символ обрезан концом выборки
+            ("Карточка".encode('cp1251'), 'cp1251'),
+        ]
+        for sample, expected in checks:
+            if detect_encoding(sample) != expected:
+                print(f"   ❌ Кодировка {detect_encoding(sample)} вместо {expected}!")
+                return False
+        print("   ✅ Кодировка определяется по началу файла")
+        
+        prompts_path = os.path.join(temp_folder, 'prompts.txt')
+        content = ("Карточка 1 лицо Море - Промпт 1: front 1\n"
+                   "Карточка 1 оборот Море - Промпт 1: back 1\n"
+                   "Карточка 1 лицо Моря - Промпт 2: front 2\n"
+                   "# Карточка 1 оборот - Промпт 2 ОТСУТСТВУЕТ!\n"
+                   "\n"
+                   "1) Карточка 2 лицо Лес - Промпт 1: front 3\n"
+                   "Карточка 2 оборот Лес - Промпт 1: back 3  \n")
+        with open(prompts_path, 'w', encoding='cp1251') as file:
+            file.write(content)
+        
+        records = iter_prompt_records(prompts_path)
+        first_record = next(records)
+        if (first_record.card_number, first_record.side, first_record.card_name, first_record.line_number) != (1, 'лицо', 'Море', 1):
+            print(f"   ❌ Неверная первая запись: {first_record}")
+            return False
+        print("   ✅ Записи отдаются по одной")
+        
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            prompts_data, report = parse_prompts_file(prompts_path)
+        print(f"   📊 Карточек: {len(prompts_data)}, строк: {report.line_count}, записей: {report.record_count}")
+        for report_line in report.format_lines():
+            print(f"      {report_line}")
+        
+        if output.getvalue():
+            print("   ❌ Парсер пишет в консоль!")
+            return False
+        if report.encoding != 'cp1251' or report.record_count != 5 or report.mismatched_count != 1:
+            print("   ❌ Неверный отчёт о разборе!")
+            return False
+        if len(report.name_conflicts) != 1 or report.incomplete_pairs != [(1, 'Море', 2, 'оборот')]:
+            print("   ❌ Разные названия или неполная пара не попали в отчёт!")
+            return False
+        if len(prompts_data[1][1]) != 1 or prompts_data[2] != ('Лес', [{'лицо': 'front 3', 'оборот': 'back 3'}]):
+            print("   ❌ Неверная структура карточек!")
+            return False
+        print("   ✅ Замечания собраны в отчёт, структура карточек прежняя")
+        
+        # Байт cp1251 после первых 64 КБ файла в utf-8: разбор заново в cp1251, без символов замены
+        from core.prompt_parser import ENCODING_SAMPLE_SIZE
+        with open(prompts_path, 'wb') as file:
+            file.write(b"# comment\n" * (ENCODING_SAMPLE_SIZE // len(b"# comment\n") + 1))
+            file.write(("Карточка 1 лицо Море - Промпт 1: front\n"
+                        "Карточка 1 оборот Море - Промпт 1: back №1\n").encode('cp1251'))
+        prompts_data, report = parse_prompts_file(prompts_path)
+        back_text = prompts_data[1][1][0]['оборот'] if prompts_data else ''
+        print(f"   📊 Кодировка {report.encoding}, отброшены: {report.rejected_encodings}")
+        if report.encoding != 'cp1251' or [encoding for encoding, _ in report.rejected_encodings] != ['utf-8']:
+            print("   ❌ Разбор не начат заново в следующей кодировке!")
+            return False
+        if '\ufffd' in back_text or back_text != "back №1" or not report.has_problems():
+            print(f"   ❌ Текст прочитан с заменой символов: {back_text!r}")
+            return False
+        print("   ✅ Нечитаемый байт после выборки - разбор заново в cp1251")
+        
+        print("\n🎉 ТЕСТ ПОТОКОВОГО ПАРСЕРА ПРОМПТОВ ЗАВЕРШЕН!")
+        return True
+        
+    except Exception as e:
+        print(f"❌ ОШИБКА В ТЕСТЕ ПОТОКОВОГО ПАРСЕРА ПРОМПТОВ: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        shutil.rmtree(temp_folder, ignore_errors=True)
+
+
+def test_prompt_cache():
+    """Тест кэша разбора промптов: повторная загрузка без разбора, сброс при изменении файла"""
+    print("\n🧪 ТЕСТ КЭША РАЗБОРА ПРОМПТОВ")
+    print("=" * 50)
+    
+    import shutil
+    import tempfile
+    temp_folder = tempfile.mkdtemp()
+    
+    try:
+        from core.prompt_cache import PromptCache, hash_file
+        from core.prompt_parser import parse_prompts_file
+        
+        prompts_path = os.path.join(temp_folder, 'prompts.txt')
+        with open(prompts_path, 'w', encoding='utf-8') as file:
+            file.write("Карточка 1 лицо Море - Промпт 1: front 1\n"
+                       "Карточка 1 оборот Море - Промпт 1: back 1\n"
+                       "Карточка 2 лицо Лес - Промпт 1: front 2\n")
+        
+        cache = PromptCache(os.path.join(temp_folder, 'prompts_cache.sqlite'))
+        first_prompts, encoding, report_lines, from_cache = cache.load_or_parse(prompts_path)
+        # Второй экземпляр - как рабочий процесс, открывающий тот же файл кэша
+        second_prompts, _, cached_report_lines, second_from_cache = PromptCache(cache.db_path).load_or_parse(prompts_path)
+        print(f"   📊 Первая загрузка из кэша: {from_cache}, вторая: {second_from_cache}")
+        if from_cache or not second_from_cache or first_prompts != second_prompts or cached_report_lines != report_lines:
+            print("   ❌ Повторная загрузка не взята из кэша или отличается!")
+            return False
+        if first_prompts != parse_prompts_file(prompts_path)[0] or encoding != 'utf-8':
+            print("   ❌ Кэш отличается от разбора файла!")
+            return False
+        print("   ✅ Повторная загрузка - из кэша, результат тот же")
+        
+        # Два процесса разобрали один файл одновременно: второй не переписывает уже актуальную запись
+        stat, content_hash = os.stat(prompts_path), hash_file(prompts_path)
+        parsed_prompts, parsed_report = parse_prompts_file(prompts_path)
+        parsed_at = cache.get_file_row(prompts_path)['parsed_at']
+        if cache.store(prompts_path, stat, content_hash, parsed_prompts, parsed_report) or cache.get_file_row(prompts_path)['parsed_at'] != parsed_at:
+            print("   ❌ Актуальная запись кэша переписана вторым разбором!")
+            return False
+        print("   ✅ Актуальная запись другого процесса не переписывается")
+        
+        # Файл пересохранён без изменений - новый mtime, тот же хеш
+        stat = os.stat(prompts_path)
+        os.utime(prompts_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        if not cache.load_or_parse(prompts_path)[3]:
+            print("   ❌ Пересохранённый без изменений файл разобран заново!")
+            return False
+        print("   ✅ Изменение только mtime не сбрасывает кэш")
+        
+        with open(prompts_path, 'a', encoding='utf-8') as file:
+            file.write("Карточка 2 оборот Лес - Промпт 1: back 2\n")
+        changed_prompts, _, _, changed_from_cache = cache.load_or_parse(prompts_path)
+        if changed_from_cache or 2 not in changed_prompts:
+            print("   ❌ Изменённый файл взят из кэша!")
+            return False
+        print("   ✅ Изменённый файл разбирается заново")
+        
+        print("\n🎉 ТЕСТ КЭША РАЗБОРА ПРОМПТОВ ЗАВЕРШЕН!")
+        return True
+        
+    except Exception as e:
+        print(f"❌ ОШИБКА В ТЕСТЕ КЭША РАЗБОРА ПРОМПТОВ: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        shutil.rmtree(temp_folder, ignore_errors=True)
+
+
+def test_prompt_store():
+    """Тест выбора карточек из кэша разбора: диапазон и выражения читают только нужные строки"""
+    print("\n🧪 ТЕСТ ВЫБОРА КАРТОЧЕК ИЗ КЭША ПРОМПТОВ")
+    print("=" * 50)
+    
+    import shutil
+    import sqlite3
+    import tempfile
+    temp_folder = tempfile.mkdtemp()
+    
+    try:
+        from core.prompt_cache import PromptCache, parse_card_selection, select_cards
+        from core.prompt_parser import parse_prompts_file
+        
+        prompts_path = os.path.join(temp_folder, 'prompts.txt')
+        with open(prompts_path, 'w', encoding='utf-8') as file:
+            for card_number in range(1, 61):
+                if card_number % 7 == 0:
+                    continue  # Пропуски в нумерации
+                for pair_number in (1, 2):
+                    for side in ('лицо', 'оборот'):
+                        file.write(f"Карточка {card_number} {side} Карта {card_number} - Промпт {pair_number}: {side} {pair_number}\n")
+        
+        all_prompts = parse_prompts_file(prompts_path)[0]
+        cache = PromptCache(os.path.join(temp_folder, 'prompts_cache.sqlite'))
+        cache.refresh(prompts_path)
+        
+        if cache.load_range(prompts_path, 10, 5) != select_cards(all_prompts, None, 10, 5):
+            print("   ❌ Диапазон из кэша не совпадает с фильтром загруженных промптов!")
+            return False
+        print(f"   📊 START_FROM_CARD=10, CARDS_TO_PROCESS=5: {sorted(cache.load_range(prompts_path, 10, 5))}")
+        
+        ranges = parse_card_selection('3-5, 20; 55-')
+        selected = cache.load_selection(prompts_path, ranges)
+        print(f"   📊 '3-5, 20; 55-': {sorted(selected)}")
+        if ranges != [(3, 5), (20, 20), (55, None)] or selected != select_cards(all_prompts, ranges):
+            print("   ❌ Неверный выбор по выражению!")
+            return False
+        print("   ✅ Диапазон и выражения совпадают с фильтром загруженных промптов")
+        
+        for bad_selection in ['', '10-5', 'a-b']:
+            try:
+                parse_card_selection(bad_selection)
+                print(f"   ❌ Принято неверное выражение '{bad_selection}'!")
+                return False
+            except ValueError:
+                pass
+        print("   ✅ Неверные выражения отклоняются")
+        
+        if cache.count_prompts(prompts_path) != (len(all_prompts), len(all_prompts) * 2):
+            print("   ❌ Неверный счёт карточек и пар!")
+            return False
+        
+        # Выбор диапазона идёт по индексу, а не перебором таблицы
+        connection = sqlite3.connect(cache.db_path)
+        plan = connection.execute(
+            "EXPLAIN QUERY PLAN SELECT card_number FROM prompt_pairs WHERE path = ? AND card_number BETWEEN ? AND ?",
+            (os.path.abspath(prompts_path), 3, 5)
+        ).fetchall()
+        connection.close()
+        if not any('SEARCH' in str(row[-1]) for row in plan):
+            print(f"   ❌ Запрос не использует индекс: {plan}")
+            return False
+        print("   ✅ Счёт и выбор карточек идут по индексу")
+        
+        print("\n🎉 ТЕСТ ВЫБОРА КАРТОЧЕК ИЗ КЭША ПРОМПТОВ ЗАВЕРШЕН!")
+        return True
+        
+    except Exception as e:
+        print(f"❌ ОШИБКА В ТЕСТЕ ВЫБОРА КАРТОЧЕК ИЗ КЭША ПРОМПТОВ: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        shutil.rmtree(temp_folder, ignore_errors=True)
+
+
+def test_card_source():
+    """Тест ленивого источника карточек: пачки из кэша, повторные проходы, те же задачи, что из списка"""
+    print("\n🧪 ТЕСТ ЛЕНИВОГО ИСТОЧНИКА КАРТОЧЕК")
+    print("=" * 50)
+
+    import shutil
+    import tempfile
+    temp_folder = tempfile.mkdtemp()
+
+    try:
+        from config.settings import SettingsManager
+        from core.card_source import CardSource, count_cards
+        from core.file_handler import FileHandler
+        from core.pipeline import JOB_ORDER_FORMAT, JOB_ORDER_PAIRS, build_side_jobs, iter_side_jobs, order_side_jobs
+
+        prompts_path = os.path.join(temp_folder, 'prompts.txt')
+        with open(prompts_path, 'w', encoding='utf-8') as file:
+            for card_number in range(1, 41):
+                if card_number % 6 == 0:
+                    continue  # Пропуски в нумерации
+                for pair_number in range(1, card_number % 3 + 2):
+                    for side in ('лицо', 'оборот'):
+                        file.write(f"Карточка {card_number} {side} Карта {card_number} - Промпт {pair_number}: {side} {pair_number}\n")
+
+        settings_manager = SettingsManager()
+        settings_manager.settings.update({
+            'PROMPTS_FILE': prompts_path,
+            'PROMPT_CACHE_ENABLED': True,
+            'PROMPT_CACHE_FILE': os.path.join(temp_folder, 'prompts_cache.sqlite'),
+            'GENERATION_MODE': 'multi_format',
+            'CARD_SOURCE_BATCH_CARDS': 4,
+        })
+        file_handler = FileHandler(settings_manager)
+
+        for card_selection, start_card, cards_to_process in [('', 5, 13), ('', 1, 100), ('3-9, 8-15, 30-', 1, 10)]:
+            settings_manager.settings.update({'CARD_SELECTION': card_selection, 'START_FROM_CARD': start_card,
+                                              'CARDS_TO_PROCESS': cards_to_process})
+            expected = file_handler.get_cards_to_process()
+            card_source = file_handler.get_card_source()
+            if not isinstance(card_source, CardSource):
+                print("   ❌ С кэшем разбора должен возвращаться CardSource!")
+                return False
+
+            # Каждый запрос к кэшу - не больше одной пачки карточек
+            query_sizes = []
+            query_prompts = card_source.prompt_cache._query_prompts
+            def counting_query(where, parameters):
+                prompts = query_prompts(where, parameters)
+                query_sizes.append(len(prompts))
+                return prompts
+            card_source.prompt_cache._query_prompts = counting_query
+
+            if list(card_source) != expected or list(card_source) != expected:
+                print(f"   ❌ Карточки источника не совпадают со списком (выбор '{card_selection}', "
+                      f"старт {start_card}, лимит {cards_to_process})!")
+                return False
+            if max(query_sizes) > 4:
+                print(f"   ❌ Прочитано больше одной пачки за запрос: {max(query_sizes)}")
+                return False
+            if count_cards(card_source) != count_cards(expected):
+                print(f"   ❌ Неверный счёт: {count_cards(card_source)} вместо {count_cards(expected)}")
+                return False
+            print(f"   📊 '{card_selection or f'{start_card}+{cards_to_process}'}': {count_cards(card_source)}, "
+                  f"запросов: {len(query_sizes)}")
+        print("   ✅ Карточки, счёт и повторные проходы совпадают со списком get_cards_to_process")
+
+        cards = file_handler.get_cards_to_process()
+        for job_order, batch_cards in [(JOB_ORDER_PAIRS, 0), (JOB_ORDER_FORMAT, 0), (JOB_ORDER_FORMAT, 3), (JOB_ORDER_FORMAT, 5)]:
+            if list(iter_side_jobs(cards, job_order, batch_cards)) != order_side_jobs(build_side_jobs(cards), job_order, batch_cards):
+                print(f"   ❌ Порядок задач отличается ({job_order}, пачка {batch_cards})!")
+                return False
+        print("   ✅ Задачи по мере чтения карточек идут в том же порядке")
+
+        settings_manager.settings['PROMPT_CACHE_ENABLED'] = False
+        if file_handler.get_card_source() != cards:
+            print("   ❌ Без кэша должен возвращаться список карточек!")
+            return False
+        print("   ✅ Без кэша разбора - обычный список")
+
+        print("\n🎉 ТЕСТ ЛЕНИВОГО ИСТОЧНИКА КАРТОЧЕК ЗАВЕРШЕН!")
+        return True
+
+    except Exception as e:
+        print(f"❌ ОШИБКА В ТЕСТЕ ЛЕНИВОГО ИСТОЧНИКА КАРТОЧЕК: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        shutil.rmtree(temp_folder, ignore_errors=True)
+
+
+def test_prompt_records():
+    """Тест записей промптов и задач: доступ как у словарей, неизменяемость, общие тексты"""
+    print("\n🧪 ТЕСТ ЗАПИСЕЙ ПРОМПТОВ И ЗАДАЧ")
+    print("=" * 50)
+
+    import pickle
+    import shutil
+    import tempfile
+    temp_folder = tempfile.mkdtemp()
+
+    try:
+        from core.pipeline import build_side_jobs
+        from core.prompt_parser import parse_prompts_file
+        from core.records import SIDE_FACE, Card, CardPrompts, PromptPair, SideJob
+
+        pair = PromptPair("п1", "о1")
+        if pair != {'лицо': "п1", 'оборот': "о1"} or pair['оборот'] != "о1" or 'лицо' not in pair:
+            print("   ❌ Пара не работает как словарь {'лицо', 'оборот'}!")
+            return False
+        try:
+            pair.face = "другой"
+            print("   ❌ Пара изменилась!")
+            return False
+        except AttributeError:
+            pass
+        if hasattr(pair, '__dict__') or hasattr(build_side_jobs([(1, "Первая", [pair])])[0], '__dict__'):
+            print("   ❌ У записей есть __dict__ - __slots__ не работает!")
+            return False
+        print("   ✅ Пара - неизменяемая запись с доступом как у словаря")
+
+        job = build_side_jobs([Card(1, "Первая", [pair])])[1]
+        retry_job = dict(job, attempts=2)
+        if (not isinstance(job, SideJob) or job['side'] != 'оборот' or job['format_ratio'] != '3:2'
+                or 'id' in job or job.get('attempts') is not None or retry_job['prompt'] != "о1"):
+            print(f"   ❌ Задача не работает как словарь: {retry_job}")
+            return False
+        if pickle.loads(pickle.dumps(job)) != job:
+            print("   ❌ Задача не восстанавливается после pickle!")
+            return False
+        print("   ✅ Задача работает как прежний словарь и передаётся между процессами")
+
+        prompts = CardPrompts([pair, PromptPair("п2", "о2")])
+        if prompts != ["п1", "о1", "п2", "о2"] or prompts[-1] != "о2" or len(prompts) != 4:
+            print(f"   ❌ Промпты стандартного режима: {list(prompts)}")
+            return False
+        print("   ✅ Промпты стандартного режима - без копирования текстов")
+
+        prompts_path = os.path.join(temp_folder, 'prompts.txt')
+        with open(prompts_path, 'w', encoding='utf-8') as file:
+            for card_number in (1, 2):
+                file.write(f"Карточка {card_number} лицо Карта - Промпт 1: общий шаблон\n")
+                file.write(f"Карточка {card_number} оборот Карта - Промпт 1: оборот {card_number}\n")
+        valid_prompts = parse_prompts_file(prompts_path)[0]
+        first_pair, second_pair = valid_prompts[1][1][0], valid_prompts[2][1][0]
+        if first_pair.face is not second_pair.face:
+            print("   ❌ Одинаковые тексты промптов хранятся разными строками!")
+            return False
+        cards = pickle.loads(pickle.dumps([Card(number, name, pairs) for number, (name, pairs) in valid_prompts.items()]))
+        if cards[0].pairs[0].face is not cards[1].pairs[0].face or build_side_jobs(cards)[0]['side'] is not SIDE_FACE:
+            print("   ❌ Общие тексты и стороны не сохраняются!")
+            return False
+        print("   ✅ Одинаковые тексты и стороны - общие объекты, в том числе после pickle")
+
+        print("\n🎉 ТЕСТ ЗАПИСЕЙ ПРОМПТОВ И ЗАДАЧ ЗАВЕРШЕН!")
+        return True
+
+    except Exception as e:
+        print(f"❌ ОШИБКА В ТЕСТЕ ЗАПИСЕЙ ПРОМПТОВ И ЗАДАЧ: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+    finally:
+        shutil.rmtree(temp_folder, ignore_errors=True)
+
+
 def run_all_tests():
     """Запуск всех тестов"""
     print("🧪 ЗАПУСК ПОЛНОГО НАБОРА ТЕСТОВ")
@@ -835,7 +2948,32 @@ def run_all_tests():
         test_generation_flow,
         test_window_manager,
         test_integration,
-        test_final_system
+        test_final_system,
+        test_completion_detector,
+        test_image_presence_detector,
+        test_screen_capture,
+        test_latency_model,
+        test_ui_waiter,
+        test_delay_calibrator,
+        test_input_driver,
+        test_tab_pipeline,
+        test_parallel_lanes,
+        test_job_queue,
+        test_output_index,
+        test_retry_queue,
+        test_chat_reuse,
+        test_ui_state,
+        test_job_order,
+        test_image_clipboard,
+        test_reference_cache,
+        test_reference_index,
+        test_reference_preflight,
+        test_reference_normalizer,
+        test_prompt_parser,
+        test_prompt_cache,
+        test_prompt_store,
+        test_card_source,
+        test_prompt_records
     ]
     
     passed = 0
@@ -23,6 +23,7 @@ class ConsoleInterface:
         print("  Ctrl+6 - настроить КОНЕЧНУЮ КАРТОЧКУ (до какой)")
         print("  Ctrl+7 - ВЫБРАТЬ РЕЖИМ ГЕНЕРАЦИИ ⭐")
         print("  Ctrl+8 - НАСТРОИТЬ ВРЕМЯ ОЖИДАНИЯ ИЗОБРАЖЕНИЯ ⏰")
+        print("  Ctrl+9 - КАЛИБРОВКА ЗАДЕРЖЕК интерфейса 🎯")
         print("  Ctrl+Shift+V - НАСТРОИТЬ РАБОЧЕЕ ОКНО 🪟")
         print("  Ctrl+Shift+S - ЗАПУСТИТЬ автоматизацию")
         print("  Ctrl+Shift+Q - ОСТАНОВИТЬ автоматизацию")
@@ -112,7 +112,7 @@ class HotkeyManager:
         print("\n🛑 Получен сигнал выхода (Esc)")
         
         # Останавливаем автоматизацию если она запущена
-        if self.process_manager.automation_process and self.process_manager.automation_process.is_alive():
+        if self.process_manager.is_running():
             print("🛑 Остановка автоматизации...")
             self.process_manager.stop_automation()
         
@@ -132,6 +132,7 @@ class HotkeyManager:
         keyboard.add_hotkey('ctrl+6', self.settings_manager.configure_end_card)
         keyboard.add_hotkey('ctrl+7', self.settings_manager.change_generation_mode)
         keyboard.add_hotkey('ctrl+8', self.settings_manager.configure_image_wait_time)
+        keyboard.add_hotkey('ctrl+9', lambda: self.process_manager.start_calibration(self.settings_manager))
         keyboard.add_hotkey('ctrl+shift+v', self.process_manager.setup_window)
         keyboard.add_hotkey('ctrl+shift+s', lambda: self.process_manager.start_automation(self.settings_manager))
         keyboard.add_hotkey('ctrl+shift+q', self.process_manager.stop_automation)
@@ -2,7 +2,11 @@
 Вспомогательные утилиты
 """
 from .clipboard import ClipboardManager
+from .image_clipboard import FakeClipboardBackend, ImageClipboardBackend, create_image_clipboard_backend
+from .input_driver import InputDriver, PyAutoGUIInputDriver, RecordingInputDriver, get_input_driver, set_input_driver
 from .logger import Logger
 from .process_manager import ProcessManager
+from .screen_capture import ScreenCapture, get_screen_capture
 
-__all__ = ['ClipboardManager', 'Logger', 'ProcessManager']
\ No newline at end of file
+__all__ = ['ClipboardManager', 'FakeClipboardBackend', 'ImageClipboardBackend', 'create_image_clipboard_backend', 'InputDriver', 'PyAutoGUIInputDriver', 'RecordingInputDriver', 'get_input_driver', 'set_input_driver',
+           'Logger', 'ProcessManager', 'ScreenCapture', 'get_screen_capture']
\ No newline at end of file
@@ -2,15 +2,21 @@
 Управление буфером обмена
 """
 import pyperclip
-import pyautogui
 import time
 import os
 from config.coordinates import DELAYS
+from .image_clipboard import PowerShellHelperBackend, PowerShellOneShotBackend, create_image_clipboard_backend
+from .input_driver import get_input_driver
 from .logger import Logger
 
 class ClipboardManager:
-    def __init__(self):
+    def __init__(self, input_driver=None, image_backend_name='auto'):
         self.logger = Logger()
+        self.input_driver = input_driver or get_input_driver()
+        self.image_backend_name = image_backend_name  # CLIPBOARD_IMAGE_BACKEND
+        self.image_backend = None
+        self.image_copy_times = []  # Время копирования каждого изображения (сек)
+        self.image_cache = None  # Кэш референсов (core/reference_cache.py): готовые данные бэкенда без чтения файла
     
     def get_clipboard_content(self):
         """Получение содержимого буфера обмена"""
@@ -37,8 +43,14 @@ class ClipboardManager:
         except Exception as e:
             self.logger.log_action(f"✗ ОШИБКА при восстановлении буфера: {e}")
     
-    def safe_paste_text(self, text):
-        """Безопасная вставка текста через буфер обмена с сохранением предыдущего содержимого"""
+    def safe_paste_text(self, text, select_all=False):
+        """
+        Безопасная вставка текста через буфер обмена с сохранением предыдущего содержимого
+        
+        Args:
+            text: текст для вставки
+            select_all: выделить текущий текст поля перед вставкой (Ctrl+A и Ctrl+V одной последовательностью)
+        """
         try:
             original_clipboard = self.get_clipboard_content()
             
@@ -46,7 +58,11 @@ class ClipboardManager:
                 return False
                 
             self.logger.log_action(f"Подготовлен для вставки: {text}")
-            pyautogui.hotkey('ctrl', 'v')
+            if select_all:
+                self.input_driver.key_sequence([('ctrl', 'a'), ('ctrl', 'v')])
+            else:
+                self.input_driver.hotkey('ctrl', 'v')
+            # Приложение должно прочитать буфер до его восстановления
             time.sleep(DELAYS['BETWEEN_CLICKS'])
             
             self.restore_clipboard(original_clipboard)
@@ -56,9 +72,18 @@ class ClipboardManager:
             self.logger.log_action(f"✗ ОШИБКА при вставке текста: {e}")
             return False
     
+    def get_image_backend(self):
+        """Бэкенд копирования изображений (создаётся при первом копировании)"""
+        if self.image_backend is None:
+            self.image_backend = create_image_clipboard_backend(self.image_backend_name)
+        return self.image_backend
+    
     def copy_image_to_clipboard(self, image_path):
         """
-        Копирование файла изображения в буфер обмена Windows
+        Копирование файла изображения в буфер обмена
+        
+        Windows - через постоянный PowerShell-помощник (запасной вариант - отдельный запуск PowerShell),
+        Linux - через xclip / wl-copy (см. utils/image_clipboard.py).
         
         Args:
             image_path: путь к файлу изображения
@@ -71,40 +96,51 @@ class ClipboardManager:
                 self.logger.log_action(f"✗ Файл изображения не найден: {image_path}")
                 return False
             
-            # Используем PowerShell для копирования файла изображения в буфер обмена
-            import subprocess
+            image_backend = self.get_image_backend()
+            if image_backend is None:
+                self.logger.log_action("✗ Нет способа скопировать изображение в буфер обмена (установите xclip или wl-clipboard)")
+                return False
             
-            # PowerShell команда для копирования изображения в буфер обмена
-            # Абсолютный путь к файлу для надежности
-            abs_path = os.path.abspath(image_path).replace('\\', '\\\\')
+            start_time = time.perf_counter()
+            try:
+                payload = self.image_cache.get(image_path) if self.image_cache is not None else None
+                success, error = image_backend.copy_image(image_path, payload)
+            except Exception as e:
+                success, error = False, str(e)
             
-            ps_command = f'''
-            Add-Type -AssemblyName System.Windows.Forms
-            Add-Type -AssemblyName System.Drawing
-            $image = [System.Drawing.Image]::FromFile("{abs_path}")
-            $dataObject = New-Object System.Windows.Forms.DataObject
-            $dataObject.SetImage($image)
-            [System.Windows.Forms.Clipboard]::SetDataObject($dataObject, $true)
-            '''
+            if not success and isinstance(image_backend, PowerShellHelperBackend):
+                # Помощник не справился - одно изображение копируем прежним способом
+                self.logger.log_action(f"⚠️ Помощник буфера обмена: {error}, пробуем отдельный запуск PowerShell")
+                image_backend.close()
+                success, error = PowerShellOneShotBackend().copy_image(image_path)
             
-            # Запускаем PowerShell команду
-            result = subprocess.run(
-                ['powershell', '-Command', ps_command],
-                capture_output=True,
-                text=True
-            )
+            elapsed = time.perf_counter() - start_time
+            self.image_copy_times.append(elapsed)
             
-            if result.returncode == 0:
-                self.logger.log_action(f"✓ Изображение скопировано в буфер обмена: {image_path}")
+            if success:
+                self.logger.log_action(f"✓ Изображение скопировано в буфер обмена: {image_path} ({elapsed * 1000:.0f} мс)")
                 return True
             else:
-                self.logger.log_action(f"✗ ОШИБКА при копировании изображения через PowerShell: {result.stderr}")
+                self.logger.log_action(f"✗ ОШИБКА при копировании изображения ({image_backend.name}): {error}")
                 return False
                     
         except Exception as e:
             self.logger.log_action(f"✗ ОШИБКА при копировании изображения в буфер обмена: {e}")
             return False
     
+    def format_image_metrics(self):
+        """Время копирования изображений одной строкой для лога (None, если изображения не копировались)"""
+        if not self.image_copy_times:
+            return None
+        average_ms = sum(self.image_copy_times) / len(self.image_copy_times) * 1000
+        return (f"{len(self.image_copy_times)} изображений ({self.image_backend.name}), "
+                f"среднее {average_ms:.0f} мс, максимум {max(self.image_copy_times) * 1000:.0f} мс")
+    
+    def close(self):
+        """Остановка помощника буфера обмена (в конце работы)"""
+        if self.image_backend is not None:
+            self.image_backend.close()
+    
     def paste_image_from_clipboard(self):
         """
         Вставка изображения из буфера обмена через Ctrl+V
@@ -114,7 +150,7 @@ class ClipboardManager:
         """
         try:
             self.logger.log_action("Вставка изображения из буфера обмена (Ctrl+V)")
-            pyautogui.hotkey('ctrl', 'v')
+            self.input_driver.hotkey('ctrl', 'v')
             time.sleep(DELAYS['AFTER_PASTE'])  # Даём больше времени на вставку изображения
             return True
         except Exception as e:
@@ -0,0 +1,291 @@
+"""
+Копирование изображений в буфер обмена: постоянный процесс-помощник вместо запуска PowerShell на каждое изображение
+"""
+import base64
+import io
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from .logger import Logger
+
+# Таймаут ответа помощника на одно изображение (сек)
+HELPER_RESPONSE_TIMEOUT = 15.0
+
+# Скрипт PowerShell-помощника: сборки загружаются один раз, дальше - запрос на строку stdin, ответ на строку stdout.
+# Запрос - путь к файлу или "base64:" и PNG-байты (готовый запрос из кэша референсов, файл не читается)
+POWERSHELL_HELPER_SCRIPT = r'''
+[Console]::InputEncoding = [System.Text.Encoding]::UTF8
+[Console]::OutputEncoding = [System.Text.Encoding]::UTF8
+Add-Type -AssemblyName System.Windows.Forms
+Add-Type -AssemblyName System.Drawing
+[Console]::Out.WriteLine("READY")
+[Console]::Out.Flush()
+while (($request = [Console]::In.ReadLine()) -ne $null) {
+    try {
+        $stream = $null
+        if ($request.StartsWith("base64:")) {
+            $stream = New-Object System.IO.MemoryStream(,[Convert]::FromBase64String($request.Substring(7)))
+            $image = [System.Drawing.Image]::FromStream($stream)
+        } else {
+            $image = [System.Drawing.Image]::FromFile($request)
+        }
+        $dataObject = New-Object System.Windows.Forms.DataObject
+        $dataObject.SetImage($image)
+        [System.Windows.Forms.Clipboard]::SetDataObject($dataObject, $true)
+        $image.Dispose()
+        if ($stream -ne $null) { $stream.Dispose() }
+        [Console]::Out.WriteLine("OK")
+    } catch {
+        [Console]::Out.WriteLine("ERR " + $_.Exception.Message.Replace("`n", " "))
+    }
+    [Console]::Out.Flush()
+}
+'''
+
+# Прежний вариант: отдельный запуск PowerShell на каждое изображение
+POWERSHELL_ONE_SHOT_SCRIPT = '''
+Add-Type -AssemblyName System.Windows.Forms
+Add-Type -AssemblyName System.Drawing
+$image = [System.Drawing.Image]::FromFile("{path}")
+$dataObject = New-Object System.Windows.Forms.DataObject
+$dataObject.SetImage($image)
+[System.Windows.Forms.Clipboard]::SetDataObject($dataObject, $true)
+'''
+
+
+class ImageClipboardBackend:
+    """
+    Общая часть: copy_image(path, payload) -> (успех, ошибка), close() - освобождение ресурсов.
+
+    payload - изображение, уже подготовленное encode_payload этого бэкенда (кэш референсов хранит
+    ровно то, что уходит помощнику или утилите), None - читать файл.
+    """
+
+    name = 'base'
+
+    def encode_payload(self, image_path):
+        """Данные изображения в том виде, в каком бэкенд их передаёт (по умолчанию - PNG-байты)"""
+        return read_png_bytes(image_path)
+
+    def copy_image(self, image_path, payload=None):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class PowerShellHelperBackend(ImageClipboardBackend):
+    """
+    Windows: один процесс PowerShell (-STA) на весь запуск.
+
+    System.Windows.Forms и System.Drawing загружаются один раз при старте помощника,
+    на каждое изображение - только строка запроса и строка ответа.
+    Если помощник упал, он перезапускается при следующем запросе.
+    """
+
+    name = 'powershell_helper'
+
+    def __init__(self, response_timeout=HELPER_RESPONSE_TIMEOUT):
+        self.response_timeout = response_timeout
+        self.logger = Logger()
+        self.process = None
+        self.responses = None
+        self.start_count = 0
+
+    def start(self):
+        """Запуск помощника и ожидание готовности (загрузки сборок)"""
+        self.close()
+        self.process = subprocess.Popen(
+            ['powershell', '-NoProfile', '-NoLogo', '-STA', '-Command', POWERSHELL_HELPER_SCRIPT],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            encoding='utf-8', bufsize=1,
+            creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0),
+        )
+        self.responses = queue.Queue()
+        threading.Thread(target=self._read_responses, args=(self.process, self.responses), daemon=True).start()
+        self.start_count += 1
+
+        response = self._wait_response()
+        if response != 'READY':
+            self.close()
+            raise RuntimeError(f"помощник буфера обмена не запустился: {response}")
+        self.logger.log_action("📋 Помощник буфера обмена запущен")
+
+    def _read_responses(self, process, responses):
+        # Ответы читаются в отдельном потоке: основной поток ждёт их с таймаутом
+        for line in process.stdout:
+            responses.put(line.strip())
+        responses.put(None)
+
+    def _wait_response(self):
+        try:
+            return self.responses.get(timeout=self.response_timeout)
+        except queue.Empty:
+            return None
+
+    def encode_payload(self, image_path):
+        """Строка запроса помощнику: "base64:" и PNG-байты"""
+        return 'base64:' + base64.b64encode(read_png_bytes(image_path)).decode('ascii')
+
+    def copy_image(self, image_path, payload=None):
+        if self.process is None or self.process.poll() is not None:
+            self.start()
+
+        request = payload if payload is not None else os.path.abspath(image_path)
+        self.process.stdin.write(request + '\n')
+        self.process.stdin.flush()
+        response = self._wait_response()
+
+        if response == 'OK':
+            return True, ''
+        if response is None:
+            # Нет ответа - помощник завис или упал, следующий запрос запустит новый
+            self.close()
+            return False, "помощник не ответил"
+        return False, response[4:] if response.startswith('ERR ') else response
+
+    def close(self):
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=2)
+        except Exception:
+            self.process.kill()
+        self.process = None
+
+
+class PowerShellOneShotBackend(ImageClipboardBackend):
+    """Windows: прежний способ - отдельный PowerShell на каждое изображение (запасной вариант и замеры)"""
+
+    name = 'powershell'
+
+    def copy_image(self, image_path, payload=None):
+        abs_path = os.path.abspath(image_path).replace('\\', '\\\\')
+        result = subprocess.run(
+            ['powershell', '-Command', POWERSHELL_ONE_SHOT_SCRIPT.replace('{path}', abs_path)],
+            capture_output=True, text=True
+        )
+        return result.returncode == 0, result.stderr.strip()
+
+
+class CommandBackend(ImageClipboardBackend):
+    """
+    Linux: xclip (X11) или wl-copy (Wayland).
+
+    Утилита сама остаётся владельцем буфера в фоне, запуск занимает миллисекунды,
+    поэтому отдельный помощник не нужен. Изображение передаётся как PNG через stdin.
+
+    Ждём только завершения запущенного процесса: фоновый потомок, который держит буфер,
+    наследует stderr, поэтому stderr пишется во временный файл, а не в канал -
+    чтение канала ждало бы конца фонового процесса.
+    """
+
+    def __init__(self, name, command):
+        self.name = name
+        self.command = command
+
+    def copy_image(self, image_path, payload=None):
+        png_bytes = payload if payload is not None else read_png_bytes(image_path)
+        with tempfile.TemporaryFile() as error_file:
+            process = subprocess.Popen(self.command, stdin=subprocess.PIPE,
+                                       stdout=subprocess.DEVNULL, stderr=error_file)
+            try:
+                process.stdin.write(png_bytes)
+                process.stdin.close()
+                returncode = process.wait(timeout=HELPER_RESPONSE_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                return False, f"{self.name} не завершился за {HELPER_RESPONSE_TIMEOUT:.0f} сек"
+            except OSError as e:
+                process.kill()
+                process.wait()
+                return False, f"{self.name}: {e}"
+            error_file.seek(0)
+            return returncode == 0, error_file.read().decode('utf-8', 'replace').strip()
+
+
+class FakeClipboardBackend(ImageClipboardBackend):
+    """
+    Для тестов и замеров: ничего не копирует, записывает пути.
+
+    start_delay - имитация запуска процесса (на первом запросе или на каждом при one_shot),
+    request_delay - имитация обработки одного изображения.
+    """
+
+    name = 'fake'
+
+    def __init__(self, start_delay=0.0, request_delay=0.0, one_shot=False):
+        self.start_delay = start_delay
+        self.request_delay = request_delay
+        self.one_shot = one_shot
+        self.started = False
+        self.start_count = 0
+        self.copied_paths = []
+        self.copied_from_memory = 0  # Сколько изображений пришло готовыми данными (из кэша)
+        self.last_payload = None
+
+    def copy_image(self, image_path, payload=None):
+        if self.one_shot or not self.started:
+            time.sleep(self.start_delay)
+            self.started = True
+            self.start_count += 1
+        time.sleep(self.request_delay)
+        self.copied_paths.append(image_path)
+        self.last_payload = payload
+        if payload is not None:
+            self.copied_from_memory += 1
+        return True, ''
+
+    def close(self):
+        self.started = False
+
+
+def read_png_bytes(image_path):
+    """Содержимое изображения в PNG (файлы других форматов конвертируются в памяти)"""
+    if image_path.lower().endswith('.png'):
+        with open(image_path, 'rb') as image_file:
+            return image_file.read()
+
+    from PIL import Image
+    buffer = io.BytesIO()
+    with Image.open(image_path) as image:
+        image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def create_image_clipboard_backend(backend_name='auto'):
+    """
+    Бэкенд копирования изображений по настройке CLIPBOARD_IMAGE_BACKEND.
+
+    'auto': Windows - powershell_helper; Linux - wl-copy под Wayland, иначе xclip.
+
+    Returns:
+        ImageClipboardBackend или None, если подходящего бэкенда нет
+    """
+    if backend_name == 'auto':
+        if sys.platform.startswith('win'):
+            backend_name = 'powershell_helper'
+        elif os.environ.get('WAYLAND_DISPLAY') and shutil.which('wl-copy'):
+            backend_name = 'wl-copy'
+        elif shutil.which('xclip'):
+            backend_name = 'xclip'
+        else:
+            return None
+
+    if backend_name == 'powershell_helper':
+        return PowerShellHelperBackend()
+    if backend_name == 'powershell':
+        return PowerShellOneShotBackend()
+    if backend_name == 'xclip':
+        return CommandBackend('xclip', ['xclip', '-selection', 'clipboard', '-t', 'image/png', '-i'])
+    if backend_name == 'wl-copy':
+        return CommandBackend('wl-copy', ['wl-copy', '--type', 'image/png'])
+    if backend_name == 'fake':
+        return FakeClipboardBackend()
+    raise ValueError(f"Неизвестный бэкенд буфера обмена: {backend_name}")
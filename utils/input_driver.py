@@ -0,0 +1,184 @@
+"""
+Ввод мыши и клавиатуры с явной задержкой на каждое действие (без скрытой паузы pyautogui.PAUSE)
+"""
+import time
+import pyautogui
+
+# Задержка после действия по умолчанию (сек): время, которое интерфейсу нужно, чтобы принять ввод.
+# Ожидание реакции интерфейса - не здесь, а в UIWaiter по визуальному подтверждению.
+ACTION_LATENCY = {
+    'click': 0.05,
+    'right_click': 0.05,
+    'move': 0.02,
+    'hotkey': 0.05,
+    'press': 0.03,
+    'write': 0.03,
+    'key_sequence': 0.05,
+}
+
+# Пауза между клавишами внутри одной последовательности (сек)
+SEQUENCE_KEY_INTERVAL = 0.02
+
+
+class InputDriver:
+    """
+    Общая часть драйверов ввода: явная задержка после действия и метрики.
+
+    Наследник реализует _click, _right_click, _move, _hotkey, _press, _write.
+    """
+
+    def __init__(self, action_latency=None):
+        self.action_latency = dict(ACTION_LATENCY)
+        if action_latency:
+            self.action_latency.update(action_latency)
+
+        # Метрики: action -> количество, время самого ввода, время явных задержек
+        self.action_counts = {}
+        self.input_time = 0.0
+        self.latency_time = 0.0
+
+    def click(self, x=None, y=None):
+        """Клик ЛКМ (без координат - в текущей позиции курсора)"""
+        self._perform('click', self._click, x, y)
+
+    def right_click(self, x, y):
+        """Клик ПКМ"""
+        self._perform('right_click', self._right_click, x, y)
+
+    def move(self, x_offset, y_offset):
+        """Относительное движение курсора"""
+        self._perform('move', self._move, x_offset, y_offset)
+
+    def hotkey(self, *keys):
+        """Сочетание клавиш, например hotkey('ctrl', 'v')"""
+        self._perform('hotkey', self._hotkey, *keys)
+
+    def press(self, key):
+        """Нажатие одной клавиши"""
+        self._perform('press', self._press, key)
+
+    def write(self, text):
+        """Ввод текста с клавиатуры"""
+        self._perform('write', self._write, text)
+
+    def key_sequence(self, steps):
+        """
+        Последовательность клавиш одним действием: между шагами только SEQUENCE_KEY_INTERVAL,
+        задержка action_latency - один раз в конце.
+
+        Args:
+            steps: список шагов; кортеж - сочетание клавиш, строка - одна клавиша
+                   Например: [('ctrl', 'a'), ('ctrl', 'v'), 'enter']
+        """
+        self._perform('key_sequence', self._key_sequence, steps)
+
+    def _key_sequence(self, steps):
+        for index, step in enumerate(steps):
+            if index:
+                time.sleep(SEQUENCE_KEY_INTERVAL)
+            if isinstance(step, (tuple, list)):
+                self._hotkey(*step)
+            else:
+                self._press(step)
+
+    def _perform(self, action, function, *args):
+        start_time = time.perf_counter()
+        function(*args)
+        self.input_time += time.perf_counter() - start_time
+        self.action_counts[action] = self.action_counts.get(action, 0) + 1
+
+        latency = self.action_latency.get(action, 0.0)
+        if latency > 0:
+            time.sleep(latency)
+            self.latency_time += latency
+
+    def get_metrics(self):
+        """Метрики ввода"""
+        return {
+            'action_count': sum(self.action_counts.values()),
+            'action_counts': dict(self.action_counts),
+            'input_ms': self.input_time * 1000,
+            'latency_ms': self.latency_time * 1000,
+        }
+
+    def format_metrics(self):
+        """Метрики ввода одной строкой для лога"""
+        metrics = self.get_metrics()
+        return (f"{metrics['action_count']} действий, ввод {metrics['input_ms']:.0f} мс, "
+                f"явные задержки {metrics['latency_ms']:.0f} мс")
+
+
+class PyAutoGUIInputDriver(InputDriver):
+    """
+    Ввод через pyautogui без глобальной паузы pyautogui.PAUSE.
+
+    pyautogui по умолчанию спит PAUSE (0.1 сек) после каждого вызова - задержки задаём сами.
+    Пауза отключается в каждом вызове (_pause=False), а не через глобальный pyautogui.PAUSE:
+    драйвер создаётся в основном процессе и попадает в рабочий через pickle, где __init__
+    не выполняется, а глобальная настройка другим частям программы не нужна.
+    """
+
+    def _click(self, x, y):
+        if x is None or y is None:
+            pyautogui.click(_pause=False)
+        else:
+            pyautogui.click(x, y, _pause=False)
+
+    def _right_click(self, x, y):
+        pyautogui.rightClick(x, y, _pause=False)
+
+    def _move(self, x_offset, y_offset):
+        pyautogui.move(x_offset, y_offset, _pause=False)
+
+    def _hotkey(self, *keys):
+        pyautogui.hotkey(*keys, interval=0.0, _pause=False)
+
+    def _press(self, key):
+        pyautogui.press(key, _pause=False)
+
+    def _write(self, text):
+        pyautogui.write(text, _pause=False)
+
+
+class RecordingInputDriver(InputDriver):
+    """Драйвер для тестов: записывает действия, ничего не нажимает и не ждёт"""
+
+    def __init__(self):
+        super().__init__({action: 0.0 for action in ACTION_LATENCY})
+        self.actions = []  # Список (action, args)
+
+    def _click(self, x, y):
+        self.actions.append(('click', (x, y)))
+
+    def _right_click(self, x, y):
+        self.actions.append(('right_click', (x, y)))
+
+    def _move(self, x_offset, y_offset):
+        self.actions.append(('move', (x_offset, y_offset)))
+
+    def _hotkey(self, *keys):
+        self.actions.append(('hotkey', keys))
+
+    def _press(self, key):
+        self.actions.append(('press', (key,)))
+
+    def _write(self, text):
+        self.actions.append(('write', (text,)))
+
+
+# Общий драйвер ввода для процесса
+_input_driver = None
+
+
+def get_input_driver():
+    """Получение общего драйвера ввода процесса"""
+    global _input_driver
+    if _input_driver is None:
+        _input_driver = PyAutoGUIInputDriver()
+    return _input_driver
+
+
+def set_input_driver(input_driver):
+    """Замена общего драйвера ввода (например, RecordingInputDriver в тестах)"""
+    global _input_driver
+    _input_driver = input_driver
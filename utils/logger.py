@@ -2,16 +2,20 @@
 Система логирования
 """
 import datetime
+import os
 
 class Logger:
     def __init__(self, enabled=True):
         self.enabled = enabled
+        # В параллельном режиме у каждой линии свой процесс - помечаем её строки
+        lane_name = os.environ.get('AUTOMATION_LANE')
+        self.prefix = f"[Линия {lane_name}] " if lane_name else ""
     
     def log_action(self, action):
         """Логирование действий с временной меткой"""
         if self.enabled:
             timestamp = datetime.datetime.now().strftime("%H:%M:%S")
-            print(f"[{timestamp}] {action}")
+            print(f"[{timestamp}] {self.prefix}{action}")
     
     def enable_logging(self):
         """Включение логирования"""
@@ -2,6 +2,9 @@
 Управление процессами автоматизации
 """
 import multiprocessing
+import os
+import shutil
+import threading
 from multiprocessing import Process, Event
 from config.coordinates import COORDINATES, RELATIVE_MOVEMENTS, DELAYS
 from utils.window_manager import WindowManager
@@ -10,18 +13,33 @@ class ProcessManager:
     def __init__(self):
         self.automation_process = None
         self.stop_event = None
+        self.lane_processes = []  # Процессы параллельных линий (по одному на X-дисплей)
         self.window_manager = WindowManager()
     
+    def is_running(self):
+        """Запущена ли автоматизация (один процесс или параллельные линии)"""
+        if self.automation_process and self.automation_process.is_alive():
+            return True
+        return any(process.is_alive() for process in self.lane_processes)
+    
     def start_automation(self, settings_manager):
         """Запуск процесса автоматизации"""
-        if self.automation_process and self.automation_process.is_alive():
+        if self.is_running():
             print("[ГЛАВНЫЙ] Автоматизация уже запущена!")
             return
         
+        # Параллельные линии на виртуальных дисплеях (окна браузеров на дисплеях линий настраиваются заранее)
+        worker_displays = settings_manager.get('WORKER_DISPLAYS') or []
+        use_lanes = (len(worker_displays) >= 2 and
+                     settings_manager.get('GENERATION_MODE') in ['multi_format', 'multi_format_with_refs'])
+        if len(worker_displays) >= 2 and not use_lanes:
+            print("[ГЛАВНЫЙ] ⚠️ Параллельные линии поддерживаются только в мультиформатных режимах, запускаем один процесс")
+        
         # Настройка рабочего окна
-        print("[ГЛАВНЫЙ] Настройка рабочего окна...")
-        if not self.window_manager.setup_automation_window():
-            print("[ГЛАВНЫЙ] ⚠️ Не удалось настроить рабочее окно, но продолжаем...")
+        if not use_lanes:
+            print("[ГЛАВНЫЙ] Настройка рабочего окна...")
+            if not self.window_manager.setup_automation_window():
+                print("[ГЛАВНЫЙ] ⚠️ Не удалось настроить рабочее окно, но продолжаем...")
         
         # Получение настроек
         generation_mode = settings_manager.get('GENERATION_MODE')
@@ -72,17 +90,21 @@ class ProcessManager:
             # Проверка файла промптов
             from core.file_handler import FileHandler
             file_handler = FileHandler(settings_manager)
-            pairs_data = file_handler.load_prompts()
+            # Только счёт: с кэшем разбора тексты промптов здесь не загружаются
+            total_cards, total_pairs = file_handler.count_prompts()
 
-            if not pairs_data:
+            if not total_pairs:
                 print("[ГЛАВНЫЙ] ОШИБКА: Нет валидных пар промптов в файле!")
                 return
 
             # Показать статистику
-            total_pairs = sum(len(pairs) for pairs in pairs_data.values())
-            print(f"[ГЛАВНЫЙ] Найдено пар промптов: {total_pairs}")
+            print(f"[ГЛАВНЫЙ] Найдено пар промптов: {total_pairs} ({total_cards} карточек)")
             print(f"[ГЛАВНЫЙ] Будет создано изображений: {total_pairs * 2}")
         
+        if use_lanes:
+            self.start_lanes(settings_manager, worker_displays)
+            return
+        
         # Запуск процесса
         print("[ГЛАВНЫЙ] Запуск автоматизации...")
         self.stop_event = Event()
@@ -111,8 +133,148 @@ class ProcessManager:
         self.automation_process.start()
         print(f"[ГЛАВНЫЙ] Автоматизация запущена в процессе PID: {self.automation_process.pid}")
     
+    def start_calibration(self, settings_manager):
+        """Запуск калибровки задержек DELAYS в отдельном процессе"""
+        if self.is_running():
+            print("[ГЛАВНЫЙ] Автоматизация уже запущена! Калибровка возможна только между запусками")
+            return
+        
+        generation_mode = settings_manager.get('GENERATION_MODE')
+        critical_coords = ['NEW_CHAT_BUTTON', 'CHAT_NAME_INPUT']
+        if generation_mode in ['multi_format', 'multi_format_with_refs']:
+            critical_coords.append('FORMAT_SELECTOR')
+        
+        empty_critical = [name for name in critical_coords if COORDINATES[name] == (0, 0)]
+        if empty_critical:
+            print(f"[ГЛАВНЫЙ] ОШИБКА: Не заданы координаты для калибровки: {', '.join(empty_critical)}")
+            print("   Используйте Ctrl+0 для настройки координат")
+            return
+        
+        print("[ГЛАВНЫЙ] Настройка рабочего окна...")
+        if not self.window_manager.setup_automation_window():
+            print("[ГЛАВНЫЙ] ⚠️ Не удалось настроить рабочее окно, но продолжаем...")
+        
+        if generation_mode in ['multi_format', 'multi_format_with_refs']:
+            from core.multi_format_generator import MultiFormatGenerator
+            generator = MultiFormatGenerator(settings_manager)
+        else:
+            from core.image_generator import ImageGenerator
+            generator = ImageGenerator(settings_manager)
+        
+        print("[ГЛАВНЫЙ] Запуск калибровки задержек...")
+        print("   Для замера сохранения оставьте на экране сгенерированное изображение")
+        self.stop_event = Event()
+        self.automation_process = Process(
+            target=generator.delay_calibrator.calibration_worker,
+            args=(self.stop_event,)
+        )
+        self.automation_process.start()
+        print(f"[ГЛАВНЫЙ] Калибровка запущена в процессе PID: {self.automation_process.pid}")
+    
+    def start_lanes(self, settings_manager, worker_displays):
+        """
+        Запуск параллельных линий: по процессу на каждый X-дисплей из WORKER_DISPLAYS.
+        
+        Карточки делятся между линиями, прогресс линий сводится в главном процессе.
+        """
+        from core.file_handler import FileHandler
+        from core.lanes import LaneProgress, lane_coordinates_file, lane_worker, split_cards_across_lanes
+        
+        cards_to_process_list = FileHandler(settings_manager).get_cards_to_process()
+        if not cards_to_process_list:
+            print("[ГЛАВНЫЙ] ОШИБКА: Нет карточек для обработки!")
+            return
+        
+        if settings_manager.get('JOB_QUEUE_ENABLED'):
+            # Линии делят файл очереди - незавершённые задачи прошлого запуска возвращаем до старта линий
+            from core.job_queue import JobQueue
+            JobQueue(settings_manager.get('JOB_QUEUE_FILE') or 'data/jobs.sqlite').recover_running()
+        
+        # spawn: процесс линии заново импортирует pyautogui и подключается к своему DISPLAY
+        context = multiprocessing.get_context('spawn')
+        self.stop_event = context.Event()
+        progress_queue = context.Queue()
+        self.lane_processes = []
+        lane_names = []
+        
+        lane_cards = split_cards_across_lanes(cards_to_process_list, len(worker_displays))
+        for lane_index, (display, cards_for_lane) in enumerate(zip(worker_displays, lane_cards)):
+            if not cards_for_lane:
+                continue
+            
+            lane_name = str(lane_index + 1)
+            coordinates_file = lane_coordinates_file(lane_index)
+            if not os.path.exists(coordinates_file) and os.path.exists('data/coordinates.json'):
+                # Одинаковые виртуальные экраны - стартуем с общих координат
+                shutil.copyfile('data/coordinates.json', coordinates_file)
+                print(f"[ГЛАВНЫЙ] Координаты линии {lane_name} скопированы в {coordinates_file}")
+            
+            lane_environment = {
+                'DISPLAY': display,
+                'AUTOMATION_DISPLAY': display,
+                'AUTOMATION_COORDINATES_FILE': coordinates_file,
+                'AUTOMATION_LANE': lane_name,
+            }
+            saved_environment = {key: os.environ.get(key) for key in lane_environment}
+            os.environ.update(lane_environment)
+            try:
+                process = context.Process(
+                    target=lane_worker,
+                    args=(lane_name, settings_manager, cards_for_lane, self.stop_event, progress_queue)
+                )
+                process.start()
+            finally:
+                for key, value in saved_environment.items():
+                    if value is None:
+                        os.environ.pop(key, None)
+                    else:
+                        os.environ[key] = value
+            
+            self.lane_processes.append(process)
+            lane_names.append(lane_name)
+            lane_pairs = sum(len(pairs_list) for _, _, pairs_list in cards_for_lane)
+            print(f"[ГЛАВНЫЙ] Линия {lane_name} (DISPLAY={display}): {len(cards_for_lane)} карточек, "
+                  f"{lane_pairs} пар, PID: {process.pid}")
+        
+        total_images = sum(len(pairs_list) * 2 for _, _, pairs_list in cards_to_process_list)
+        progress = LaneProgress(lane_names, total_images)
+        threading.Thread(target=self._watch_lane_progress, args=(progress_queue, progress), daemon=True).start()
+    
+    def _watch_lane_progress(self, progress_queue, progress):
+        """Сводный вывод прогресса линий (фоновый поток главного процесса)"""
+        while not progress.is_finished():
+            try:
+                event = progress_queue.get(timeout=1.0)
+            except Exception:
+                if not any(process.is_alive() for process in self.lane_processes):
+                    break
+                continue
+            print(f"[ГЛАВНЫЙ] {progress.apply(event)}")
+        
+        print(f"[ГЛАВНЫЙ] Параллельные линии: создано изображений {progress.get_images_created()}/{progress.total_images}")
+    
+    def stop_lanes(self):
+        """Остановка параллельных линий"""
+        print("[ГЛАВНЫЙ] Остановка параллельных линий...")
+        if self.stop_event:
+            self.stop_event.set()
+        
+        for process in self.lane_processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        
+        print("[ГЛАВНЫЙ] Параллельные линии остановлены")
+        self.lane_processes = []
+        self.stop_event = None
+    
     def stop_automation(self):
         """Остановка процесса автоматизации"""
+        if any(process.is_alive() for process in self.lane_processes):
+            self.stop_lanes()
+            return
+        
         if not self.automation_process or not self.automation_process.is_alive():
             print("[ГЛАВНЫЙ] Автоматизация не запущена!")
             return
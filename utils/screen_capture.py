@@ -0,0 +1,156 @@
+"""
+Захват областей экрана: один снимок на такт опроса, общий для всех проверок
+"""
+import os
+import time
+import numpy as np
+import pyautogui
+from .logger import Logger
+
+try:
+    import mss
+except ImportError:
+    mss = None
+
+# Общий прямоугольник снимается, только если он не больше стольких площадей самих областей
+MAX_BOX_AREA_RATIO = 4.0
+
+
+class ScreenCapture:
+    """
+    Снимает только ограничивающий прямоугольник нужных областей, один раз за такт.
+
+    Использование:
+        capture.new_tick()                      # начало такта опроса
+        frame = capture.get_region(region)      # view на кадр такта (без копирования)
+
+    Области задаются как (left, top, width, height), как в pyautogui.
+    Области прошлого такта запоминаются, и следующий такт сразу снимает их общий прямоугольник
+    вместе с уже запрошенными в этом такте. Если прямоугольник намного больше самих областей
+    (MAX_BOX_AREA_RATIO) - снимается только запрошенная область.
+    """
+
+    def __init__(self, display=None):
+        self.logger = Logger()
+        self.display = display  # Например ':99' для виртуального X-дисплея (Xvfb)
+        self.tick_regions = set()  # Области, запрошенные в текущем такте
+        self.previous_tick_regions = set()  # Области прошлого такта - прогноз для текущего
+        self._mss_instance = None
+        self._use_mss = mss is not None
+
+        # Кадр текущего такта
+        self._frame = None
+        self._frame_box = None  # (left, top, right, bottom)
+
+        # Метрики захвата
+        self.capture_count = 0
+        self.total_capture_time = 0.0
+        self.last_capture_time = 0.0
+        self.max_capture_time = 0.0
+
+    def new_tick(self):
+        """Начало нового такта опроса: следующий запрос снимет экран заново"""
+        if self.tick_regions:
+            self.previous_tick_regions = self.tick_regions
+            self.tick_regions = set()
+        self._frame = None
+        self._frame_box = None
+
+    def get_region(self, region):
+        """
+        Кадр области (массив HxWx3, RGB) из снимка текущего такта.
+
+        Возвращается view на общий снимок, поэтому изменять массив нельзя.
+        """
+        left, top, width, height = (int(value) for value in region)
+        self.tick_regions.add((left, top, width, height))
+
+        if self._frame is None or not self._box_contains(self._frame_box, left, top, width, height):
+            self._grab_bounding_box((left, top, width, height))
+
+        frame_left, frame_top = self._frame_box[0], self._frame_box[1]
+        return self._frame[top - frame_top:top - frame_top + height, left - frame_left:left - frame_left + width]
+
+    def grab(self, region):
+        """Отдельный снимок области вне такта (например, для калибровки) - кадр такта не меняется"""
+        left, top, width, height = (int(value) for value in region)
+        start_time = time.perf_counter()
+        frame = self._grab_rgb(left, top, width, height)
+        self._record_latency(time.perf_counter() - start_time)
+        return frame
+
+    def _box_contains(self, box, left, top, width, height):
+        return (box[0] <= left and box[1] <= top and
+                left + width <= box[2] and top + height <= box[3])
+
+    def _grab_bounding_box(self, requested_region):
+        """Снимок общего прямоугольника областей текущего и прошлого такта (или только requested_region)"""
+        regions = self.tick_regions | self.previous_tick_regions
+        box_left = min(region[0] for region in regions)
+        box_top = min(region[1] for region in regions)
+        box_right = max(region[0] + region[2] for region in regions)
+        box_bottom = max(region[1] + region[3] for region in regions)
+
+        regions_area = sum(region[2] * region[3] for region in regions)
+        if (box_right - box_left) * (box_bottom - box_top) > MAX_BOX_AREA_RATIO * regions_area:
+            # Области далеко друг от друга - снимаем каждую отдельно
+            box_left, box_top, width, height = requested_region
+            box_right, box_bottom = box_left + width, box_top + height
+
+        start_time = time.perf_counter()
+        self._frame = self._grab_rgb(box_left, box_top, box_right - box_left, box_bottom - box_top)
+        self._frame_box = (box_left, box_top, box_right, box_bottom)
+        self._record_latency(time.perf_counter() - start_time)
+
+    def _grab_rgb(self, left, top, width, height):
+        """Снимок прямоугольника в массив RGB"""
+        if self._use_mss:
+            try:
+                if self._mss_instance is None:
+                    if self.display:
+                        self._mss_instance = mss.mss(display=self.display)
+                    else:
+                        self._mss_instance = mss.mss()
+                shot = self._mss_instance.grab({'left': left, 'top': top, 'width': width, 'height': height})
+                # BGRA -> RGB без копирования (view с обратным шагом по каналам)
+                return np.frombuffer(shot.bgra, dtype=np.uint8).reshape(shot.height, shot.width, 4)[..., 2::-1]
+            except Exception as e:
+                self.logger.log_action(f"⚠️ mss недоступен ({e}), переключаемся на pyautogui.screenshot")
+                self._use_mss = False
+
+        return np.asarray(pyautogui.screenshot(region=(left, top, width, height)).convert('RGB'))
+
+    def _record_latency(self, capture_time):
+        self.capture_count += 1
+        self.total_capture_time += capture_time
+        self.last_capture_time = capture_time
+        self.max_capture_time = max(self.max_capture_time, capture_time)
+
+    def get_metrics(self):
+        """Метрики задержки захвата (в миллисекундах)"""
+        average_time = self.total_capture_time / self.capture_count if self.capture_count else 0.0
+        return {
+            'capture_count': self.capture_count,
+            'average_ms': average_time * 1000,
+            'last_ms': self.last_capture_time * 1000,
+            'max_ms': self.max_capture_time * 1000,
+            'backend': 'mss' if self._use_mss else 'pyautogui',
+        }
+
+    def format_metrics(self):
+        """Метрики захвата одной строкой для лога"""
+        metrics = self.get_metrics()
+        return (f"{metrics['capture_count']} снимков ({metrics['backend']}), "
+                f"среднее {metrics['average_ms']:.1f} мс, максимум {metrics['max_ms']:.1f} мс")
+
+
+# Общий захват экрана для процесса (дисплей берём из AUTOMATION_DISPLAY, если задан)
+_screen_capture = None
+
+
+def get_screen_capture():
+    """Получение общего захвата экрана процесса"""
+    global _screen_capture
+    if _screen_capture is None:
+        _screen_capture = ScreenCapture(display=os.environ.get('AUTOMATION_DISPLAY'))
+    return _screen_capture
@@ -0,0 +1,219 @@
+"""
+Ожидание готовности интерфейса: ждём визуального подтверждения, а не фиксированную паузу
+"""
+import time
+import numpy as np
+import pyautogui
+from config.coordinates import COORDINATES, DELAYS, get_coordinates_manager
+from .logger import Logger
+from .screen_capture import get_screen_capture
+
+# Средняя разница (0-255), выше которой область считается изменившейся
+REGION_CHANGE_THRESHOLD = 4.0
+
+# Смещение области проверки выпадающего списка от поля (пиксели): список открывается под полем
+DROPDOWN_OFFSET = 80
+
+
+def region_around(x, y, half_size):
+    """Область (left, top, width, height) вокруг точки"""
+    return (max(0, int(x) - half_size), max(0, int(y) - half_size), half_size * 2, half_size * 2)
+
+
+class RegionChangedProbe:
+    """Область изменилась относительно снимка, сделанного при создании проверки (до действия)"""
+
+    def __init__(self, screen_capture, region, threshold=REGION_CHANGE_THRESHOLD):
+        self.screen_capture = screen_capture
+        self.region = region
+        self.threshold = threshold
+        self.reference = screen_capture.grab(region).astype(np.int16)
+
+    def check(self):
+        frame = self.screen_capture.get_region(self.region).astype(np.int16)
+        return float(np.abs(frame - self.reference).mean()) > self.threshold
+
+
+class TemplateVisibleProbe:
+    """В области виден шаблон (массив HxWx3), средняя разница не больше max_difference"""
+
+    def __init__(self, screen_capture, region, template, max_difference=10.0):
+        self.screen_capture = screen_capture
+        self.region = region
+        self.template = np.asarray(template)[..., :3].astype(np.int16)
+        self.max_difference = max_difference
+
+    def check(self):
+        frame = self.screen_capture.get_region(self.region).astype(np.int16)
+        template_height, template_width = self.template.shape[:2]
+        if frame.shape[0] < template_height or frame.shape[1] < template_width:
+            return False
+
+        windows = np.lib.stride_tricks.sliding_window_view(frame, (template_height, template_width, 3))
+        differences = np.abs(windows[..., 0, :, :, :] - self.template).mean(axis=(-3, -2, -1))
+        return float(differences.min()) <= self.max_difference
+
+
+class PixelMatchesProbe:
+    """Пиксель (x, y) совпадает с цветом rgb с допуском tolerance"""
+
+    def __init__(self, screen_capture, x, y, rgb, tolerance=10):
+        self.screen_capture = screen_capture
+        self.region = (int(x), int(y), 1, 1)
+        self.rgb = np.array(rgb, dtype=np.int16)
+        self.tolerance = tolerance
+
+    def check(self):
+        pixel = self.screen_capture.get_region(self.region)[0, 0].astype(np.int16)
+        return bool((np.abs(pixel - self.rgb) <= self.tolerance).all())
+
+
+class UIWaiter:
+    """
+    Ожидание шагов интерфейса по проверкам (probe) с опросом и таймаутом.
+
+    Таймаут шага - значение DELAYS[step_name], то есть прежняя фиксированная пауза
+    стала верхней границей: если подтверждение не появилось, ждём столько же, сколько раньше.
+
+    Область проверки - там, где появляется ожидаемый элемент (меню, список, диалог), а не вокруг
+    точки клика: подсветка при наведении и фокусе меняет её сразу, до реакции интерфейса.
+    Шаги, у которых виден только фокус, ждут паузу без проверки.
+    """
+
+    def __init__(self, screen_capture=None):
+        self.logger = Logger()
+        self.screen_capture = screen_capture or get_screen_capture()
+        self.poll_interval = 0.05  # Интервал опроса (сек)
+        self.settle_time = 0.15  # Пауза после подтверждения, чтобы интерфейс успел дорисоваться (сек)
+        self.probe_half_size = 40  # Половина стороны области вокруг координаты (пиксели)
+        self.timeout_scale = 1.0  # Множитель таймаута (при калибровке ждём дольше текущих DELAYS)
+        self.last_elapsed = 0.0
+        self.elapsed_by_step = {}  # step_name -> список замеров (сек)
+        self.timeouts_by_step = {}  # step_name -> количество таймаутов
+
+    def probe_coordinate(self, coord_name, offset=(0, 0)):
+        """
+        Проверка "область вокруг координаты изменилась".
+
+        Снимок делается сразу, поэтому вызывать нужно ДО действия. Координата (со смещением offset) -
+        место ожидаемого элемента, а не точка клика (см. DROPDOWN_OFFSET, TO_SAVE_OPTION).
+        Returns None, если координата не задана или экран снять не удалось.
+        """
+        x, y = COORDINATES.get(coord_name, (0, 0))
+        if x == 0 and y == 0:
+            return None
+        return self.probe_region(region_around(x + offset[0], y + offset[1], self.probe_half_size))
+
+    def probe_screen_center(self):
+        """Проверка "изменилась середина экрана" (диалоги сохранения и т.п.)"""
+        try:
+            screen_width, screen_height = pyautogui.size()
+        except Exception:
+            return None
+        return self.probe_region(region_around(screen_width // 2, screen_height // 2, self.probe_half_size * 2))
+
+    def probe_region(self, region):
+        """Проверка "область изменилась" (None, если экран снять не удалось)"""
+        try:
+            return RegionChangedProbe(self.screen_capture, region)
+        except Exception as e:
+            self.logger.log_action(f"⚠️ Не удалось снять область {region}: {e}")
+            return None
+
+    def wait_until(self, probe, step_name, description="", timeout=None, stop_event=None):
+        """
+        Ожидание выполнения проверки.
+
+        Args:
+            probe: объект с методом check() или None (тогда просто пауза)
+            step_name: ключ DELAYS (для таймаута и отчёта)
+            description: описание шага для лога
+            timeout: таймаут (по умолчанию DELAYS[step_name])
+            stop_event: событие остановки (опционально)
+
+        Returns:
+            bool: True если подтверждение получено, False при таймауте/остановке
+        """
+        if timeout is None:
+            timeout = DELAYS[step_name] * self.timeout_scale
+
+        if probe is None:
+            self.pause(timeout, stop_event)
+            return False
+
+        start_time = time.perf_counter()
+        while True:
+            self.last_elapsed = time.perf_counter() - start_time
+
+            try:
+                self.screen_capture.new_tick()
+                if probe.check():
+                    time.sleep(self.settle_time)
+                    self.last_elapsed = time.perf_counter() - start_time
+                    self._record(step_name, self.last_elapsed)
+                    if description:
+                        self.logger.log_action(f"⚡ {description}: готово за {self.last_elapsed:.2f} сек (лимит {timeout})")
+                    return True
+            except Exception as e:
+                self.logger.log_action(f"⚠️ Ошибка проверки шага {step_name}: {e}")
+                self.pause(max(0.0, timeout - self.last_elapsed), stop_event)
+                return False
+
+            if self.last_elapsed >= timeout:
+                self.timeouts_by_step[step_name] = self.timeouts_by_step.get(step_name, 0) + 1
+                self._record(step_name, self.last_elapsed)
+                return False
+
+            if stop_event is not None and stop_event.is_set():
+                return False
+
+            time.sleep(self.poll_interval)
+
+    def wait_step(self, probe, step_name, description="", stop_event=None):
+        """
+        Ожидание шага с действием при таймауте: если подтверждения нет, дожидаемся прежней
+        фиксированной паузы (DELAYS по умолчанию) - калибровка могла сократить таймаут шага,
+        а область проверки - не увидеть изменения.
+
+        Returns:
+            bool: True если подтверждение получено
+        """
+        if self.wait_until(probe, step_name, description, stop_event=stop_event):
+            return True
+        if probe is None or (stop_event is not None and stop_event.is_set()):
+            return False
+
+        default_delay = get_coordinates_manager().default_delays.get(step_name, DELAYS[step_name])
+        self.logger.log_action(f"⚠️ {description or step_name}: нет подтверждения за {self.last_elapsed:.2f} сек, "
+                               f"ждём прежнюю паузу {default_delay} сек")
+        self.pause(max(0.0, default_delay - self.last_elapsed), stop_event)
+        return False
+
+    def pause(self, seconds, stop_event=None):
+        """
+        Пауза без проверки (темп между генерациями/карточками).
+
+        Returns:
+            bool: False если пауза прервана сигналом остановки
+        """
+        end_time = time.perf_counter() + seconds
+        while True:
+            remaining = end_time - time.perf_counter()
+            if remaining <= 0:
+                return True
+            if stop_event is not None and stop_event.is_set():
+                return False
+            time.sleep(min(remaining, 0.2))
+
+    def _record(self, step_name, elapsed):
+        self.elapsed_by_step.setdefault(step_name, []).append(elapsed)
+
+    def format_report(self):
+        """Отчёт по шагам: среднее время ожидания против прежней фиксированной паузы"""
+        lines = []
+        for step_name, samples in sorted(self.elapsed_by_step.items()):
+            average_time = sum(samples) / len(samples)
+            timeouts = self.timeouts_by_step.get(step_name, 0)
+            lines.append(f"{step_name}: в среднем {average_time:.2f} сек вместо {DELAYS[step_name]} "
+                         f"({len(samples)} раз, таймаутов {timeouts})")
+        return lines